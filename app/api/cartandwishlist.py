@@ -7,14 +7,18 @@ from fastapi.security import OAuth2PasswordRequestForm  # OAuth2 form for login
 from datetime import datetime, timedelta, timezone  # Handling date and time operations
 from email_validator import validate_email, EmailNotValidError  # Validating email addresses
 from sqlalchemy.future import select
+from uuid import UUID
 
 # Importing CRUD operations, templates, database utilities, authentication methods, and utility functions
 import crud.users as crud
+from crud.cartandwishlist import add_item_to_cart_in_db, checkout_cart_in_db, get_cart_from_db
 from db.database import get_db
-from core.auth import create_access_token, get_current_user, get_password_hash, verify_token
+from core.auth import create_access_token, get_current_principal, get_password_hash, verify_token, UserPrincipal
 from utlis.utils import generate_reset_token, send_email
-from app.db.models.users import User  # User model
-from schemas.users import UserResponse, Token, TokenResponse, UserUpdate # Pydantic models for user response and token
+from db.models.orders import Order, OrderItem, OrderStatus
+from db.models.products import Product
+from db.models.wishlist import Wishlist
+from schemas.orders import OrderResponse
 
 # Defining an API router for managing user routes
 from fastapi import APIRouter
@@ -22,21 +26,10 @@ router = APIRouter()
 
 
 ## get users active cart
-@router.get("/cart", response_model=Order)
-async def get_cart(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
-    cart = await db.execute(
-        select(Order).filter(
-            Order.user_id == current_user.user_id,
-            Order.status == OrderStatus.CART
-        )
-    )
-    cart = cart.scalars().first()
-    if not cart:
-        cart = Order(user_id=current_user.user_id, status=OrderStatus.CART)
-        db.add(cart)
-        await db.commit()
-        await db.refresh(cart)
-    return cart
+@router.get("/cart", response_model=OrderResponse)
+async def get_cart(db: AsyncSession = Depends(get_db), current_user: UserPrincipal = Depends(get_current_principal)):
+    # Fetch the cart with its items in two queries, creating an empty cart if needed
+    return await get_cart_from_db(db, current_user.user_id, create=True)
 
 # Add or update an item in the user's cart.
 @router.post("/cart/items")
@@ -44,49 +37,15 @@ async def add_item_to_cart(
     product_id: UUID,
     quantity: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_principal)
 ):
-    # Fetch active cart or create one
-    cart = await db.execute(
-        select(Order).filter(
-            Order.user_id == current_user.user_id,
-            Order.status == OrderStatus.CART
-        )
-    )
-    cart = cart.scalars().first()
-    if not cart:
-        cart = Order(user_id=current_user.user_id, status=OrderStatus.CART)
-        db.add(cart)
-        await db.commit()
-        await db.refresh(cart)
-
-    # Check if item already exists
-    order_item = await db.execute(
-        select(OrderItem).filter(
-            OrderItem.order_id == cart.order_id,
-            OrderItem.product_id == product_id
-        )
-    )
-    order_item = order_item.scalars().first()
-
-    if order_item:
-        # Update quantity if item exists
-        order_item.quantity += quantity
-    else:
-        # Add new item
-        product = await db.execute(select(Product).filter(Product.product_id == product_id))
-        product = product.scalars().first()
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
-        order_item = OrderItem(order_id=cart.order_id, product_id=product_id, quantity=quantity, price=product.price)
-        db.add(order_item)
-
-    # Recalculate total amount
-    cart.total_amount = sum(item.quantity * item.price for item in cart.order_items)
-    await db.commit()
-    await db.refresh(cart)
+    if quantity < 1:
+        raise HTTPException(status_code=400, detail="Quantity must be at least 1")
 
-    return cart
+    # Upsert the cart and the cart line, and update the total, in one transaction (404 if the product is missing)
+    cart = await add_item_to_cart_in_db(db, current_user.user_id, product_id, quantity)
+
+    return {"message": "Item added to cart", **cart}
 
 
 # Convert the cart into a finalized order
@@ -94,32 +53,19 @@ async def add_item_to_cart(
 async def checkout(
     shipping_address: str,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_principal)
 ):
-    # Fetch active cart
-    cart = await db.execute(
-        select(Order).filter(
-            Order.user_id == current_user.user_id,
-            Order.status == OrderStatus.CART
-        )
-    )
-    cart = cart.scalars().first()
-    if not cart or not cart.order_items:
-        raise HTTPException(status_code=400, detail="Cart is empty")
+    # Place the order and reserve stock for every line atomically (409 if anything is out of stock)
+    order = await checkout_cart_in_db(db, current_user.user_id, shipping_address)
 
-    # Update cart to a finalized order
-    cart.status = OrderStatus.PENDING
-    cart.shipping_address = shipping_address
-    await db.commit()
-
-    return {"message": "Order placed successfully", "order_id": cart.order_id}
+    return {"message": "Order placed successfully", **order}
 
 # Add Product to Wishlist
 @router.post("/wishlist/add")
 async def add_to_wishlist(
     product_id: UUID,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_principal)
 ):
     # Get the user's wishlist
     wishlist = await db.execute(
@@ -159,7 +105,7 @@ async def add_to_wishlist(
 async def remove_from_wishlist(
     product_id: UUID,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_principal)
 ):
     # Get the user's wishlist
     wishlist = await db.execute(
@@ -193,7 +139,7 @@ async def move_to_cart(
     product_id: UUID,
     quantity: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_principal)
 ):
     # Get the user's wishlist
     wishlist = await db.execute(
@@ -213,40 +159,12 @@ async def move_to_cart(
     if not product or product not in wishlist.products:
         raise HTTPException(status_code=404, detail="Product not found in wishlist")
 
-    # Get or create the user's active cart
-    cart = await db.execute(
-        select(Order).filter(
-            Order.user_id == current_user.user_id,
-            Order.status == OrderStatus.CART
-        )
-    )
-    cart = cart.scalars().first()
-
-    if not cart:
-        cart = Order(user_id=current_user.user_id, status=OrderStatus.CART)
-        db.add(cart)
-        await db.commit()
-        await db.refresh(cart)
-
-    # Add product to cart
-    order_item = await db.execute(
-        select(OrderItem).filter(
-            OrderItem.order_id == cart.order_id,
-            OrderItem.product_id == product_id
-        )
-    )
-    order_item = order_item.scalars().first()
-
-    if order_item:
-        order_item.quantity += quantity
-    else:
-        order_item = OrderItem(order_id=cart.order_id, product_id=product_id, quantity=quantity, price=product.price)
-        db.add(order_item)
+    # Add product to the cart (cart, line and total are upserted in SQL), committed together with the wishlist change
+    cart = await add_item_to_cart_in_db(db, current_user.user_id, product_id, quantity, commit=False)
 
     # Remove product from wishlist
     wishlist.products.remove(product)
     await db.commit()
-    await db.refresh(cart)
 
-    return {"message": "Product moved to cart", "cart_id": cart.order_id}
+    return {"message": "Product moved to cart", "cart_id": cart["cart_id"]}
 
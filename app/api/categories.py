@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from schemas.products import ProductListingPage
+from db.database import get_read_db
+from crud.listings import get_storefront_page
+from crud.products import get_products_collection_version
+from db.models.listings import ListingScope
+from utlis.etag import etag_matches, make_etag, not_modified, set_validators
+from utlis.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from typing import Optional
+from uuid import UUID
+
+router = APIRouter(
+    prefix="/categories",
+    tags=["Categories"],
+)
+
+
+@router.get("/{category_id}/products", response_model=ProductListingPage)
+async def get_category_products(
+    category_id: UUID,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Retrieve the products of a category one page at a time.
+
+    - **category_id**: UUID of the category; products listed under it as primary or additional category.
+    - **limit**: Number of products per page (bounded by `MAX_PAGE_SIZE`).
+    - **cursor**: Opaque cursor from the previous page's `next_cursor`; omit it for the first page.
+    - **db**: Read-only database session (served by a replica when configured).
+    - Served from the precomputed `product_listings` table.
+    - Pages carry an ETag derived from the products collection version; a matching
+      `If-None-Match` gets a 304 before the page is queried.
+    - Returns a page of listings using the ProductListingPage schema.
+    """
+    etag = make_etag("category-products", category_id, await get_products_collection_version(db), request.url.query)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+    return await get_storefront_page(db, ListingScope.CATEGORY, category_id, limit, cursor)
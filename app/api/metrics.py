@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends
+from core.auth import is_admin, hashing_stats
+from core.cache import cache_stats
+from crud.products import product_search_index, product_suggest_index
+from db.database import async_engine, replica_engines, pool_stats
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"],
+    dependencies=[Depends(is_admin)],
+)
+
+
+@router.get("/cache")
+async def get_cache_metrics():
+    """
+    Report the size and hit/miss/eviction counters of the caches.
+
+    - **Depends(is_admin)**: Ensures only admin users can access this endpoint.
+    - Returns a dict with one entry per cache namespace.
+    """
+    return cache_stats()
+
+
+@router.get("/hashing")
+async def get_hashing_metrics():
+    """
+    Report the state and latency of the password hashing pool.
+
+    - **Depends(is_admin)**: Ensures only admin users can access this endpoint.
+    - Returns pool size, queue depth, rejected calls and latency percentiles.
+    """
+    return hashing_stats()
+
+
+@router.get("/search")
+async def get_search_metrics():
+    """
+    Report the size of this worker's in-memory product search indexes.
+
+    - **Depends(is_admin)**: Ensures only admin users can access this endpoint.
+    - Returns the suggest index entry counts and approximate memory use, and the
+      number of products in the full-text fallback index (0 on PostgreSQL).
+    """
+    return {
+        "suggest": product_suggest_index.stats(),
+        "fulltext_fallback_documents": len(product_search_index),
+    }
+
+
+@router.get("/db")
+async def get_db_metrics():
+    """
+    Report live connection pool metrics.
+
+    - **Depends(is_admin)**: Ensures only admin users can access this endpoint.
+    - Returns checked-out and overflow connections, checkout wait time and pool timeouts.
+    """
+    return {
+        "primary": pool_stats(async_engine),
+        "replicas": [pool_stats(engine) for engine in replica_engines],
+    }
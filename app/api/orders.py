@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status as http_status
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.database import get_db
-from schemas.orders import OrderCreate, OrderResponse
-from crud.orders import create_order, get_all_orders, get_order_by_id, update_order, delete_order
+from schemas.orders import OrderCreate, OrderResponse, OrderBatchCreate, OrderBatchResponse
+from crud.orders import create_order, create_orders_batch, get_all_orders, get_order_by_id, update_order, delete_order, confirm_order
 from typing import List
+from uuid import UUID
+import os
 
 router = APIRouter()
 
+# Maximum number of orders accepted by one POST /orders/batch request
+MAX_ORDER_BATCH_SIZE = int(os.getenv("MAX_ORDER_BATCH_SIZE", 1000))
+
 ## Endpoint to create a new order
 @router.post("/orders", response_model=OrderResponse, tags=["Order"])
 async def create_new_order(order_data: OrderCreate, db: AsyncSession = Depends(get_db)):
@@ -15,6 +20,19 @@ async def create_new_order(order_data: OrderCreate, db: AsyncSession = Depends(g
     # Calls the create_order function to save the order to the database and return the created order
     return await create_order(db, order_data)
 
+## Endpoint to create many orders in one transaction (B2B ingest)
+@router.post("/orders/batch", response_model=OrderBatchResponse, tags=["Order"])
+async def create_orders_in_batch(batch: OrderBatchCreate, db: AsyncSession = Depends(get_db)):
+    # Accepts up to MAX_ORDER_BATCH_SIZE orders in the form of an OrderBatchCreate schema
+    # All orders and items are inserted with two multi-row INSERTs and a single commit
+    # Returns the IDs of the created orders in the order they were submitted
+    if not batch.orders or len(batch.orders) > MAX_ORDER_BATCH_SIZE:
+        raise HTTPException(
+            status_code=http_status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch must contain between 1 and {MAX_ORDER_BATCH_SIZE} orders"
+        )
+    return {"order_ids": await create_orders_batch(db, batch.orders)}
+
 ## Endpoint to list all orders
 @router.get("/orders", response_model=List[OrderResponse], tags=["Order"])
 async def list_all_orders(status: str = None, db: AsyncSession = Depends(get_db)):
@@ -40,6 +58,13 @@ async def modify_order(order_id: str, status: str = None, cancellation_reason: s
     # Calls the update_order function to update the specified order and return the updated order details
     return await update_order(db, order_id, status, cancellation_reason)
 
+## Endpoint to confirm a placed order (e.g. after payment)
+@router.post("/orders/{order_id}/confirm", response_model=OrderResponse, tags=["Order"])
+async def confirm_placed_order(order_id: UUID, db: AsyncSession = Depends(get_db)):
+    # Moves the order from PENDING to CONFIRMED and commits its reserved stock
+    # Returns 409 if the order is not pending or its stock reservation already expired
+    return await confirm_order(db, order_id)
+
 ## Endpoint to delete an order
 @router.delete("/orders/{order_id}", tags=["Order"])
 async def remove_order(order_id: str, db: AsyncSession = Depends(get_db)):
@@ -1,16 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from schemas.products import ProductCreate, ProductUpdate, ProductResponse
-from core.auth import get_db, get_current_user, is_admin, is_vendor
+from schemas.products import ProductCreate, ProductUpdate, ProductResponse, ProductPage, ProductSuggestion, ProductFilters
+from core.auth import get_db, get_current_principal, is_admin, is_vendor
+from db.database import get_read_db
 from crud.products import (
     create_product_in_db,
     get_all_products_from_db,
+    search_products_in_db,
+    suggest_products,
+    stream_products_from_db,
     get_product_by_id_from_db,
+    get_product_version,
+    get_products_collection_version,
     update_product_in_db,
     delete_product_from_db,
 )
-from typing import List
+from crud.inventory import MAX_STOCK_STRIPES, get_available_stock, set_stock_stripes
+from crud.listings import backfill_product_listings
+from utlis.etag import etag_matches, make_etag, not_modified, set_validators, time_epoch
+from utlis.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from utlis.streaming import ndjson_response, wants_ndjson
+from typing import List, Optional
 from uuid import UUID
+import os
+
+# Product responses carry stock, which checkouts change without bumping any version;
+# their ETags are weak and expire every STOCK_ETAG_SECONDS, so stock is at most that stale
+STOCK_ETAG_SECONDS = int(os.getenv("STOCK_ETAG_SECONDS", 30))
 
 router = APIRouter(
     prefix="/products",
@@ -21,7 +37,7 @@ router = APIRouter(
 async def create_product(
     product: ProductCreate,
     db: AsyncSession = Depends(get_db),
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_principal),
 ):
     """
     Create a new product.
@@ -33,30 +49,158 @@ async def create_product(
     - The `current_user.vendor_id` is used to associate the product with the vendor.
     - Returns the created product using the ProductResponse schema.
     """
+    if current_user.vendor_id is None:
+        raise HTTPException(status_code=403, detail="No vendor is registered with this account's email")
     return await create_product_in_db(db, product, current_user.vendor_id)
 
 # get all products
-@router.get("/", response_model=List[ProductResponse])
-async def get_all_products(db: AsyncSession = Depends(get_db)):
+@router.get("/", response_model=ProductPage)
+async def get_all_products(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    filters: ProductFilters = Depends(),
+    facets: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+):
     """
-    Retrieve all products.
+    Retrieve products one page at a time, or export the whole catalog as a stream.
 
-    - **db**: Database session dependency for database interaction.
-    - Returns a list of products using the ProductResponse schema.
+    - **limit**: Number of products per page (bounded by `MAX_PAGE_SIZE`).
+    - **cursor**: Opaque cursor from the previous page's `next_cursor`; omit it for the first page.
+    - **filters**: `category_id`, `vendor_id`, `min_price`, `max_price` and `in_stock`, combinable.
+    - **facets**: Set `?facets=1` to get product counts per category, vendor and price bucket
+      for the filtered products with the first page.
+    - **stream**: Set `?stream=1` (or send `Accept: application/x-ndjson`) to stream every
+      product as newline-delimited JSON instead of returning a page.
+    - **db**: Read-only database session (served by a replica when configured).
+    - Pages carry a weak ETag derived from the products collection version, the query string
+      and a `STOCK_ETAG_SECONDS` time window (stock moves do not bump the version); a matching
+      `If-None-Match` gets a 304 before the page is queried.
+    - Returns a page of products using the ProductPage schema.
+    """
+    if wants_ndjson(request, stream):
+        return ndjson_response(request, stream_products_from_db, ProductResponse)
+    if filters.min_price is not None and filters.max_price is not None and filters.min_price > filters.max_price:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_price cannot exceed max_price")
+
+    etag = make_etag(
+        "products", await get_products_collection_version(db), time_epoch(STOCK_ETAG_SECONDS), request.url.query,
+        weak=True,
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag, max_age=STOCK_ETAG_SECONDS)
+    set_validators(response, etag, max_age=STOCK_ETAG_SECONDS)
+    return await get_all_products_from_db(db, limit, cursor, filters, facets)
+
+# search products (declared before /{product_id} so "search" is not parsed as an ID)
+@router.get("/search", response_model=ProductPage)
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Search products by name and description.
+
+    - **q**: Search text; every word must match, and partial words match as prefixes.
+    - **limit**: Number of products per page (bounded by `MAX_PAGE_SIZE`).
+    - **cursor**: Opaque cursor from the previous page's `next_cursor`; omit it for the first page.
+    - **db**: Read-only database session (served by a replica when configured).
+    - Returns a page of the best matches first, using the ProductPage schema.
+    """
+    return await search_products_in_db(db, q, limit, cursor)
+
+# autocomplete product names (also declared before /{product_id})
+@router.get("/suggest", response_model=List[ProductSuggestion])
+async def suggest_product_names(
+    prefix: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+):
     """
-    return await get_all_products_from_db(db)
+    Suggest product names for search-as-you-type.
+
+    - **prefix**: What the user typed so far; matches the start of any word, tolerating small typos
+      after the first two characters.
+    - **limit**: Maximum number of suggestions.
+    - Served from an in-memory index, without touching the database.
+    - Returns a list of product IDs and names, closest matches first.
+    """
+    return suggest_products(prefix, limit)
 
 # get product
 @router.get("/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_product(product_id: UUID, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve a product by its ID.
 
     - **product_id**: UUID of the product to retrieve.
-    - **db**: Database session dependency for database interaction.
+    - **db**: Read-only database session (served by a replica when configured).
+    - Sends a weak ETag derived from the product's ID, last change and a `STOCK_ETAG_SECONDS`
+      time window (checkouts change the stock of striped products without touching the row),
+      and Last-Modified. A request with a matching `If-None-Match` gets a 304, checked before
+      the full row is loaded.
     - Returns the product details using the ProductResponse schema.
     """
-    return await get_product_by_id_from_db(db, product_id)
+    epoch = time_epoch(STOCK_ETAG_SECONDS)
+    if request.headers.get("if-none-match"):
+        version = await get_product_version(db, product_id)
+        etag = make_etag("product", product_id, version, epoch, weak=True)
+        if etag_matches(request, etag):
+            return not_modified(etag, version, STOCK_ETAG_SECONDS)
+
+    product = await get_product_by_id_from_db(db, product_id)
+    version = product["updated_at"] or product["created_at"]
+    etag = make_etag("product", product_id, version, epoch, weak=True)
+    set_validators(response, etag, version, STOCK_ETAG_SECONDS)
+    return product
+
+# get sellable stock
+@router.get("/{product_id}/stock")
+async def get_product_stock(product_id: UUID, db: AsyncSession = Depends(get_db)):
+    """
+    Retrieve the units of a product currently on sale.
+
+    - **product_id**: UUID of the product.
+    - **db**: Database session; reads the primary, since stock changes with every checkout.
+    - Sums the stock counters of striped products.
+    - Returns the product ID and its available stock.
+    """
+    return {"product_id": product_id, "available": await get_available_stock(db, product_id)}
+
+# list products created before the storefront listings existed
+@router.post("/listings/backfill", dependencies=[Depends(is_admin)])
+async def backfill_listings(db: AsyncSession = Depends(get_db)):
+    """
+    Copy every live product into its vendor and category storefronts, keeping existing listings.
+
+    - **Depends(is_admin)**: Ensures only admins can access this endpoint.
+    - Run once after deploying the storefront listings; running it again adds nothing.
+    - Returns the number of listings added.
+    """
+    return {"added": await backfill_product_listings(db)}
+
+# turn striped inventory on or off
+@router.put("/{product_id}/stock-stripes", dependencies=[Depends(is_admin)])
+async def update_stock_stripes(
+    product_id: UUID,
+    stripes: int = Query(..., ge=0, le=MAX_STOCK_STRIPES),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Split a hot product's stock over several counter rows, so concurrent checkouts
+    don't all queue on the same row lock.
+
+    - **product_id**: UUID of the product.
+    - **stripes**: Number of stock counters; 0 folds the stock back into the product row.
+    - **Depends(is_admin)**: Ensures only admins can access this endpoint.
+    - Returns the product ID, the stripe count and the available stock.
+    """
+    available = await set_stock_stripes(db, product_id, stripes)
+    return {"product_id": product_id, "stripes": stripes, "available": available}
 
 # update product
 @router.put("/{product_id}", response_model=ProductResponse)
@@ -64,7 +208,7 @@ async def update_product(
     product_id: UUID,
     product_update: ProductUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_principal),
 ):
     """
     Update an existing product.
@@ -83,7 +227,7 @@ async def update_product(
 async def delete_product(
     product_id: UUID,
     db: AsyncSession = Depends(get_db),
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_principal),
 ):
     """
     Delete a product.
@@ -5,14 +5,16 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from starlette.requests import Request  # Handling HTTP requests
 from fastapi.security import OAuth2PasswordRequestForm  # OAuth2 form for login
 from datetime import datetime, timedelta, timezone  # Handling date and time operations
+from uuid import uuid4  # Refresh token IDs ("jti")
 from email_validator import validate_email, EmailNotValidError  # Validating email addresses
 from sqlalchemy.future import select
 
 # Importing CRUD operations, templates, database utilities, authentication methods, and utility functions
 import crud.users as crud
 from db.database import get_db
-from core.auth import create_access_token, get_current_user, get_password_hash, verify_token
-from utlis.utils import generate_reset_token, send_email
+from core.auth import create_access_token, get_current_principal, get_password_hash, verify_token, UserPrincipal
+from crud.outbox import enqueue_email
+from utlis.streaming import ndjson_response, wants_ndjson
 from db.models.users import User  # User model
 from schemas.users import UserResponse, Token, TokenResponse, UserUpdate # Pydantic models for user response and token
 
@@ -46,10 +48,8 @@ async def create_user(
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create a new user in the database using the CRUD function
+    # (The welcome email is queued in the same transaction and sent in the background)
     new_user = await crud.create_user_in_db(db, username, email, password)
-    
-    # Send a welcome email after successful signup
-    # await send_email("Welcome", username, email)
     return new_user    
 
 
@@ -58,7 +58,7 @@ async def update_user(
     user_id: int,
     user_update: UserUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ):
     """
     Update user information.
@@ -67,7 +67,7 @@ async def update_user(
         user_id (int): The ID of the user to be updated.
         user_update (UserUpdate): The updated user data sent in the request body.
         db (AsyncSession): Database session dependency for querying and updating the user.
-        current_user (User): The currently authenticated user, determined from the JWT token.
+        current_user (UserPrincipal): The currently authenticated principal, determined from the JWT token.
 
     Returns:
         UserResponse: The updated user object.
@@ -95,15 +95,19 @@ async def update_user(
 
 @router.get("/users", response_model=list[UserResponse], tags=["Admin"])
 async def list_users(
+    request: Request,
+    stream: bool = False,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ):
     """
     Retrieve a list of all users.
 
     Args:
+        request (Request): The incoming request, used to detect `Accept: application/x-ndjson`.
+        stream (bool): When true (`?stream=1`), stream users as newline-delimited JSON.
         db (AsyncSession): Database session dependency for querying users.
-        current_user (User): The currently authenticated user, determined from the JWT token.
+        current_user (UserPrincipal): The currently authenticated principal, determined from the JWT token.
 
     Returns:
         list[UserResponse]: A list of all users in the database.
@@ -119,6 +123,10 @@ async def list_users(
             detail="Not authorized to access this resource"
         )
 
+    # Stream users row by row when the export mode is requested.
+    if wants_ndjson(request, stream):
+        return ndjson_response(request, crud.stream_all_users, UserResponse)
+
     # Fetch all users from the database using a CRUD function.
     users = await crud.get_all_users(db)
 
@@ -130,7 +138,7 @@ async def list_users(
 async def delete_user(
     user_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ):
     """
     Delete a user by their ID.
@@ -138,7 +146,7 @@ async def delete_user(
     Args:
         user_id (int): The ID of the user to be deleted.
         db (AsyncSession): Database session dependency for querying and deleting users.
-        current_user (User): The currently authenticated user, determined from the JWT token.
+        current_user (UserPrincipal): The currently authenticated principal, determined from the JWT token.
 
     Returns:
         None: Indicates successful deletion with a 204 No Content status.
@@ -201,13 +209,16 @@ async def login_for_access_and_refresh_token(
     )
 
     # Generate the refresh token with a longer expiration time
+    refresh_jti = uuid4().hex  # Unique ID of the refresh token
     refresh_token = await create_access_token(
-        data={"sub": str(user.user_id), "email": user.email, "role": str(user.role)},
+        data={"sub": str(user.user_id), "email": user.email, "role": str(user.role), "jti": refresh_jti},
         expires_in_minutes=REFRESH_TOKEN_EXPIRE_MINUTES
     )
 
     # Save the refresh token in the database
-    saved_token = await crud.save_refresh_token(db, refresh_token, user.user_id, REFRESH_TOKEN_EXPIRE_MINUTES)
+    saved_token = await crud.save_refresh_token(
+        db, refresh_token, user.user_id, REFRESH_TOKEN_EXPIRE_MINUTES, refresh_jti
+    )
 
     # Return the tokens to the user
     return {
@@ -221,16 +232,19 @@ async def refresh_access_token(refresh_token: str, db: AsyncSession = Depends(ge
     """
     Endpoint to refresh an access token using a valid refresh token.
 
+    Refresh tokens are rotated: every call returns a new refresh token and revokes the one
+    presented, and presenting a revoked token again revokes all of the user's refresh tokens.
+
     Args:
         refresh_token (str): The refresh token provided by the client.
         db (AsyncSession): Asynchronous database session for querying token data.
 
     Returns:
-        dict: A dictionary containing a new access token, the existing refresh token, and the token type.
+        dict: A dictionary containing a new access token, a new refresh token, and the token type.
 
     Raises:
         HTTPException:
-            - 401 Unauthorized: If the refresh token is invalid or expired.
+            - 401 Unauthorized: If the refresh token is invalid, expired, or was already used.
     """
     # Step 1: Verify the refresh token
     payload = verify_token(refresh_token)  # Decodes and validates the refresh token
@@ -248,15 +262,17 @@ async def refresh_access_token(refresh_token: str, db: AsyncSession = Depends(ge
     user_email = payload.get("email")  # The user's email address
     user_role = payload.get("role")  # The user's role (e.g., admin, user)
 
-    # Step 3: Check the refresh token against the database
-    token_entry = await crud.get_token_for_user(db, refresh_token, user_id)
-
-    # Verify if the token exists in the database and if it hasn't expired
-    if not token_entry or token_entry.expires_at < datetime.now(timezone.utc):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Refresh token expired"
-        )
+    # Step 3: Rotate the refresh token: revoke the presented one and store its replacement
+    # (raises 401 if it is revoked, reused, expired or unknown)
+    new_refresh_jti = uuid4().hex
+    new_refresh_token = await create_access_token(
+        data={"sub": str(user_id), "email": user_email, "role": user_role, "jti": new_refresh_jti},
+        expires_in_minutes=REFRESH_TOKEN_EXPIRE_MINUTES
+    )
+    await crud.rotate_refresh_token(
+        db, refresh_token, user_id,
+        new_refresh_token, new_refresh_jti, REFRESH_TOKEN_EXPIRE_MINUTES,
+    )
 
     # Step 4: Generate a new access token
     access_token = await create_access_token(
@@ -264,10 +280,10 @@ async def refresh_access_token(refresh_token: str, db: AsyncSession = Depends(ge
         expires_in_minutes=ACCESS_TOKEN_EXPIRE_MINUTES
     )
 
-    # Step 5: Return the new access token and existing refresh token
+    # Step 5: Return the new access token and the new refresh token
     return {
         "access_token": access_token,  # New access token for authentication
-        "refresh_token": refresh_token,  # Existing refresh token (still valid)
+        "refresh_token": new_refresh_token,  # Replaces the one presented, which is now revoked
         "token_type": "bearer"  # Token type as per OAuth2 standards
     }
 
@@ -312,18 +328,13 @@ async def request_password_reset(
             detail="Email not found. Please check the email address you entered."
         )
 
-    # Step 3: Generate a reset token and set expiration
-    token = generate_reset_token()  # Generate a unique token for the reset
-    expiration_time = datetime.now(timezone("Asia/Kolkata")) + timedelta(minutes=30)  # Set token expiration time
-
-    # Step 4: Save the reset token and expiration time in the database
-    db_user.reset_token = token
-    db_user.reset_token_expiration = expiration_time
-    db.commit()  # Commit the changes to the database
+    # Steps 3-4: Generate a reset token and save its digest, with its expiration time, in the database
+    token = await crud.create_password_reset_token(db, db_user.user_id)
 
-    # Step 5: Send a password reset email with the reset link
+    # Step 5: Queue a password reset email with the reset link, stored by the same commit
     reset_link = f"http://localhost:8000/reset-password?token={token}"  # Construct the reset link
-    await send_email("Password_reset", db_user.username, db_user.email, reset_link)  # Asynchronous email sending
+    enqueue_email(db, "Password_reset", db_user.email, username=db_user.username, link=reset_link)
+    await db.commit()  # Commit the changes to the database; the email is sent in the background
 
     # Step 6: Return a success response to the user
     return {
@@ -345,20 +356,19 @@ async def reset_password(
     if new_password != confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
 
-    # Find the user by the reset token
-    db_user = await crud.get_user_by_token(db, token)
+    # Use up the reset token and find its user; a concurrent reset with the same token waits
+    # here and then finds it gone
+    db_user = await crud.consume_password_reset_token(db, token)
     if not db_user:
         raise HTTPException(status_code=400, detail="Invalid or expired token")
     
     # Hash the new password and update the user's data
-    db_user.hashed_password = get_password_hash(new_password)
-    db_user.reset_token = None  # Invalidate the token
-    db_user.reset_token_expiration = None
-    db.commit()
+    db_user.hashed_password = await get_password_hash(new_password)
 
-    # Send a confirmation email after the password is successfully reset
+    # Queue a confirmation email, committed together with the new password
     login_link = f"http://localhost:8000/users/login"
-    await send_email("Password_Changed", db_user.username, db_user.email, link=login_link)
+    enqueue_email(db, "Password_Changed", db_user.email, username=db_user.username, link=login_link)
+    await db.commit()
     
     # Return a JSON response confirming the password reset
     return {"message": "Password has been successfully reset. You can now log in with your new password."}
@@ -1,15 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from schemas.vendors import VendorCreate, VendorUpdate, VendorResponse
+from schemas.products import ProductListingPage
 from core.auth import get_db, is_admin
+from db.database import get_read_db
 from crud.vendors import (
     create_vendor_in_db,
     get_all_vendors_from_db,
+    stream_vendors_from_db,
     get_vendor_by_id_from_db,
+    get_vendor_version,
+    get_vendors_collection_version,
     update_vendor_in_db,
     delete_vendor_from_db,
 )
-from typing import List
+from crud.products import get_products_collection_version
+from crud.listings import get_storefront_page
+from db.models.listings import ListingScope
+from utlis.etag import etag_matches, make_etag, not_modified, set_validators
+from utlis.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from utlis.streaming import ndjson_response, wants_ndjson
+from typing import List, Optional
 from uuid import UUID
 
 router = APIRouter(
@@ -30,26 +41,76 @@ async def create_vendor(vendor: VendorCreate, db: AsyncSession = Depends(get_db)
 
 
 @router.get("/", response_model=List[VendorResponse])
-async def get_all_vendors(db: AsyncSession = Depends(get_db)):
+async def get_all_vendors(request: Request, response: Response, stream: bool = False, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve all vendors.
 
-    - **db**: Database session dependency for database interaction.
+    - **stream**: Set `?stream=1` (or send `Accept: application/x-ndjson`) to stream the
+      vendors as newline-delimited JSON.
+    - **db**: Read-only database session (served by a replica when configured).
+    - Sends an ETag derived from the vendors collection version; a matching `If-None-Match`
+      gets a 304 before the vendors are queried.
     - Returns a list of vendors using the VendorResponse schema.
     """
+    if wants_ndjson(request, stream):
+        return ndjson_response(request, stream_vendors_from_db, VendorResponse)
+
+    etag = make_etag("vendors", await get_vendors_collection_version(db))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
     return await get_all_vendors_from_db(db)
 
 
 @router.get("/{vendor_id}", response_model=VendorResponse)
-async def get_vendor(vendor_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_vendor(vendor_id: UUID, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve a vendor by its ID.
 
     - **vendor_id**: UUID of the vendor to retrieve.
-    - **db**: Database session dependency for database interaction.
+    - **db**: Read-only database session (served by a replica when configured).
+    - Sends an ETag and Last-Modified derived from the vendor's ID and last change. A request
+      with a matching `If-None-Match` gets a 304, checked before the full row is loaded.
     - Returns the vendor details using the VendorResponse schema.
     """
-    return await get_vendor_by_id_from_db(db, vendor_id)
+    if request.headers.get("if-none-match"):
+        version = await get_vendor_version(db, vendor_id)
+        etag = make_etag("vendor", vendor_id, version)
+        if etag_matches(request, etag):
+            return not_modified(etag, version)
+
+    vendor = await get_vendor_by_id_from_db(db, vendor_id)
+    version = vendor.updated_at or vendor.created_at
+    set_validators(response, make_etag("vendor", vendor_id, version), version)
+    return vendor
+
+
+@router.get("/{vendor_id}/products", response_model=ProductListingPage)
+async def get_vendor_products(
+    vendor_id: UUID,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Retrieve a vendor's storefront one page at a time.
+
+    - **vendor_id**: UUID of the vendor.
+    - **limit**: Number of products per page (bounded by `MAX_PAGE_SIZE`).
+    - **cursor**: Opaque cursor from the previous page's `next_cursor`; omit it for the first page.
+    - **db**: Read-only database session (served by a replica when configured).
+    - Served from the precomputed `product_listings` table.
+    - Pages carry an ETag derived from the vendor's product collection version; a matching
+      `If-None-Match` gets a 304 before the page is queried.
+    - Returns a page of listings using the ProductListingPage schema.
+    """
+    etag = make_etag("vendor-products", vendor_id, await get_products_collection_version(db, vendor_id), request.url.query)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+    return await get_storefront_page(db, ListingScope.VENDOR, vendor_id, limit, cursor)
 
 
 @router.put("/{vendor_id}", response_model=VendorResponse, dependencies=[Depends(is_admin)])
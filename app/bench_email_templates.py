@@ -0,0 +1,60 @@
+# Measures email rendering throughput: parsing the template on every send (as a naive
+# render_template would), precompiled templates, and bulk rendering in worker processes.
+# Run from the app directory: python bench_email_templates.py [renders]
+#
+# 20,000 renders of the Welcome template on a 1-CPU host (Python 3.11, Jinja2 3.1):
+#   parse on every render               2,404 renders/s
+#   precompiled, inline               125,954 renders/s
+#   precompiled, bulk (2 workers)     101,643 renders/s
+#   precompiled, bulk (0 workers)     113,382 renders/s  (EMAIL_RENDER_WORKERS=0, thread pool)
+# Precompiling is the win (~50x). With one CPU the worker processes cannot beat inline rendering;
+# they only keep bulk renders off the event loop, and pay off with spare cores.
+import asyncio
+import sys
+import time
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from core.email_templates import EMAIL_TEMPLATE_DIR, EMAIL_RENDER_WORKERS
+from utlis.utils import EMAIL_TEMPLATES, email_templates
+
+
+RENDERS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+EMAIL_TYPE = "Welcome"
+contexts = [{"username": f"user{i}", "link": f"http://localhost:8000/?u={i}"} for i in range(RENDERS)]
+
+
+def report(label: str, started: float):
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {RENDERS / elapsed:>12,.0f} renders/s  ({elapsed:.2f}s)")
+
+
+def bench_reparse():
+    # A fresh environment per send: the template is read and compiled every time
+    started = time.perf_counter()
+    for context in contexts:
+        environment = Environment(loader=FileSystemLoader(EMAIL_TEMPLATE_DIR), autoescape=select_autoescape(["html"]))
+        environment.get_template(EMAIL_TEMPLATES[EMAIL_TYPE]).render(context)
+    report("parse on every render", started)
+
+
+def bench_precompiled():
+    email_templates.load()
+    started = time.perf_counter()
+    for context in contexts:
+        email_templates.render(EMAIL_TYPE, context)
+    report("precompiled, inline", started)
+
+
+async def bench_bulk():
+    await email_templates.render_many(EMAIL_TYPE, contexts[:1000])  # Start and warm up the workers
+    started = time.perf_counter()
+    await email_templates.render_many(EMAIL_TYPE, contexts)
+    report(f"precompiled, bulk ({EMAIL_RENDER_WORKERS} workers)", started)
+    email_templates.close()
+
+
+if __name__ == "__main__":
+    bench_reparse()
+    bench_precompiled()
+    asyncio.run(bench_bulk())
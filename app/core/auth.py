@@ -6,10 +6,21 @@ from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt  # type: ignore # Importing JWT (JSON Web Token) utilities for token creation and verification
 from fastapi.security import OAuth2PasswordBearer  # Importing OAuth2PasswordBearer for token authentication
 from sqlalchemy.future import select
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from uuid import UUID, uuid4
+import asyncio
+import hashlib
+import os
+import time
 
 # from crud.users import 
+from core.cache import cache_type, get_cache  # Shared cache used for authenticated principals
+from core.metrics import LatencyStats  # Latency tracking for password hashing
 from db.database import get_db  # Importing database dependency for session management
-from db.models.users import User  # Importing the User model from the database models
+from db.models.users import User, UserRole  # Importing the User model from the database models
+from db.models.vendors import Vendor  # Vendor accounts act for the vendor with their email
 from sqlalchemy.ext.asyncio import AsyncSession
 # from jwt import PyJWTError
 
@@ -26,44 +37,106 @@ ALGORITHM = "HS256"  # Algorithm used for encoding JWTs
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Access token expiration time in minutes
 
 
+# The subset of a user that authorization checks need, cached per access token
+@cache_type
+@dataclass(frozen=True, slots=True)
+class UserPrincipal:
+    user_id: int
+    username: str
+    email: str
+    role: UserRole
+    vendor_id: Optional[UUID] = None
+
+    @classmethod
+    def from_user(cls, user: User, vendor_id: Optional[UUID] = None) -> "UserPrincipal":
+        return cls(
+            user_id=user.user_id,
+            username=user.username,
+            email=user.email,
+            role=user.role,
+            vendor_id=vendor_id,
+        )
+
+
+cache_type(UserRole)  # Cached as part of UserPrincipal
+
+# Principal cache: "token:<sub>:<jti|iat>" -> (epoch, UserPrincipal), plus "user:<sub>" -> epoch.
+# Dropping a user's epoch invalidates every cached token of that user at once.
+principal_cache = get_cache(
+    "auth",
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", 60)),
+)
+
+
+# bcrypt is deliberately slow (~100-300 ms), so it runs on a small dedicated thread pool
+# instead of the event loop. When more than HASH_MAX_PENDING operations are queued or
+# running, new ones are rejected with 503 rather than piling up behind a login storm.
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", 2))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", 32))
+hash_executor = ThreadPoolExecutor(max_workers=HASH_POOL_SIZE, thread_name_prefix="bcrypt")
+hash_latency = LatencyStats()  # Queue wait + hashing time, per call
+hash_in_flight = 0
+hash_rejected = 0
+
+
+async def _run_hashing(func, *args):
+    """Run a passlib call on the hashing pool, enforcing the queue-depth limit."""
+    global hash_in_flight, hash_rejected
+    if hash_in_flight >= HASH_MAX_PENDING:
+        hash_rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    hash_in_flight += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, func, *args)
+    finally:
+        hash_in_flight -= 1
+        hash_latency.observe(time.perf_counter() - started)
+
+
+def hashing_stats() -> dict:
+    """Return pool size, queue depth, rejections and latency of password hashing."""
+    return {
+        "pool_size": HASH_POOL_SIZE,
+        "max_pending": HASH_MAX_PENDING,
+        "in_flight": hash_in_flight,
+        "rejected": hash_rejected,
+        "latency": hash_latency.stats(),
+    }
+
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify if the plain password matches the hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verify if the plain password matches the hashed password (runs on the hashing pool)."""
+    return await _run_hashing(pwd_context.verify, plain_password, hashed_password)
 
 async def get_password_hash(password: str) -> str:
-    """Hash a password using bcrypt."""
-    return pwd_context.hash(password)
+    """Hash a password using bcrypt (runs on the hashing pool)."""
+    return await _run_hashing(pwd_context.hash, password)
 
 
-async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)):
+def decode_access_token(token: str) -> dict:
     """
-    Retrieve the current user based on the provided JWT token.
+    Decode and validate an access token.
 
     Args:
-        db (AsyncSession): The database session dependency for querying the database.
-        token (str): The JWT token extracted from the Authorization header using `oauth2_scheme`.
+        token (str): The JWT token extracted from the Authorization header.
 
     Returns:
-        User: The user object fetched from the database.
+        dict: The decoded payload, guaranteed to carry a 'sub' claim.
 
     Raises:
-        HTTPException: If the token is invalid, expired, or the user does not exist.
+        HTTPException: If the token is invalid, expired, or has no 'sub' claim.
     """
     try:
         # Decode the JWT token to extract the payload.
         # `SECRET_KEY` and `ALGORITHM` must match the settings used during token creation.
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        
-        # Extract the user ID from the payload. This should correspond to the 'sub' claim.
-        user_id: int = payload.get("sub")
-        
-        # If the 'sub' claim is missing, raise an Unauthorized error.
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token"
-            )
     except JWTError:
         # If the token decoding fails or is invalid, raise an Unauthorized error.
         raise HTTPException(
@@ -71,30 +144,116 @@ async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depe
             detail="Invalid token"
         )
 
-    # Query the database to fetch the user with the given user ID.
+    # If the 'sub' claim (the user ID) is missing, raise an Unauthorized error.
+    if payload.get("sub") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    return payload
+
+
+async def get_user_by_id(db: AsyncSession, user_id) -> User:
+    """Fetch a user by ID, raising 404 if it does not exist."""
     result = await db.execute(select(User).filter(User.user_id == int(user_id)))
     user = result.scalars().first()
-    
+
     # If no user is found in the database, raise a Not Found error.
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-
-    # Return the user object if everything is successful.
     return user
 
 
-async def is_superuser(current_user: User = Depends(get_current_user)):
+async def get_vendor_id_for_user(db: AsyncSession, user: User) -> Optional[UUID]:
+    """
+    Return the vendor a vendor account acts for, or None.
+
+    Users have no vendor column; a vendor account is linked to the live vendor registered
+    with the same email address (unique among live vendors).
+    """
+    if user.role != UserRole.VENDOR:
+        return None
+    return await db.scalar(select(Vendor.vendor_id).where(Vendor.email == user.email))
+
+
+async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    """
+    Retrieve the current user based on the provided JWT token.
+
+    Routes that only need the user's id, role or vendor_id should depend on
+    `get_current_principal` instead, which usually skips the database.
+
+    Args:
+        db (AsyncSession): The database session dependency for querying the database.
+        token (str): The JWT token extracted from the Authorization header using `oauth2_scheme`.
+
+    Returns:
+        User: The user object fetched from the database.
+
+    Raises:
+        HTTPException: If the token is invalid, expired, or the user does not exist.
+    """
+    payload = decode_access_token(token)
+    return await get_user_by_id(db, payload["sub"])
+
+
+async def get_current_principal(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)) -> UserPrincipal:
+    """
+    Retrieve the authenticated principal (id, role, vendor_id) for the provided JWT token.
+
+    The principal is cached per `(sub, jti)`, falling back to `iat` for older tokens,
+    for `PRINCIPAL_CACHE_TTL` seconds. A cache hit answers without touching the
+    database. `invalidate_principal` drops every cached token of a user when that
+    user is updated or deleted.
+
+    Args:
+        db (AsyncSession): The database session, only used on a cache miss.
+        token (str): The JWT token extracted from the Authorization header using `oauth2_scheme`.
+
+    Returns:
+        UserPrincipal: The cached or freshly loaded principal.
+
+    Raises:
+        HTTPException: If the token is invalid, expired, or the user does not exist.
+    """
+    payload = decode_access_token(token)
+    user_id = payload["sub"]
+    token_key = f"token:{user_id}:{payload.get('jti') or payload.get('iat')}"
+
+    # Fast path: a cached principal is only valid while the user's epoch is unchanged
+    epoch = await principal_cache.get(f"user:{user_id}")
+    if epoch is not None:
+        entry = await principal_cache.get(token_key)
+        if entry is not None and entry[0] == epoch:
+            return entry[1]
+
+    # Slow path: load the user once and cache the principal for this token
+    user = await get_user_by_id(db, user_id)
+    principal = UserPrincipal.from_user(user, await get_vendor_id_for_user(db, user))
+    if epoch is None:
+        epoch = uuid4().hex
+        await principal_cache.set(f"user:{user_id}", epoch)
+    await principal_cache.set(token_key, (epoch, principal))
+    return principal
+
+
+async def invalidate_principal(user_id: int):
+    """Drop every cached principal of `user_id` (call after the user changes)."""
+    await principal_cache.delete(f"user:{user_id}")
+
+
+async def is_superuser(current_user: UserPrincipal = Depends(get_current_principal)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized to perform this action")
 
-async def is_vendor(current_user: User = Depends(get_current_user)):
+async def is_vendor(current_user: UserPrincipal = Depends(get_current_principal)):
     if current_user.role != "vendor":
         raise HTTPException(status_code=403, detail="Only vendors can perform this action")
 
-async def is_admin(current_user: User = Depends(get_current_user)):
+async def is_admin(current_user: UserPrincipal = Depends(get_current_principal)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can perform this action")
 
@@ -120,10 +279,14 @@ async def create_access_token(data: dict, expires_in_minutes: int):
         to_encode = data.copy()
 
         # Calculate the expiration time by adding the specified duration to the current UTC time.
-        expire = datetime.now(timezone.utc) + timedelta(minutes=expires_in_minutes)
+        now = datetime.now(timezone.utc)
+        expire = now + timedelta(minutes=expires_in_minutes)
 
-        # Add the expiration time as the "exp" field in the token payload.
-        to_encode.update({"exp": expire})
+        # Add the expiration time as the "exp" field, plus the issue time and a unique
+        # token ID ("jti", unless the caller picked one) that identify this token in the
+        # principal cache and the refresh tokens table.
+        to_encode.update({"exp": expire, "iat": now})
+        to_encode.setdefault("jti", uuid4().hex)
 
         # Encode the payload into a JWT string using the SECRET_KEY and the specified ALGORITHM.
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
@@ -141,6 +304,16 @@ async def create_access_token(data: dict, expires_in_minutes: int):
 
 
 
+def hash_token(token: str) -> bytes:
+    """
+    Digest a refresh token for storage and lookup.
+
+    Refresh tokens are random, signed and long-lived, so a plain SHA-256 is enough (no salt or
+    slow hash needed): a leaked `tokens` table cannot be replayed, and every digest is 32 bytes.
+    """
+    return hashlib.sha256(token.encode()).digest()
+
+
 def verify_token(token: str):
     """
     Verify a JWT token and decode its payload.
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+# Set BACKGROUND_JOBS_ENABLED=false on workers that should only serve requests
+BACKGROUND_JOBS_ENABLED = os.getenv("BACKGROUND_JOBS_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+
+_jobs = []  # (name, interval in seconds, coroutine function)
+_tasks = []
+
+
+def periodic(interval_seconds: float):
+    """
+    Register a coroutine function to run every `interval_seconds` while the app is up.
+
+    Jobs must be safe to run on several workers at once (e.g. claim rows with
+    `FOR UPDATE SKIP LOCKED`), since every worker starts its own copy.
+    """
+    def decorator(func):
+        _jobs.append((func.__name__, interval_seconds, func))
+        return func
+    return decorator
+
+
+async def _run_forever(name: str, interval_seconds: float, func):
+    while True:
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Keep the loop alive; the next run retries
+            logger.exception("Background job %s failed", name)
+        await asyncio.sleep(interval_seconds)
+
+
+async def start_background_jobs():
+    """Start every registered periodic job (no-op if BACKGROUND_JOBS_ENABLED is false)."""
+    if not BACKGROUND_JOBS_ENABLED or _tasks:
+        return
+    for name, interval_seconds, func in _jobs:
+        _tasks.append(asyncio.create_task(_run_forever(name, interval_seconds, func), name=name))
+
+
+async def stop_background_jobs():
+    """Cancel the running periodic jobs and wait for them to finish."""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
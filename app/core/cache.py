@@ -0,0 +1,364 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from uuid import UUID
+
+try:
+    import redis.asyncio as aioredis  # Optional: only needed when CACHE_URL is set
+except ImportError:
+    aioredis = None
+
+
+logger = logging.getLogger(__name__)
+
+# Shared cache settings: set CACHE_URL (e.g. redis://localhost:6379/0) to share caches across workers
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_CHANNEL = os.getenv("CACHE_CHANNEL", "ecom:cache:invalidate")
+CACHE_LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", 5))
+
+_backends = {}  # namespace -> backend, used by the invalidation listener and metrics
+_subscribers = {}  # pub/sub channel -> handler called with each message payload
+_cache_types = {}  # class name -> dataclass or Enum that cached values may contain (see `cache_type`)
+_redis = None
+_listener_task = None
+
+
+def cache_type(cls):
+    """
+    Register a dataclass or Enum so its instances can be stored in a shared cache.
+
+    Shared caches store JSON, never pickles: a value read back can only rebuild the
+    registered types, from their fields, so a writable cache server cannot run code here.
+    """
+    _cache_types[cls.__name__] = cls
+    return cls
+
+
+def _to_jsonable(value):
+    if isinstance(value, Enum):
+        return {"__enum__": type(value).__name__, "value": _to_jsonable(value.value)}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        fields = {field.name: _to_jsonable(getattr(value, field.name)) for field in dataclasses.fields(value)}
+        return {"__type__": type(value).__name__, "fields": fields}
+    if isinstance(value, UUID):
+        return {"__uuid__": str(value)}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_to_jsonable(item) for item in value]}
+    if isinstance(value, list):
+        return [_to_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _to_jsonable(item) for key, item in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"Cannot cache a {type(value).__name__}; register it with @cache_type")
+
+
+def _from_jsonable(obj: dict):
+    # json.loads object hook: inner objects are already decoded when this sees the outer one
+    if "__uuid__" in obj:
+        return UUID(obj["__uuid__"])
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    if "__decimal__" in obj:
+        return Decimal(obj["__decimal__"])
+    if "__tuple__" in obj:
+        return tuple(obj["__tuple__"])
+    for tag in ("__type__", "__enum__"):
+        if tag in obj:
+            cls = _cache_types.get(obj[tag])
+            if cls is None:
+                raise ValueError(f"Unregistered cached type {obj[tag]!r}")
+            return cls(obj["value"]) if tag == "__enum__" else cls(**obj["fields"])
+    return obj
+
+
+def encode_value(value) -> bytes:
+    """Serialize a cached value to JSON (see `cache_type` for dataclasses and enums)."""
+    return json.dumps(_to_jsonable(value), separators=(",", ":")).encode()
+
+
+def decode_value(raw: bytes):
+    """Inverse of `encode_value`; raises ValueError for anything it did not write."""
+    return json.loads(raw, object_hook=_from_jsonable)
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with a per-entry time-to-live and LRU eviction.
+
+    Entries are kept in an OrderedDict in recency order: reads move an entry to the
+    end, and once `maxsize` is exceeded the least recently used entry is evicted.
+    Expired entries are dropped lazily when they are read.
+
+    Hit, miss, expiration and eviction counters are kept so the cache can be sized
+    against real traffic (see `stats()`).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize  # Maximum number of entries kept in memory
+        self.ttl = ttl  # Default time-to-live of an entry, in seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():  # Drop stale entries on access
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)  # Mark as most recently used
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        """Store `value` under `key`, evicting the least recently used entries if full."""
+        self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        """Remove `key` from the cache if present."""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry, keeping the counters."""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return the current size and the hit/miss/expiration/eviction counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
+
+
+class MemoryCacheBackend:
+    """
+    Cache backend that keeps entries in a per-process TTLCache.
+
+    This is the default when `CACHE_URL` is not set. Each worker has its own copy,
+    so it suits single-worker deployments and local development.
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float):
+        self.namespace = namespace
+        self.local = TTLCache(maxsize, ttl)
+
+    async def get(self, key):
+        return self.local.get(str(key))
+
+    async def set(self, key, value, ttl: float = None):
+        self.local.set(str(key), value, ttl)
+
+    async def delete(self, key):
+        self.local.delete(str(key))
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self.local.stats()}
+
+
+class RedisCacheBackend:
+    """
+    Cache backend shared by every worker through a Redis-protocol server.
+
+    Values are stored as JSON (`encode_value`) under `<namespace>:<key>` with the entry TTL.
+    A small local TTLCache in front of the server keeps hot keys in process. Its
+    entries live at most `CACHE_LOCAL_TTL` seconds, and deletes are broadcast on
+    the `CACHE_CHANNEL` pub/sub channel so every worker drops its local copy right away.
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = TTLCache(maxsize, min(ttl, CACHE_LOCAL_TTL))
+        self.remote_hits = 0
+        self.remote_misses = 0
+        self.errors = 0
+
+    def _remote_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key):
+        key = str(key)
+        value = self.local.get(key)  # Hot path: no network round-trip
+        if value is not None:
+            return value
+
+        try:
+            raw = await _get_redis().get(self._remote_key(key))
+        except Exception as e:
+            # Treat an unreachable server as a miss so callers fall back to the database
+            self.errors += 1
+            logger.warning("Cache GET failed for %s:%s: %s", self.namespace, key, e)
+            return None
+
+        if raw is None:
+            self.remote_misses += 1
+            return None
+
+        try:
+            value = decode_value(raw)
+        except (ValueError, TypeError) as e:
+            # Not something we wrote (or from an incompatible release): ignore it like a miss
+            self.errors += 1
+            logger.warning("Cache GET returned an undecodable value for %s:%s: %s", self.namespace, key, e)
+            return None
+
+        self.remote_hits += 1
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key, value, ttl: float = None):
+        key = str(key)
+        self.local.set(key, value)
+        try:
+            await _get_redis().set(self._remote_key(key), encode_value(value), px=int((ttl or self.ttl) * 1000))
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Cache SET failed for %s:%s: %s", self.namespace, key, e)
+
+    async def delete(self, key):
+        key = str(key)
+        self.local.delete(key)
+        try:
+            await _get_redis().delete(self._remote_key(key))
+            await publish(CACHE_CHANNEL, f"{self.namespace}\x00{key}")  # Tell the other workers
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Cache DELETE failed for %s:%s: %s", self.namespace, key, e)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "remote_hits": self.remote_hits,
+            "remote_misses": self.remote_misses,
+            "errors": self.errors,
+            "local": self.local.stats(),
+        }
+
+
+def _get_redis():
+    """Return the process-wide Redis client, creating it on first use."""
+    global _redis
+    if _redis is None:
+        if aioredis is None:
+            raise RuntimeError("CACHE_URL is set but the `redis` package is not installed")
+        _redis = aioredis.from_url(CACHE_URL)
+    return _redis
+
+
+def get_cache(namespace: str, maxsize: int, ttl: float):
+    """
+    Create the cache backend for `namespace`.
+
+    - **namespace**: Prefix that keeps keys of different caches apart (e.g. "products").
+    - **maxsize**: Maximum number of entries kept in process.
+    - **ttl**: Default time-to-live of an entry, in seconds.
+    - Returns a RedisCacheBackend when `CACHE_URL` is configured, otherwise a MemoryCacheBackend.
+    """
+    if CACHE_URL:
+        backend = RedisCacheBackend(namespace, maxsize, ttl)
+    else:
+        backend = MemoryCacheBackend(namespace, maxsize, ttl)
+    _backends[namespace] = backend
+    return backend
+
+
+def cache_stats() -> dict:
+    """Return the stats of every registered cache, keyed by namespace."""
+    return {namespace: backend.stats() for namespace, backend in _backends.items()}
+
+
+def _drop_local_entry(payload: str):
+    """Drop a local entry after another worker deleted the key."""
+    namespace, _, key = payload.partition("\x00")
+    backend = _backends.get(namespace)
+    if backend is not None:
+        backend.local.delete(key)
+
+
+def subscribe(channel: str, handler):
+    """Call `handler(payload)` for every message published on `channel` by any worker."""
+    _subscribers[channel] = handler
+
+
+async def publish(channel: str, payload: str):
+    """Publish `payload` to every worker subscribed to `channel` (no-op without CACHE_URL)."""
+    if CACHE_URL:
+        await _get_redis().publish(channel, payload)
+
+
+async def _listen():
+    """Dispatch pub/sub messages to the registered handlers, reconnecting on failure."""
+    while True:
+        try:
+            pubsub = _get_redis().pubsub()
+            await pubsub.subscribe(*_subscribers)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                handler = _subscribers.get(message["channel"].decode())
+                if handler is not None:
+                    handler(message["data"].decode())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Local entries still expire after CACHE_LOCAL_TTL while we reconnect
+            logger.warning("Cache pub/sub listener failed, reconnecting: %s", e)
+            await asyncio.sleep(1)
+
+
+subscribe(CACHE_CHANNEL, _drop_local_entry)
+
+
+async def start_cache_listener():
+    """Start the pub/sub listener (no-op for per-process caches)."""
+    global _listener_task
+    if CACHE_URL and _listener_task is None:
+        _listener_task = asyncio.create_task(_listen())
+
+
+async def stop_cache_listener():
+    """Stop the invalidation listener and close the Redis client."""
+    global _listener_task, _redis
+    if _listener_task is not None:
+        _listener_task.cancel()
+        _listener_task = None
+    if _redis is not None:
+        await _redis.aclose() if hasattr(_redis, "aclose") else await _redis.close()  # close() is deprecated in redis-py 5
+        _redis = None
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Mapping, Optional
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the email templates named in utlis.utils.EMAIL_TEMPLATES
+EMAIL_TEMPLATE_DIR = os.getenv(
+    "EMAIL_TEMPLATE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "emails")
+)
+# Worker processes for bulk rendering, per app worker (0 renders bulk sends in the event loop's thread
+# pool instead). Kept small: every uvicorn worker starts its own pool, so os.cpu_count() here would
+# mean cpu_count² processes per host.
+EMAIL_RENDER_WORKERS = int(os.getenv("EMAIL_RENDER_WORKERS", 2))
+# Bulk renders smaller than this are done inline; shipping them to another process costs more than it saves
+EMAIL_RENDER_BULK_THRESHOLD = int(os.getenv("EMAIL_RENDER_BULK_THRESHOLD", 200))
+EMAIL_RENDER_CHUNK_SIZE = int(os.getenv("EMAIL_RENDER_CHUNK_SIZE", 500))
+
+
+class EmailTemplateEngine:
+    """
+    Renders email templates that are parsed and compiled exactly once.
+
+    `load()` compiles every template up front (a missing or broken template fails startup rather
+    than the first send); afterwards `render` is a dictionary lookup plus a call into the compiled
+    template. `auto_reload` is off, so Jinja does not stat the file on every render either.
+    """
+
+    def __init__(self, templates: Mapping[str, str], directory: str = EMAIL_TEMPLATE_DIR):
+        self.templates = dict(templates)  # email_type -> template file name
+        self.directory = directory
+        self.environment = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=select_autoescape(["html", "xml"]),  # Usernames are user input
+            undefined=StrictUndefined,  # A missing context value is a bug, not an empty string
+            auto_reload=False,
+        )
+        self._compiled = {}  # email_type -> jinja2.Template
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def load(self):
+        """Compile every template; safe to call again (e.g. after editing templates in development)."""
+        self._compiled = {
+            email_type: self.environment.get_template(name) for email_type, name in self.templates.items()
+        }
+        logger.info("Compiled %d email templates from %s", len(self._compiled), self.directory)
+
+    def render(self, email_type: str, context: Mapping) -> str:
+        """Render one email with an already compiled template."""
+        if not self._compiled:
+            self.load()
+        return self._compiled[email_type].render(context)
+
+    def _render_chunk(self, email_type: str, contexts: list) -> list:
+        return [self.render(email_type, context) for context in contexts]
+
+    async def render_many(self, email_type: str, contexts: Iterable[Mapping]) -> list:
+        """
+        Render the same template for many recipients (e.g. a vendor newsletter).
+
+        - **email_type**: Key into the engine's templates.
+        - **contexts**: One template context per recipient.
+        - Small batches are rendered inline. Larger ones are split into chunks and rendered in
+          `EMAIL_RENDER_WORKERS` processes (each compiles the templates once, when it starts),
+          so CPU-bound rendering neither blocks the event loop nor is limited by the GIL.
+        - Returns the rendered bodies in the order of `contexts`.
+        """
+        contexts = [dict(context) for context in contexts]
+        if len(contexts) < EMAIL_RENDER_BULK_THRESHOLD:
+            return self._render_chunk(email_type, contexts)
+
+        loop = asyncio.get_running_loop()
+        chunks = [contexts[i:i + EMAIL_RENDER_CHUNK_SIZE] for i in range(0, len(contexts), EMAIL_RENDER_CHUNK_SIZE)]
+        pool = self._get_pool()
+        if pool is None:
+            rendered = await asyncio.gather(
+                *(loop.run_in_executor(None, self._render_chunk, email_type, chunk) for chunk in chunks)
+            )
+        else:
+            rendered = await asyncio.gather(
+                *(loop.run_in_executor(pool, _render_chunk_in_worker, email_type, chunk) for chunk in chunks)
+            )
+        return [body for chunk in rendered for body in chunk]
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self._pool is None and EMAIL_RENDER_WORKERS > 0:
+            self._pool = ProcessPoolExecutor(
+                max_workers=EMAIL_RENDER_WORKERS,
+                initializer=_init_worker,
+                initargs=(self.templates, self.directory),
+            )
+        return self._pool
+
+    def close(self):
+        """Stop the bulk rendering processes (called on shutdown, without blocking the event loop)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Engine of a bulk rendering worker process, compiled once by `_init_worker`
+_worker_engine: Optional[EmailTemplateEngine] = None
+
+
+def _init_worker(templates: Mapping[str, str], directory: str):
+    global _worker_engine
+    _worker_engine = EmailTemplateEngine(templates, directory)
+    _worker_engine.load()
+
+
+def _render_chunk_in_worker(email_type: str, contexts: list) -> list:
+    return _worker_engine._render_chunk(email_type, contexts)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+
+import aiosmtplib  # type: ignore
+
+
+logger = logging.getLogger(__name__)
+
+# SMTP server settings; point SMTP_HOST/SMTP_PORT at a local aiosmtpd (with SMTP_START_TLS=false) in development
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_START_TLS = os.getenv("SMTP_START_TLS", "true").lower() in ("1", "true", "yes", "on")
+SMTP_EMAIL = os.getenv("SMTP_EMAIL")
+EMAIL_APP_PASS = os.getenv("EMAIL_PASS")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+# Persistent connections per worker, and how long one may sit idle before it is checked with NOOP
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 2))
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", 60))
+
+
+class SMTPPool:
+    """
+    A small pool of long-lived, authenticated SMTP connections.
+
+    Connections are opened lazily, reused for many messages (no TLS handshake and login per
+    email), checked with NOOP after sitting idle, and reopened when the server dropped them.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = asyncio.Queue()
+        self._created = 0
+        self._last_used = {}  # id(client) -> time it was returned to the pool
+
+    def _new_client(self):
+        return aiosmtplib.SMTP(
+            hostname=SMTP_HOST,
+            port=SMTP_PORT,
+            start_tls=SMTP_START_TLS,
+            username=SMTP_EMAIL,
+            password=EMAIL_APP_PASS,
+            timeout=SMTP_TIMEOUT,
+        )
+
+    async def _ensure_connected(self, client):
+        if client.is_connected and time.monotonic() - self._last_used.get(id(client), 0) > SMTP_IDLE_CHECK_SECONDS:
+            try:
+                await client.noop()
+            except aiosmtplib.SMTPException:
+                client.close()
+        if not client.is_connected:
+            await client.connect()  # Also runs STARTTLS and logs in
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connected client; it goes back to the pool afterwards, even on failure."""
+        if self._idle.empty() and self._created < self.size:
+            self._created += 1
+            client = self._new_client()
+        else:
+            client = await self._idle.get()
+        try:
+            await self._ensure_connected(client)
+            yield client
+        except aiosmtplib.SMTPServerDisconnected:
+            client.close()  # Reconnect on next use
+            raise
+        finally:
+            self._last_used[id(client)] = time.monotonic()
+            self._idle.put_nowait(client)
+
+    async def send(self, message: EmailMessage):
+        """Send one message over a pooled connection."""
+        async with self.connection() as client:
+            await client.send_message(message)
+
+    async def close(self):
+        """Close every idle connection (called on shutdown)."""
+        while not self._idle.empty():
+            client = self._idle.get_nowait()
+            if client.is_connected:
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException as e:
+                    logger.warning("Closing SMTP connection failed: %s", e)
+                    client.close()
+        self._created = 0
+        self._last_used.clear()
+
+
+smtp_pool = SMTPPool(SMTP_POOL_SIZE)
@@ -0,0 +1,43 @@
+import os
+from collections import deque
+
+
+# Number of most recent observations kept to compute latency percentiles
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", 1024))
+
+
+class LatencyStats:
+    """
+    Running latency statistics for one operation.
+
+    Keeps lifetime totals (count, sum, max) plus a sliding window of the most recent
+    `LATENCY_WINDOW` observations, which is used to report p50/p95/p99.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        """Record one observation, in seconds."""
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self._recent.append(seconds)
+
+    def _percentile(self, ordered: list, fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def stats(self) -> dict:
+        """Return the totals and recent percentiles, in milliseconds."""
+        ordered = sorted(self._recent)
+        result = {
+            "count": self.count,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 3),
+        }
+        for name, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            result[name] = round(self._percentile(ordered, fraction) * 1000, 3) if ordered else 0.0
+        return result
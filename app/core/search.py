@@ -0,0 +1,304 @@
+import bisect
+import re
+from array import array
+from collections import Counter, defaultdict
+from uuid import UUID
+
+
+# Words are runs of letters and digits; everything else separates them
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def tokenize(text) -> list:
+    """Split `text` into lowercase words."""
+    return [word.lower() for word in _WORD_RE.findall(text or "")]
+
+
+class InvertedIndex:
+    """
+    In-process full-text index: word -> {document ID: weight}.
+
+    Every query term is matched as a prefix, terms are combined with AND, and a
+    document scores the summed weight of the words it matched (mirroring the
+    `term:* & term:*` tsquery and weighted tsvector used on PostgreSQL).
+    """
+
+    def __init__(self):
+        self._postings = {}  # word -> {doc_id: weight}
+        self._documents = {}  # doc_id -> {word: weight}, needed to remove a document
+        self._vocabulary = []  # Sorted words, for prefix lookups
+        self._vocabulary_stale = False
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, doc_id, *fields):
+        """Index a document from `(text, weight)` pairs, replacing any previous version of it."""
+        self.remove(doc_id)
+        weights = defaultdict(float)
+        for text, weight in fields:
+            for word in tokenize(text):
+                weights[word] += weight
+        self._documents[doc_id] = dict(weights)
+        for word, weight in weights.items():
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+                self._vocabulary_stale = True
+            postings[doc_id] = weight
+
+    def remove(self, doc_id):
+        """Drop a document from the index (no-op if it is not indexed)."""
+        weights = self._documents.pop(doc_id, None)
+        if not weights:
+            return
+        for word in weights:
+            postings = self._postings[word]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[word]
+                self._vocabulary_stale = True
+
+    def clear(self):
+        self._postings.clear()
+        self._documents.clear()
+        self._vocabulary = []
+        self._vocabulary_stale = False
+
+    def _words_with_prefix(self, prefix: str):
+        if self._vocabulary_stale:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_stale = False
+        position = bisect.bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            yield self._vocabulary[position]
+            position += 1
+
+    def search(self, terms) -> list:
+        """
+        Find the documents matching every term (as a prefix).
+
+        - **terms**: Lowercase query words, e.g. from `tokenize`.
+        - Returns `(score, doc_id)` pairs, best match first and ties broken by doc_id.
+        """
+        scores = None
+        for term in terms:
+            term_scores = defaultdict(float)
+            for word in self._words_with_prefix(term):
+                for doc_id, weight in self._postings[word].items():
+                    term_scores[doc_id] += weight
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: score + term_scores[doc_id] for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                return []
+        return sorted(((score, doc_id) for doc_id, score in (scores or {}).items()), key=lambda hit: (-hit[0], hit[1]))
+
+
+def _normalize(text) -> str:
+    """Lowercase words joined by single spaces, with a leading space marking the first word start."""
+    return " " + " ".join(tokenize(text))
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _prefix_distance(prefix: str, text: str, max_edits: int) -> int:
+    """
+    Smallest edit distance between `prefix` and any prefix of `text`.
+
+    Only the diagonal band `|i - j| <= max_edits` is computed, since any alignment outside it
+    costs more than the bound. Returns `max_edits + 1` as soon as every alignment is already over it.
+    """
+    over = max_edits + 1
+    previous = [j if j <= max_edits else over for j in range(len(text) + 1)]
+    for i, char in enumerate(prefix, 1):
+        current = [i if i <= max_edits else over] + [over] * len(text)
+        for j in range(max(1, i - max_edits), min(len(text), i + max_edits) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != text[j - 1]), over)
+        if min(current) > max_edits:
+            return over
+        previous = current
+    return min(previous)
+
+
+def _match_word_start(text: str, typed: str, max_edits: int, grams: set, threshold: int):
+    """
+    Match `typed` at a word start of the normalized `text` that begins with its first two characters.
+
+    Word starts that do not share `threshold` of the query's `grams` within reach are skipped
+    without computing the edit distance. Returns `(distance, word number)` for the first
+    word within `max_edits`, or None.
+    """
+    exact = text.find(" " + typed)
+    if exact != -1:  # Most candidates match exactly; no need for the edit distance
+        return 0, text.count(" ", 0, exact + 1) - 1
+    if not max_edits:
+        return None
+    head = " " + typed[:2]
+    position = text.find(head)
+    while position != -1:
+        start = position + 1
+        window = text[start:start + len(typed) + max_edits]
+        if len(grams & _trigrams(" " + window)) >= threshold:
+            distance = _prefix_distance(typed, window, max_edits)
+            if distance <= max_edits:
+                return distance, text.count(" ", 0, start) - 1
+        position = text.find(head, start)
+    return None
+
+
+class SuggestIndex:
+    """
+    Typo-tolerant autocomplete over short strings keyed by UUID (e.g. product names).
+
+    Storage is array-backed so millions of entries stay small: IDs live in one bytearray
+    (16 bytes each), names in one UTF-8 blob addressed by an offsets array, and each
+    trigram maps to an `array('I')` of slot numbers. Removed entries are tombstoned and
+    the arrays are rebuilt once tombstones outnumber live entries.
+
+    A query matches where it starts at a word boundary of the name, within a bounded
+    edit distance; the leading word-boundary trigram and trigram counts (q-gram lemma)
+    pick the candidates that are verified.
+    """
+
+    COMPACT_MIN_TOMBSTONES = 1024
+
+    def __init__(self):
+        self._ids = bytearray()  # 16 bytes per slot
+        self._names = bytearray()  # UTF-8 names, back to back
+        self._offsets = array("I", [0])  # Slot i's name is _names[_offsets[i]:_offsets[i + 1]]
+        self._alive = bytearray()  # 1 per live slot, 0 per tombstone
+        self._postings = {}  # trigram -> array('I') of slots
+        self._live = 0
+
+    def __len__(self):
+        return self._live
+
+    def _name(self, slot: int) -> str:
+        return self._names[self._offsets[slot]:self._offsets[slot + 1]].decode()
+
+    def _id(self, slot: int) -> bytes:
+        return bytes(self._ids[slot * 16:slot * 16 + 16])
+
+    def _find(self, key: bytes, name: str, grams: set):
+        """Return the live slot holding `(key, name)`, scanning the shortest posting list of the name."""
+        rarest = min(grams, key=lambda gram: len(self._postings.get(gram, ())))
+        for slot in self._postings.get(rarest, ()):
+            if self._alive[slot] and self._id(slot) == key and self._name(slot) == name:
+                return slot
+        return None
+
+    def add(self, doc_id: UUID, name: str):
+        """Index `name` under `doc_id` (no-op if that exact entry is already indexed)."""
+        grams = _trigrams(_normalize(name))
+        if not grams:  # Too short to ever be suggested
+            return
+        key = doc_id.bytes
+        if self._find(key, name, grams) is not None:
+            return
+        slot = len(self._alive)
+        self._ids += key
+        self._names += name.encode()
+        self._offsets.append(len(self._names))
+        self._alive.append(1)
+        self._live += 1
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array("I")
+            postings.append(slot)
+
+    def remove(self, doc_id: UUID, name: str):
+        """Drop the entry indexed for `doc_id` under `name` (no-op if there is none)."""
+        grams = _trigrams(_normalize(name))
+        if not grams:
+            return
+        slot = self._find(doc_id.bytes, name, grams)
+        if slot is None:
+            return
+        self._alive[slot] = 0
+        self._live -= 1
+        tombstones = len(self._alive) - self._live
+        if tombstones > self.COMPACT_MIN_TOMBSTONES and tombstones > self._live:
+            self._compact()
+
+    def _compact(self):
+        entries = [(self._id(slot), self._name(slot)) for slot in range(len(self._alive)) if self._alive[slot]]
+        self.clear()
+        for key, name in entries:
+            self.add(UUID(bytes=key), name)
+
+    def clear(self):
+        self.__init__()
+
+    def suggest(self, prefix: str, limit: int, max_edits: int, max_candidates: int = 500) -> list:
+        """
+        Return up to `limit` `(doc_id, name, distance)` matches for `prefix`.
+
+        - **prefix**: What the user typed so far; needs at least two letters or digits, and
+          the first two must be typed right.
+        - **max_edits**: Most typos tolerated. Lowered for short prefixes: none below four
+          characters, at most one below eight.
+        - **max_candidates**: Most entries verified, which bounds the work for very common prefixes.
+        - Candidates are the entries with a word starting like the prefix (the posting list of
+          its leading trigram, e.g. " ch"); the other trigrams are only counted for those.
+        - Candidates are verified in order of shared trigrams, stopping once `limit` hits are
+          found that no remaining candidate can beat.
+        - Best first: fewest edits, then matches on the first word, then shorter names.
+        """
+        query = _normalize(prefix)
+        typed = query[1:]
+        grams = _trigrams(query)
+        if not grams:
+            return []
+        lead = query[:3]
+        lead_slots = self._postings.get(lead)
+        if lead_slots is None:
+            return []
+        max_edits = min(max_edits, 0 if len(typed) < 4 else 1 if len(typed) < 8 else 2)
+        # Each edit destroys at most three trigrams; short prefixes still need one in common
+        threshold = max(1, len(grams) - 3 * max_edits)
+
+        candidates = set(lead_slots)
+        counts = Counter(candidates)
+        for gram in grams:
+            postings = self._postings.get(gram) if gram != lead else None
+            if postings is not None:
+                counts.update(candidates.intersection(postings))
+        by_count = defaultdict(list)
+        for slot, count in counts.items():
+            if count >= threshold and self._alive[slot]:
+                by_count[count].append(slot)
+
+        hits = []
+        verified = 0
+        for count in sorted(by_count, reverse=True):
+            fewest_edits = -(-(len(grams) - count) // 3)
+            if len(hits) >= limit and fewest_edits > sorted(hit[0] for hit in hits)[limit - 1]:
+                break  # Every remaining candidate needs more edits than the hits kept so far
+            for slot in by_count[count][:max_candidates - verified]:
+                name = self._name(slot)
+                match = _match_word_start(_normalize(name), typed, max_edits, grams, threshold)
+                if match is not None:
+                    hits.append((*match, len(name), name, slot))
+            verified += len(by_count[count])
+            if verified >= max_candidates:
+                break
+        hits.sort()
+        return [(UUID(bytes=self._id(slot)), name, distance) for distance, _, _, name, slot in hits[:limit]]
+
+    def stats(self) -> dict:
+        """Return the entry counts and the approximate size of the arrays in bytes."""
+        return {
+            "entries": self._live,
+            "tombstones": len(self._alive) - self._live,
+            "trigrams": len(self._postings),
+            "bytes": (
+                len(self._ids) + len(self._names) + len(self._alive)
+                + self._offsets.itemsize * len(self._offsets)
+                + sum(postings.itemsize * len(postings) for postings in self._postings.values())
+            ),
+        }
@@ -0,0 +1,93 @@
+from sqlalchemy import String, cast, delete, exists, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+import os
+
+from core.background import periodic
+from db.database import AsyncSessionLocal
+from db.models import (
+    ArchivedRecord, CartItem, InventoryStripe, Order, OrderItem, PasswordResetToken, Product, Review,
+    ShoppingCart, StockReservation, Token, User, Vendor, Wishlist, product_category_association,
+    wishlist_product_association,
+)
+
+
+# Soft-deleted rows are archived once they have been deleted for this long
+SOFT_DELETE_RETENTION_DAYS = int(os.getenv("SOFT_DELETE_RETENTION_DAYS", 30))
+# How often tombstones are archived, and how many rows per table are moved per transaction
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 3600))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", 500))
+
+# Per soft-deletable model:
+# - owned: rows that only make sense with the parent, deleted together with it
+# - referenced_by: rows that must keep the parent (e.g. order history keeps its products);
+#   tombstones still referenced are left in place
+ARCHIVE_TARGETS = (
+    (
+        Product,
+        (InventoryStripe.__table__.c.product_id, product_category_association.c.product_id,
+         wishlist_product_association.c.product_id),
+        (OrderItem.__table__.c.product_id, StockReservation.__table__.c.product_id,
+         Review.__table__.c.product_id, CartItem.__table__.c.product_id),
+    ),
+    (Vendor, (), (Product.__table__.c.vendor_id,)),
+    (
+        User,
+        (Token.__table__.c.user_id, PasswordResetToken.__table__.c.user_id),
+        (Order.__table__.c.user_id, Review.__table__.c.user_id, Wishlist.__table__.c.user_id,
+         ShoppingCart.__table__.c.user_id),
+    ),
+)
+
+
+async def archive_deleted_rows(db: AsyncSession, model, owned, referenced_by, batch_size: int = ARCHIVE_BATCH) -> int:
+    """
+    Move one batch of old soft-deleted rows of `model` into `archived_records`.
+
+    - **db**: The database session for performing database operations.
+    - **model**: A soft-deletable model (see `db.soft_delete.SOFT_DELETE_MODELS`).
+    - **owned** / **referenced_by**: Dependent columns, as in `ARCHIVE_TARGETS`.
+    - **batch_size**: Maximum number of rows moved in this call.
+    - Claims rows deleted more than `SOFT_DELETE_RETENTION_DAYS` ago with `FOR UPDATE SKIP LOCKED`,
+      using the partial `deleted_at IS NOT NULL` index, so several workers can run it at once.
+    - Copies each row as JSON, deletes its owned rows and the row itself, and commits.
+    - Returns the number of rows archived.
+    """
+    table = model.__table__
+    key = table.primary_key.columns.values()[0]
+    cutoff = datetime.now(timezone.utc) - timedelta(days=SOFT_DELETE_RETENTION_DAYS)
+
+    result = await db.execute(
+        select(key)
+        .where(
+            table.c.deleted_at < cutoff,
+            *[~exists().where(column == key) for column in referenced_by],
+        )
+        .order_by(table.c.deleted_at)
+        .limit(batch_size)
+        .with_for_update(of=table, skip_locked=True)
+        .execution_options(include_deleted=True)
+    )
+    keys = result.scalars().all()
+    if not keys:
+        return 0
+
+    await db.execute(insert(ArchivedRecord).from_select(
+        ["table_name", "record_key", "data", "deleted_at"],
+        select(literal(table.name), cast(key, String), func.to_jsonb(table.table_valued()), table.c.deleted_at)
+        .where(key.in_(keys)),
+    ))
+    for column in owned:
+        await db.execute(delete(column.table).where(column.in_(keys)))
+    await db.execute(delete(table).where(key.in_(keys)))
+    await db.commit()
+    return len(keys)
+
+
+@periodic(ARCHIVE_INTERVAL_SECONDS)
+async def archive_deleted_rows_job():
+    # Drain each table one bounded batch per transaction, so locks are held briefly
+    async with AsyncSessionLocal() as db:
+        for model, owned, referenced_by in ARCHIVE_TARGETS:
+            while await archive_deleted_rows(db, model, owned, referenced_by) == ARCHIVE_BATCH:
+                pass
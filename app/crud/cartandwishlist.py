@@ -1,14 +1,164 @@
-from sqlalchemy import select
+from sqlalchemy import func, literal, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession  # Import SQLAlchemy asyncsession for interacting with the database
 from fastapi import HTTPException, status
-from sqlalchemy.exc import IntegrityError
-from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
 
-from schemas.users import UserUpdate
-from schemas.users import UserResponse
-from app.db.models.users import User # Import the User model
-from db.models.token import Token # Import the User model
-from core.auth import verify_password  # Import function to verify password from the auth module
-from core.auth import get_password_hash  # Import function to hash passwords from the auth module
+from db.models.orders import Order, OrderItem, OrderStatus
+from db.models.products import Product
+from crud.orders import select_orders
+from crud.inventory import reserve_stock
 
+# Predicate of the `uq_orders_user_cart` partial unique index (one open cart per user)
+CART_INDEX_WHERE = text("status = 'CART'")
 
+
+async def get_or_create_cart_id(db: AsyncSession, user_id: int) -> UUID:
+    """
+    Return the ID of the user's open cart, creating the cart if needed.
+
+    - **db**: The database session for performing database operations.
+    - **user_id**: ID of the cart owner.
+    - Runs a single `INSERT ... ON CONFLICT (user_id) WHERE status = 'CART' DO UPDATE`
+      against the `uq_orders_user_cart` index, so concurrent requests never create two carts.
+    - Does not commit; the caller owns the transaction.
+    - Returns the cart's order_id.
+    """
+    stmt = (
+        pg_insert(Order)
+        .values(
+            order_id=uuid4(),
+            user_id=user_id,
+            status=OrderStatus.CART,
+            total_amount=0,
+            shipping_address="",  # Filled in at checkout
+        )
+        .on_conflict_do_update(
+            index_elements=[Order.user_id],
+            index_where=CART_INDEX_WHERE,
+            set_={"updated_at": func.now()},  # Touch the row so RETURNING yields the existing cart
+        )
+        .returning(Order.order_id)
+    )
+    return (await db.execute(stmt)).scalar_one()
+
+
+async def get_cart_from_db(db: AsyncSession, user_id: int, create: bool = False):
+    """
+    Retrieve the user's open cart with its items eagerly loaded.
+
+    - **db**: The database session for performing database operations.
+    - **user_id**: ID of the cart owner.
+    - **create**: Create (and commit) an empty cart if the user has none.
+    - Reads first; the cart is only inserted when the user has none, so viewing a cart
+      is a plain read and takes no row lock.
+    - Returns the cart Order, or None if there is no cart and `create` is False.
+    """
+    query = select_orders().filter(Order.user_id == user_id, Order.status == OrderStatus.CART)
+    cart = (await db.execute(query)).scalars().first()
+    if cart is None and create:
+        await get_or_create_cart_id(db, user_id)
+        await db.commit()
+        cart = (await db.execute(query)).scalars().first()
+    return cart
+
+
+async def add_item_to_cart_in_db(db: AsyncSession, user_id: int, product_id: UUID, quantity: int, commit: bool = True) -> dict:
+    """
+    Add `quantity` units of a product to the user's cart and update the cart total in SQL.
+
+    - **db**: The database session for performing database operations.
+    - **user_id**: ID of the cart owner.
+    - **product_id**: UUID of the product to add.
+    - **quantity**: Number of units to add.
+    - **commit**: Commit the transaction when done (pass False to combine with other changes).
+    - Two statements in one transaction:
+        1. Get or create the open cart (`get_or_create_cart_id`).
+        2. Upsert the line with `INSERT ... SELECT price FROM products ... ON CONFLICT
+           (order_id, product_id) DO UPDATE SET quantity = quantity + excluded.quantity`, and in
+           the same statement add `quantity * line price` to `orders.total_amount`.
+    - Raises a 404 HTTPException (and rolls back) if the product does not exist.
+    - Returns the cart ID, the line's new quantity and the cart's new total.
+    """
+    cart_id = await get_or_create_cart_id(db, user_id)
+
+    # Upsert the cart line, reading the current price from the product row
+    item_insert = pg_insert(OrderItem).from_select(
+        ["order_item_id", "order_id", "product_id", "quantity", "price"],
+        select(
+            literal(uuid4(), OrderItem.order_item_id.type),
+            literal(cart_id, OrderItem.order_id.type),
+            Product.product_id,
+            literal(quantity, OrderItem.quantity.type),
+            Product.price,
+        ).where(Product.product_id == product_id, Product.deleted_at.is_(None)),  # INSERT ... SELECT skips the soft-delete criteria
+    )
+    item = (
+        item_insert.on_conflict_do_update(
+            constraint="uq_order_items_order_product",
+            set_={"quantity": OrderItem.quantity + item_insert.excluded.quantity},
+        )
+        .returning(OrderItem.order_id, OrderItem.quantity, OrderItem.price)
+        .cte("item")
+    )
+
+    # Add the delta to the cart total in the same statement; the line keeps its original price
+    stmt = (
+        update(Order)
+        .where(Order.order_id == item.c.order_id)
+        .values(total_amount=Order.total_amount + item.c.price * quantity)
+        .returning(Order.order_id, item.c.quantity, Order.total_amount)
+        .execution_options(synchronize_session=False)
+    )
+    row = (await db.execute(stmt)).first()
+
+    if row is None:  # The SELECT found no product, so nothing was inserted
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+
+    if commit:
+        await db.commit()
+    return {"cart_id": row.order_id, "quantity": row.quantity, "total_amount": row.total_amount}
+
+
+async def checkout_cart_in_db(db: AsyncSession, user_id: int, shipping_address: str) -> dict:
+    """
+    Turn the user's cart into a placed order, reserving stock for every line.
+
+    - **db**: The database session for performing database operations.
+    - **user_id**: ID of the cart owner.
+    - **shipping_address**: Address the order ships to.
+    - In one transaction:
+        1. Flip the user's cart to PENDING with a conditional UPDATE (`WHERE status = 'CART'`).
+           This takes the cart row lock first: a concurrent add-to-cart that still holds it is
+           waited for, and later adds see no open cart and start a new one. Two concurrent
+           checkouts cannot both flip the same cart.
+        2. Load the order's lines after the flip, so exactly what was placed is reserved.
+        3. Reserve stock for every line with conditional decrements (`reserve_stock`).
+    - Raises a 400 HTTPException if there is no cart or it is empty, and a 409 HTTPException
+      if a product is out of stock (nothing is changed then).
+    - Returns the order ID and when its stock reservation expires.
+    """
+    placed = await db.execute(
+        update(Order)
+        .where(Order.user_id == user_id, Order.status == OrderStatus.CART)
+        .values(status=OrderStatus.PENDING, shipping_address=shipping_address)
+        .returning(Order.order_id)
+        .execution_options(synchronize_session=False)
+    )
+    order_id = placed.scalar_one_or_none()
+    if order_id is None:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cart is empty")
+
+    items = await db.execute(
+        select(OrderItem.product_id, OrderItem.quantity).where(OrderItem.order_id == order_id)
+    )
+    lines = [(product_id, quantity) for product_id, quantity in items]
+    if not lines:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cart is empty")
+
+    expires_at = await reserve_stock(db, order_id, lines)  # Rolls back and raises 409 when out of stock
+    await db.commit()
+    return {"order_id": order_id, "reserved_until": expires_at}
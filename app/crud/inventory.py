@@ -0,0 +1,498 @@
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Tuple
+from uuid import UUID
+import os
+import random
+
+from core.background import periodic
+from crud.versions import PRODUCTS, bump_collection_versions
+from db.database import AsyncSessionLocal
+from db.models.inventory import InventoryStripe, ReservationStatus, StockReservation
+from db.models.orders import Order, OrderStatus
+from db.models.products import Product
+
+
+# How long stock stays held for a placed order before it is released back on sale
+RESERVATION_TTL_MINUTES = int(os.getenv("RESERVATION_TTL_MINUTES", 30))
+# How often expired reservations are swept, and how many are released per sweep
+RESERVATION_SWEEP_SECONDS = float(os.getenv("RESERVATION_SWEEP_SECONDS", 30))
+RESERVATION_SWEEP_BATCH = int(os.getenv("RESERVATION_SWEEP_BATCH", 500))
+# Upper bound on counter rows per striped product, and how often stripes are evened out
+MAX_STOCK_STRIPES = int(os.getenv("MAX_STOCK_STRIPES", 64))
+STRIPE_REBALANCE_SECONDS = float(os.getenv("STRIPE_REBALANCE_SECONDS", 60))
+
+
+def _merge_lines(lines: Iterable[Tuple[UUID, int]]) -> dict:
+    """Sum quantities per product and sort by product_id, so every transaction locks rows in the same order."""
+    quantities = defaultdict(int)
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return dict(sorted(quantities.items()))
+
+
+async def _stripe_counts(db: AsyncSession, product_ids) -> dict:
+    """Return `{product_id: stock_stripes}` for the given products in one query (0 means not striped)."""
+    result = await db.execute(
+        select(Product.product_id, Product.stock_stripes).where(Product.product_id.in_(list(product_ids)))
+    )
+    return dict(result.all())
+
+
+async def _decrement_stripes(db: AsyncSession, product_id: UUID, stripes: int, quantity: int) -> bool:
+    """
+    Take `quantity` units from a striped product. Returns False if the stripes together hold too little.
+
+    Locks one stripe that can cover the quantity with `FOR UPDATE SKIP LOCKED`, starting the
+    scan at a random stripe, so concurrent reservations spread over the stripes and never wait
+    on one another's stripe. If every such stripe is locked or none can cover the quantity, it
+    locks all stripes in stripe order (waiting for them) and takes from them greedily.
+    """
+    start = random.randrange(stripes)
+    result = await db.execute(
+        select(InventoryStripe.stripe)
+        .where(InventoryStripe.product_id == product_id, InventoryStripe.quantity >= quantity)
+        .order_by((InventoryStripe.stripe + (stripes - start)) % stripes)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    stripe = result.scalar_one_or_none()
+    if stripe is not None:
+        await db.execute(
+            update(InventoryStripe)
+            .where(InventoryStripe.product_id == product_id, InventoryStripe.stripe == stripe)
+            .values(quantity=InventoryStripe.quantity - quantity)
+            .execution_options(synchronize_session=False)
+        )
+        return True
+
+    result = await db.execute(
+        select(InventoryStripe.stripe, InventoryStripe.quantity)
+        .where(InventoryStripe.product_id == product_id)
+        .order_by(InventoryStripe.stripe)
+        .with_for_update()
+    )
+    rows = result.all()
+    if sum(row.quantity for row in rows) < quantity:
+        return False
+
+    remaining = quantity
+    for row in rows:
+        take = min(row.quantity, remaining)
+        if take:
+            await db.execute(
+                update(InventoryStripe)
+                .where(InventoryStripe.product_id == product_id, InventoryStripe.stripe == row.stripe)
+                .values(quantity=InventoryStripe.quantity - take)
+                .execution_options(synchronize_session=False)
+            )
+            remaining -= take
+        if not remaining:
+            break
+    return True
+
+
+async def _decrement_stock(db: AsyncSession, product_id: UUID, quantity: int, stripes: int = 0) -> bool:
+    """Take `quantity` units from a product if enough are left. Returns False otherwise."""
+    if stripes:
+        return await _decrement_stripes(db, product_id, stripes, quantity)
+    result = await db.execute(
+        update(Product)
+        .where(Product.product_id == product_id, Product.stock_quantity >= quantity, Product.deleted_at.is_(None))
+        .values(stock_quantity=Product.stock_quantity - quantity)
+        .returning(Product.product_id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.first() is not None
+
+
+async def _increment_stock(db: AsyncSession, product_id: UUID, quantity: int, stripes: int = 0):
+    """Put `quantity` units back on sale (into a random stripe for striped products)."""
+    if stripes:
+        await db.execute(
+            update(InventoryStripe)
+            .where(InventoryStripe.product_id == product_id, InventoryStripe.stripe == random.randrange(stripes))
+            .values(quantity=InventoryStripe.quantity + quantity)
+            .execution_options(synchronize_session=False)
+        )
+        return
+    await db.execute(
+        update(Product)
+        .where(Product.product_id == product_id)
+        .values(stock_quantity=Product.stock_quantity + quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def reserve_stock(db: AsyncSession, order_id: UUID, lines: Iterable[Tuple[UUID, int]]) -> datetime:
+    """
+    Reserve stock for every line of an order, all or nothing.
+
+    - **db**: The database session for performing database operations.
+    - **order_id**: The order the stock is held for.
+    - **lines**: `(product_id, quantity)` pairs; duplicates are merged.
+    - Each product is decremented with a conditional
+      `UPDATE products SET stock_quantity = stock_quantity - :q WHERE product_id = :id AND stock_quantity >= :q`,
+      in product_id order so concurrent checkouts never deadlock. The row lock is held
+      only until the caller commits.
+    - Striped products (see `set_stock_stripes`) are decremented on one random stripe
+      instead, so concurrent checkouts of a hot product rarely wait on each other.
+    - Records a HELD reservation per product that expires after `RESERVATION_TTL_MINUTES`.
+    - Does not commit; the caller commits together with the order change.
+    - Raises a 409 HTTPException (and rolls back) if any product does not have enough stock.
+    - Returns the expiry time of the reservations.
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=RESERVATION_TTL_MINUTES)
+    quantities = _merge_lines(lines)
+    stripes = await _stripe_counts(db, quantities)
+
+    for product_id, quantity in quantities.items():
+        if not await _decrement_stock(db, product_id, quantity, stripes.get(product_id, 0)):
+            await db.rollback()  # Give back whatever this transaction already took
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Insufficient stock for product {product_id}"
+            )
+
+    await db.execute(insert(StockReservation), [
+        {"order_id": order_id, "product_id": product_id, "quantity": quantity, "expires_at": expires_at}
+        for product_id, quantity in quantities.items()
+    ])
+    return expires_at
+
+
+async def _release(db: AsyncSession, released_rows) -> set:
+    """Return released quantities to stock, in product_id order. Returns the affected order IDs."""
+    order_ids = set()
+    quantities = defaultdict(int)
+    for row in released_rows:
+        order_ids.add(row.order_id)
+        quantities[row.product_id] += row.quantity
+    stripes = await _stripe_counts(db, quantities)
+    for product_id, quantity in sorted(quantities.items()):
+        await _increment_stock(db, product_id, quantity, stripes.get(product_id, 0))
+    return order_ids
+
+
+async def release_order_reservations(db: AsyncSession, order_id: UUID):
+    """
+    Release the held stock of an order (e.g. when it is canceled).
+
+    - **db**: The database session for performing database operations.
+    - **order_id**: The order whose reservations are released.
+    - Does not commit; the caller commits together with the order change.
+    """
+    result = await db.execute(
+        update(StockReservation)
+        .where(StockReservation.order_id == order_id, StockReservation.status == ReservationStatus.HELD)
+        .values(status=ReservationStatus.RELEASED)
+        .returning(StockReservation.order_id, StockReservation.product_id, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    await _release(db, result.all())
+
+
+async def delete_order_reservations(db: AsyncSession, order_id: UUID):
+    """
+    Remove every reservation of an order that is being deleted, returning its held stock first.
+
+    - **db**: The database session for performing database operations.
+    - **order_id**: The order being deleted.
+    - Does not commit; the caller commits together with the order deletion.
+    """
+    await release_order_reservations(db, order_id)
+    await db.execute(
+        delete(StockReservation)
+        .where(StockReservation.order_id == order_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def commit_order_reservations(db: AsyncSession, order_id: UUID):
+    """
+    Mark the held stock of an order as consumed, so it no longer expires.
+
+    - **db**: The database session for performing database operations.
+    - **order_id**: The order whose reservations are committed.
+    - Does not commit; the caller commits together with the order change.
+    """
+    await db.execute(
+        update(StockReservation)
+        .where(StockReservation.order_id == order_id, StockReservation.status == ReservationStatus.HELD)
+        .values(status=ReservationStatus.COMMITTED)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def confirm_order_reservations(db: AsyncSession, order_id: UUID):
+    """
+    Commit the held stock of an order that is being confirmed, unless its hold already expired.
+
+    - **db**: The database session for performing database operations.
+    - **order_id**: The order being confirmed.
+    - Locks the reservations before the caller updates the order row, the same order as the
+      expiry sweep, so a confirmation and a sweep of the same order never deadlock.
+    - Does not commit; the caller commits together with the order change.
+    - Raises a 409 HTTPException (and rolls back) if any of the order's stock was already released.
+    """
+    await commit_order_reservations(db, order_id)
+    released = await db.execute(
+        select(StockReservation.reservation_id)
+        .where(StockReservation.order_id == order_id, StockReservation.status == ReservationStatus.RELEASED)
+        .limit(1)
+    )
+    if released.first() is not None:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Stock reservation expired")
+
+
+def _is_status(value, order_status: OrderStatus) -> bool:
+    return value in (order_status, order_status.name, order_status.value)
+
+
+async def settle_reservations_for_status(db: AsyncSession, order_id: UUID, new_status):
+    """
+    Keep reservations in line with an order status change.
+
+    - Canceling an order releases its stock.
+    - Confirming it commits the reservations, or raises a 409 HTTPException if they expired.
+    - Shipping or delivering it commits the reservations.
+    - Does not commit; the caller commits together with the order change.
+    """
+    if _is_status(new_status, OrderStatus.CANCELED):
+        await release_order_reservations(db, order_id)
+    elif _is_status(new_status, OrderStatus.CONFIRMED):
+        await confirm_order_reservations(db, order_id)
+    elif new_status in (
+        OrderStatus.SHIPPED, OrderStatus.SHIPPED.name, OrderStatus.SHIPPED.value,
+        OrderStatus.DELIVERED, OrderStatus.DELIVERED.name, OrderStatus.DELIVERED.value,
+    ):
+        await commit_order_reservations(db, order_id)
+
+
+async def release_expired_reservations(db: AsyncSession, batch_size: int = RESERVATION_SWEEP_BATCH) -> int:
+    """
+    Release one batch of expired reservations and cancel their abandoned orders.
+
+    - **db**: The database session for performing database operations.
+    - **batch_size**: Maximum number of reservations released in this call.
+    - Claims expired HELD reservations with `FOR UPDATE SKIP LOCKED`, so several workers
+      can sweep at the same time without blocking each other.
+    - Only unconfirmed orders have HELD reservations: confirming, shipping or delivering an
+      order commits them, so placed orders that went through are never touched.
+    - Returns stock, cancels the orders that were still PENDING (never confirmed), and commits.
+    - Returns the number of reservations released.
+    """
+    expired = (
+        select(StockReservation.reservation_id)
+        .where(
+            StockReservation.status == ReservationStatus.HELD,
+            StockReservation.expires_at < datetime.now(timezone.utc),
+        )
+        .order_by(StockReservation.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(StockReservation)
+        .where(StockReservation.reservation_id.in_(expired))
+        .values(status=ReservationStatus.RELEASED)
+        .returning(StockReservation.order_id, StockReservation.product_id, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    if not rows:
+        return 0
+
+    order_ids = await _release(db, rows)
+    await db.execute(
+        update(Order)
+        .where(Order.order_id.in_(order_ids), Order.status == OrderStatus.PENDING)
+        .values(status=OrderStatus.CANCELED, cancellation_reason="Stock reservation expired")
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return len(rows)
+
+
+@periodic(RESERVATION_SWEEP_SECONDS)
+async def release_expired_reservations_job():
+    # Drain every expired reservation, one bounded batch per transaction
+    async with AsyncSessionLocal() as db:
+        while await release_expired_reservations(db) == RESERVATION_SWEEP_BATCH:
+            pass
+
+
+## function to read the sellable stock of a product, whether striped or not
+async def get_available_stock(db: AsyncSession, product_id: UUID) -> int:
+    """
+    Return the units of a product that are on sale.
+
+    - **db**: The database session for performing database operations.
+    - **product_id**: The product to look up.
+    - Reads `Product.stock`, which adds the stripes of a striped product to `stock_quantity`
+      in a single query.
+    - Raises a 404 HTTPException if the product does not exist.
+    """
+    result = await db.execute(select(Product.stock).where(Product.product_id == product_id))
+    available = result.scalar_one_or_none()
+    if available is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    return available
+
+
+def _split(total: int, stripes: int) -> list:
+    """Split `total` units as evenly as possible over `stripes` counters."""
+    share, extra = divmod(total, stripes)
+    return [share + (1 if stripe < extra else 0) for stripe in range(stripes)]
+
+
+async def set_available_stock(db: AsyncSession, product_id: UUID, total: int):
+    """
+    Set the units of a product on sale to `total` (e.g. after a stock count), striped or not.
+
+    - **db**: The database session for performing database operations.
+    - **product_id**: The product to restock.
+    - **total**: The new number of units on sale; replaces the current stock rather than adding to it.
+    - Locks the product row, then its stripes in stripe order (the same order as
+      `set_stock_stripes`), and spreads the units evenly over the stripes of a striped product.
+    - Does not commit; the caller commits together with the rest of the product change.
+    - Raises a 400 HTTPException for negative stock, 404 if the product does not exist.
+    """
+    if total < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Stock cannot be negative")
+    result = await db.execute(
+        select(Product.stock_stripes).where(Product.product_id == product_id).with_for_update()
+    )
+    stripes = result.scalar_one_or_none()
+    if stripes is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+
+    if stripes:
+        result = await db.execute(
+            select(InventoryStripe.stripe)
+            .where(InventoryStripe.product_id == product_id)
+            .order_by(InventoryStripe.stripe)
+            .with_for_update()
+        )
+        for stripe, quantity in zip(result.scalars().all(), _split(total, stripes)):
+            await db.execute(
+                update(InventoryStripe)
+                .where(InventoryStripe.product_id == product_id, InventoryStripe.stripe == stripe)
+                .values(quantity=quantity)
+                .execution_options(synchronize_session=False)
+            )
+    await db.execute(
+        update(Product)
+        .where(Product.product_id == product_id)
+        .values(stock_quantity=0 if stripes else total)
+        .execution_options(synchronize_session=False)
+    )
+
+
+## function to turn striped inventory on or off for a product
+async def set_stock_stripes(db: AsyncSession, product_id: UUID, stripes: int) -> int:
+    """
+    Spread a product's stock over `stripes` counter rows, or fold it back into the product row.
+
+    - **db**: The database session for performing database operations.
+    - **product_id**: The product to (un)stripe.
+    - **stripes**: Number of stripes, between 0 and `MAX_STOCK_STRIPES`; 0 turns striping off.
+    - Locks the product row and its stripes, so in-flight reservations finish first.
+    - Moves all units into the new layout; while striped, `Product.stock_quantity` stays 0.
+    - Commits, and returns the available stock.
+    - Raises a 400 HTTPException for an out-of-range stripe count, 404 if the product does not exist.
+    """
+    if not 0 <= stripes <= MAX_STOCK_STRIPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Stripe count must be between 0 and {MAX_STOCK_STRIPES}"
+        )
+
+    result = await db.execute(
+        select(Product.stock_quantity).where(Product.product_id == product_id).with_for_update()
+    )
+    unstriped = result.scalar_one_or_none()
+    if unstriped is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+
+    result = await db.execute(
+        select(InventoryStripe.quantity)
+        .where(InventoryStripe.product_id == product_id)
+        .order_by(InventoryStripe.stripe)
+        .with_for_update()
+    )
+    total = unstriped + sum(result.scalars().all())
+
+    await db.execute(delete(InventoryStripe).where(InventoryStripe.product_id == product_id))
+    if stripes:
+        await db.execute(insert(InventoryStripe), [
+            {"product_id": product_id, "stripe": stripe, "quantity": quantity}
+            for stripe, quantity in enumerate(_split(total, stripes))
+        ])
+    await db.execute(
+        update(Product)
+        .where(Product.product_id == product_id)
+        .values(stock_quantity=0 if stripes else total, stock_stripes=stripes)
+        .execution_options(synchronize_session=False)
+    )
+    await bump_collection_versions(db, PRODUCTS)
+    await db.commit()
+    return total
+
+
+async def rebalance_stripes(db: AsyncSession, product_id: UUID) -> bool:
+    """
+    Even out the stripes of one product so random picks keep succeeding on the first try.
+
+    - **db**: The database session for performing database operations.
+    - **product_id**: The striped product to rebalance.
+    - Locks the product row, then the stripes in stripe order (the same order as
+      `set_stock_stripes` and the reservation fallback).
+    - Keeps the total; only rewrites stripes if they are uneven. Commits, and returns True if anything moved.
+    """
+    result = await db.execute(
+        select(Product.product_id)
+        .where(Product.product_id == product_id, Product.stock_stripes > 0)
+        .with_for_update()
+    )
+    if result.first() is None:
+        await db.rollback()
+        return False
+    result = await db.execute(
+        select(InventoryStripe.stripe, InventoryStripe.quantity)
+        .where(InventoryStripe.product_id == product_id)
+        .order_by(InventoryStripe.stripe)
+        .with_for_update()
+    )
+    rows = result.all()
+    if not rows or max(row.quantity for row in rows) - min(row.quantity for row in rows) <= 1:
+        await db.rollback()  # Release the locks
+        return False
+
+    total = sum(row.quantity for row in rows)
+    for row, quantity in zip(rows, _split(total, len(rows))):
+        if quantity != row.quantity:
+            await db.execute(
+                update(InventoryStripe)
+                .where(InventoryStripe.product_id == product_id, InventoryStripe.stripe == row.stripe)
+                .values(quantity=quantity)
+                .execution_options(synchronize_session=False)
+            )
+    await db.commit()
+    return True
+
+
+@periodic(STRIPE_REBALANCE_SECONDS)
+async def rebalance_stripes_job():
+    # One short transaction per striped product, so checkouts are blocked only briefly
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Product.product_id).where(Product.stock_stripes > 0))
+        product_ids = result.scalars().all()
+        await db.rollback()
+        for product_id in product_ids:
+            await rebalance_stripes(db, product_id)
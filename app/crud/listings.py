@@ -0,0 +1,139 @@
+from sqlalchemy import delete, literal, select, tuple_, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from db.models import Product, Vendor, product_category_association
+from db.models.listings import ListingScope, ProductListing
+from utlis.pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+
+
+# Columns filled by `refresh_product_listings`, in the order of its INSERT ... SELECT
+_LISTING_COLUMNS = [
+    "scope", "owner_id", "product_id", "product_created_at",
+    "name", "description", "price", "vendor_id", "vendor_name",
+]
+
+
+def _listing_rows(scope: ListingScope, owner_id):
+    """SELECT producing the listing rows of one product for one kind of storefront."""
+    return select(
+        literal(scope, ProductListing.scope.type).label("scope"),
+        owner_id.label("owner_id"),  # Distinct name, or the subquery in `_insert_listings` mixes it up with vendor_id
+        Product.product_id,
+        Product.created_at,
+        Product.name,
+        Product.description,
+        Product.price,
+        Product.vendor_id,
+        Vendor.vendor_name,
+    ).join(Vendor, Vendor.vendor_id == Product.vendor_id)
+
+
+def _insert_listings(*criteria):
+    """
+    `INSERT ... SELECT ... UNION ALL` copying the products matching `criteria` into their vendor's
+    storefront, their primary category and every additional category.
+    """
+    rows = union_all(
+        _listing_rows(ListingScope.VENDOR, Product.vendor_id).where(*criteria),
+        _listing_rows(ListingScope.CATEGORY, Product.category_id).where(*criteria),
+        _listing_rows(ListingScope.CATEGORY, product_category_association.c.category_id)
+        .join(product_category_association, product_category_association.c.product_id == Product.product_id)
+        .where(
+            *criteria,
+            product_category_association.c.category_id != Product.category_id,  # Already listed as primary
+        ),
+    ).subquery()
+    # Selecting from a subquery lets the INSERT add the created_at default column
+    return pg_insert(ProductListing).from_select(_LISTING_COLUMNS, select(rows))
+
+
+async def refresh_product_listings(db: AsyncSession, product_id: UUID):
+    """
+    Rebuild the storefront listings of one product from its current row.
+
+    - **db**: The database session for performing database operations.
+    - **product_id**: The product that was created or updated (flushed, not yet committed).
+    - Deletes the product's listings, then copies it into its vendor's storefront, its primary
+      category and every additional category with a single `INSERT ... SELECT ... UNION ALL`.
+    - Does not commit; the caller commits together with the product change.
+    """
+    await db.execute(delete(ProductListing).where(ProductListing.product_id == product_id))
+    await db.execute(_insert_listings(Product.product_id == product_id))
+
+
+async def backfill_product_listings(db: AsyncSession) -> int:
+    """
+    List every live product on its storefronts, e.g. products created before `product_listings` existed.
+
+    - **db**: The database session for performing database operations.
+    - One `INSERT ... SELECT ... ON CONFLICT DO NOTHING` over all live products, so listings that
+      already exist are kept and running it again is harmless.
+    - Commits, and returns the number of listings added.
+    """
+    # INSERT ... SELECT skips the soft-delete criteria, so filter deleted products here
+    result = await db.execute(
+        _insert_listings(Product.deleted_at.is_(None)).on_conflict_do_nothing(),
+        execution_options={"synchronize_session": False},
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def remove_product_listings(db: AsyncSession, product_id: UUID):
+    """Delete every listing of a product. Does not commit; the caller commits with the product deletion."""
+    await db.execute(delete(ProductListing).where(ProductListing.product_id == product_id))
+
+
+async def rename_vendor_in_listings(db: AsyncSession, vendor_id: UUID, vendor_name: str):
+    """Update the vendor name copied into the vendor's listings. Does not commit."""
+    await db.execute(
+        update(ProductListing)
+        .where(ProductListing.vendor_id == vendor_id)
+        .values(vendor_name=vendor_name)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def get_storefront_page(
+    db: AsyncSession,
+    scope: ListingScope,
+    owner_id: UUID,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> dict:
+    """
+    Retrieve one page of a vendor's or category's storefront.
+
+    - **db**: The database session for performing database operations.
+    - **scope**: `ListingScope.VENDOR` or `ListingScope.CATEGORY`.
+    - **owner_id**: The vendor_id or category_id.
+    - **limit**: Maximum number of listings to return in the page.
+    - **cursor**: Opaque cursor returned with the previous page, or None for the first page.
+    - A single range scan of `ix_product_listings_storefront`, with no joins.
+    - Returns a dict with the listings (`items`) and the cursor for the next page (`next_cursor`).
+    """
+    query = (
+        select(ProductListing)
+        .filter(ProductListing.scope == scope, ProductListing.owner_id == owner_id)
+        .order_by(ProductListing.product_created_at, ProductListing.product_id)
+        .limit(limit + 1)
+    )
+    if cursor:  # Continue right after the last row of the previous page
+        created_at, product_id = decode_cursor(cursor, datetime.fromisoformat, UUID)
+        query = query.filter(
+            tuple_(ProductListing.product_created_at, ProductListing.product_id) > tuple_(created_at, product_id)
+        )
+
+    result = await db.execute(query)
+    listings = result.scalars().all()
+
+    next_cursor = None
+    if len(listings) > limit:  # There is at least one more page
+        listings = listings[:limit]
+        next_cursor = encode_cursor(listings[-1].product_created_at, listings[-1].product_id)
+
+    return {"items": listings, "next_cursor": next_cursor}
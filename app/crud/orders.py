@@ -1,8 +1,90 @@
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from db.models.orders import Order, OrderItem
+from sqlalchemy.orm import selectinload
+from db.models.orders import Order, OrderItem, OrderStatus
 from schemas.orders import OrderCreate
+from crud.inventory import confirm_order_reservations, delete_order_reservations, settle_reservations_for_status
 from fastapi import HTTPException, status
+from typing import List
+from uuid import UUID
+import uuid
+
+
+# Loader options for every Order query whose result is serialized with `order_items`.
+# Items come in one extra `SELECT ... WHERE order_id IN (...)` per result set instead of
+# one lazy load per order (which raises MissingGreenlet under AsyncSession anyway).
+ORDER_LOAD_OPTIONS = (selectinload(Order.order_items),)
+
+
+def select_orders():
+    """Base query for orders with their items eagerly loaded."""
+    return select(Order).options(*ORDER_LOAD_OPTIONS)
+
+
+async def load_order(db: AsyncSession, order_id):
+    """Reload an order and its items after a write, overwriting any stale state in the session."""
+    result = await db.execute(
+        select_orders().filter(Order.order_id == order_id).execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+def _merge_items(order_items) -> dict:
+    """
+    Combine lines for the same product into one (order items are unique per product).
+
+    Returns `{product_id: (quantity, price)}` in first-seen order. Raises a 400 HTTPException
+    if the same product is listed at two different prices, since the lines cannot be merged then.
+    """
+    merged = {}
+    for item in order_items:
+        if item.product_id in merged:
+            quantity, price = merged[item.product_id]
+            if price != item.price:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Product {item.product_id} is listed twice with different prices",
+                )
+            merged[item.product_id] = (quantity + item.quantity, price)
+        else:
+            merged[item.product_id] = (item.quantity, item.price)
+    return merged
+
+
+def _order_rows(order_data: OrderCreate):
+    """Build the insert rows for one order and its items, with a client-generated order_id."""
+    order_id = uuid.uuid4()
+    order_row = {
+        "order_id": order_id,
+        "user_id": order_data.user_id,  # User who placed the order
+        "total_amount": order_data.total_amount,  # Total cost of the order
+        "shipping_address": order_data.shipping_address,  # Shipping address for the order
+    }
+    item_rows = [
+        {
+            "order_item_id": uuid.uuid4(),
+            "order_id": order_id,  # Associate the item with the new order
+            "product_id": product_id,  # ID of the product
+            "quantity": quantity,  # Quantity of the product ordered (duplicate lines merged)
+            "price": price,  # Price per unit of the product
+        }
+        for product_id, (quantity, price) in _merge_items(order_data.order_items).items()
+    ]
+    return order_row, item_rows
+
+
+async def _insert_orders(db: AsyncSession, order_rows: list, item_rows: list):
+    """Insert orders and items with one multi-row INSERT each, then commit once."""
+    try:
+        await db.execute(insert(Order), order_rows)  # executemany, batched into multi-row INSERTs
+        if item_rows:
+            await db.execute(insert(OrderItem), item_rows)
+        await db.commit()  # Orders and items become visible together
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid order data (unknown user or product)")
+
 
 ## create new order
 async def create_order(db: AsyncSession, order_data: OrderCreate):
@@ -11,35 +93,38 @@ async def create_order(db: AsyncSession, order_data: OrderCreate):
 
     - **db**: The database session for performing database operations.
     - **order_data**: An OrderCreate schema containing the details of the order.
-    - Steps:
-        1. Create and save the order with basic information (user, total amount, status, shipping address).
-        2. Add associated order items to the order.
-    - Commits the transaction after saving the order and its items.
-    - Returns the newly created order.
-    """
-    # Create the Order
-    new_order = Order(
-        user_id=order_data.user_id,  # User who placed the order
-        total_amount=order_data.total_amount,  # Total cost of the order
-        status=order_data.status,  # Current status of the order
-        shipping_address=order_data.shipping_address  # Shipping address for the order
-    )
-    db.add(new_order)  # Add the order to the database session
-    await db.commit()  # Commit the order to the database
-    await db.refresh(new_order)  # Refresh the order instance to get the latest data
+    - The order_id is generated client-side, so the order and all of its items are written
+      in a single transaction: one INSERT for the order, one multi-row INSERT for the items.
+    - Raises a 400 HTTPException if the user or a product does not exist.
+    - Returns the newly created order with its items.
+    """
+    order_row, item_rows = _order_rows(order_data)
+    await _insert_orders(db, [order_row], item_rows)
+    return await load_order(db, order_row["order_id"])  # Return the created order with its items
 
-    # Add Order Items
-    for item in order_data.order_items:  # Iterate over the provided order items
-        order_item = OrderItem(
-            order_id=new_order.order_id,  # Associate the item with the newly created order
-            product_id=item.product_id,  # ID of the product
-            quantity=item.quantity,  # Quantity of the product ordered
-            price=item.price  # Price per unit of the product
-        )
-        db.add(order_item)  # Add the order item to the database session
 
-    await db.commit()  # Commit the order items to the database
-    return new_order  # Return the created order
+## create many orders at once
+async def create_orders_batch(db: AsyncSession, orders: List[OrderCreate]) -> List[UUID]:
+    """
+    Create many orders in a single transaction.
+
+    - **db**: The database session for performing database operations.
+    - **orders**: The OrderCreate schemas to insert.
+    - All orders go in one multi-row INSERT and all items in another, so the number of
+      round-trips does not grow with the batch size. Either every order is created or none is.
+    - Lines for the same product within an order are merged into one.
+    - Raises a 400 HTTPException if a user or a product does not exist, or if an order lists
+      the same product at two different prices.
+    - Returns the IDs of the created orders, in input order.
+    """
+    order_rows, item_rows = [], []
+    for order_data in orders:
+        order_row, rows = _order_rows(order_data)
+        order_rows.append(order_row)
+        item_rows.extend(rows)
+
+    await _insert_orders(db, order_rows, item_rows)
+    return [row["order_id"] for row in order_rows]
 
 
 async def get_all_orders(db: AsyncSession, status: str = None):
@@ -48,10 +133,10 @@ async def get_all_orders(db: AsyncSession, status: str = None):
 
     - **db**: The database session for performing database operations.
     - **status**: (Optional) Filter orders by their status (e.g., 'pending', 'shipped').
-    - Executes a query to fetch orders from the database.
+    - Executes a query to fetch orders from the database, loading their items with one extra query.
     - Returns a list of orders matching the criteria.
     """
-    query = select(Order)  # Base query to select all orders
+    query = select_orders()  # Base query to select all orders, items included
     if status:  # Add a filter if a specific status is provided
         query = query.filter(Order.status == status)
 
@@ -69,7 +154,7 @@ async def get_order_by_id(db: AsyncSession, order_id: str):
     - Raises a 404 HTTPException if the order is not found.
     - Returns the order if found.
     """
-    result = await db.execute(select(Order).filter(Order.order_id == order_id))  # Query for the order by ID
+    result = await db.execute(select_orders().filter(Order.order_id == order_id))  # Query for the order by ID
     order = result.scalars().first()  # Retrieve the first result
 
     if not order:  # Check if the order exists
@@ -88,6 +173,7 @@ async def update_order(db: AsyncSession, order_id: str, status: str = None, canc
     - **cancellation_reason**: (Optional) The reason for canceling the order.
     - Checks if the order exists and raises a 404 HTTPException if not found.
     - Updates the provided fields and commits the changes.
+    - Canceling releases the order's reserved stock; confirming, shipping or delivering commits it.
     - Returns the updated order.
     """
     result = await db.execute(select(Order).filter(Order.order_id == order_id))  # Query for the order by ID
@@ -96,16 +182,45 @@ async def update_order(db: AsyncSession, order_id: str, status: str = None, canc
     if not order:  # Check if the order exists
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
 
-    # Update the order status if provided
+    # Update the order status if provided, releasing or committing its reserved stock.
+    # The reservations are settled before the order row is written: they are locked first,
+    # as the expiry sweep does, so a cancellation and a sweep of the same order never deadlock.
     if status:
+        await settle_reservations_for_status(db, order.order_id, status)
         order.status = status
     # Update the cancellation reason if provided
     if cancellation_reason:
         order.cancellation_reason = cancellation_reason
 
     await db.commit()  # Commit the changes to the database
-    await db.refresh(order)  # Refresh the order instance to get the updated data
-    return order  # Return the updated order
+    return await load_order(db, order_id)  # Reload the updated order with its items
+
+
+async def confirm_order(db: AsyncSession, order_id: UUID):
+    """
+    Confirm a placed order (e.g. once it is paid), committing its reserved stock.
+
+    - **db**: The database session for performing database operations.
+    - **order_id**: The unique identifier of the order.
+    - Commits the order's HELD reservations first, then flips the order from PENDING to
+      CONFIRMED with a conditional UPDATE, in one transaction. A confirmed order is never
+      canceled by the reservation expiry sweep.
+    - Raises a 409 HTTPException if the order is not PENDING or its reservation already expired.
+    - Returns the confirmed order.
+    """
+    await confirm_order_reservations(db, order_id)  # Raises 409 if the hold expired
+    confirmed = await db.execute(
+        update(Order)
+        .where(Order.order_id == order_id, Order.status == OrderStatus.PENDING)
+        .values(status=OrderStatus.CONFIRMED)
+        .returning(Order.order_id)
+        .execution_options(synchronize_session=False)
+    )
+    if confirmed.first() is None:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Only pending orders can be confirmed")
+    await db.commit()
+    return await load_order(db, order_id)
 
 
 async def delete_order(db: AsyncSession, order_id: str):
@@ -115,17 +230,25 @@ async def delete_order(db: AsyncSession, order_id: str):
     - **db**: The database session for performing database operations.
     - **order_id**: The unique identifier of the order.
     - Checks if the order exists and raises a 404 HTTPException if not found.
-    - Deletes the order and commits the transaction.
+    - Returns its held stock and removes its reservations (locked before the order row, as the
+      expiry sweep does), then deletes its items and the order, and commits the transaction.
     - Returns a success message upon deletion.
     """
-    result = await db.execute(select(Order).filter(Order.order_id == order_id))  # Query for the order by ID
-    order = result.scalars().first()  # Retrieve the first result
+    result = await db.execute(select(Order.order_id).filter(Order.order_id == order_id))  # Query for the order by ID
+    order_id = result.scalar()  # The order's UUID, or None
 
-    if not order:  # Check if the order exists
+    if order_id is None:  # Check if the order exists
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
 
-    # Delete the order
-    await db.delete(order)  # Delete the order from the database session
+    # Delete the order's reservations and items, then the order itself
+    try:
+        await delete_order_reservations(db, order_id)
+        await db.execute(delete(OrderItem).where(OrderItem.order_id == order_id).execution_options(synchronize_session=False))
+        await db.execute(delete(Order).where(Order.order_id == order_id).execution_options(synchronize_session=False))
+    except IntegrityError:
+        # Still referenced elsewhere (e.g. by a payment)
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Order is referenced by other records")
     await db.commit()  # Commit the changes to the database
     return {"message": "Order deleted successfully"}  # Return a success message
 
@@ -0,0 +1,166 @@
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+import os
+
+from core.background import periodic
+from core.mailer import SMTP_POOL_SIZE, smtp_pool
+from db.database import AsyncSessionLocal
+from db.models.outbox import EmailOutbox, EmailStatus
+from utlis.utils import build_email_message
+
+
+logger = logging.getLogger(__name__)
+
+# How often the outbox is drained, and how many emails are claimed per batch
+EMAIL_DISPATCH_SECONDS = float(os.getenv("EMAIL_DISPATCH_SECONDS", 5))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 50))
+# A claimed email is retried by any worker if it is not settled within this many seconds (e.g. a crash)
+EMAIL_LEASE_SECONDS = float(os.getenv("EMAIL_LEASE_SECONDS", 300))
+# Retries back off exponentially from EMAIL_RETRY_BASE_SECONDS up to EMAIL_RETRY_MAX_SECONDS
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 8))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", 3600))
+# Sent and failed emails are kept this long (e.g. for support questions), then purged in batches
+EMAIL_RETENTION_HOURS = float(os.getenv("EMAIL_RETENTION_HOURS", 72))
+EMAIL_PURGE_SECONDS = float(os.getenv("EMAIL_PURGE_SECONDS", 600))
+EMAIL_PURGE_BATCH = int(os.getenv("EMAIL_PURGE_BATCH", 1000))
+
+
+def enqueue_email(db: AsyncSession, email_type: str, recipient: str, **context) -> EmailOutbox:
+    """
+    Queue an email in the outbox.
+
+    - **db**: The database session of the change that triggers the email.
+    - **email_type**: Key into `EMAIL_SUBJECTS` / `EMAIL_TEMPLATES` (e.g. "Welcome").
+    - **recipient**: Address to send the email to.
+    - **context**: Template values, e.g. `username` and `link`.
+    - Does not commit: the email is stored by the caller's commit, together with the change,
+      so it is sent if and only if the change is saved. Delivery happens in the background.
+    """
+    email = EmailOutbox(email_type=email_type, recipient=recipient, context=context)
+    db.add(email)
+    return email
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_SECONDS))
+
+
+async def _deliver(queue: asyncio.Queue, results: dict):
+    """Send queued emails one after another over one pooled connection."""
+    while not queue.empty():
+        email = queue.get_nowait()
+        try:
+            message = build_email_message(email.email_type, email=email.recipient, **email.context)
+            await smtp_pool.send(message)
+            results[email.email_id] = None
+        except Exception as e:
+            results[email.email_id] = f"{type(e).__name__}: {e}"[:500]
+
+
+async def dispatch_outbox(db: AsyncSession, batch_size: int = EMAIL_BATCH_SIZE) -> int:
+    """
+    Deliver one batch of due emails from the outbox.
+
+    - **db**: The database session for performing database operations.
+    - **batch_size**: Maximum number of emails sent in this call.
+    - Claims due PENDING emails with `FOR UPDATE SKIP LOCKED`, pushes their next attempt out by
+      `EMAIL_LEASE_SECONDS` and commits, so no transaction stays open while talking to SMTP and
+      several workers can dispatch at once.
+    - Sends the batch over `SMTP_POOL_SIZE` persistent connections.
+    - Marks delivered emails SENT; failed ones are retried with exponential backoff and marked
+      FAILED after `EMAIL_MAX_ATTEMPTS` attempts. Settled emails keep no template values, so
+      secrets such as reset links only stay in the outbox until delivery.
+    - Returns the number of emails claimed.
+    """
+    now = datetime.now(timezone.utc)
+    due = (
+        select(EmailOutbox.email_id)
+        .where(EmailOutbox.status == EmailStatus.PENDING, EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.email_id.in_(due))
+        .values(attempts=EmailOutbox.attempts + 1, next_attempt_at=now + timedelta(seconds=EMAIL_LEASE_SECONDS))
+        .returning(EmailOutbox)
+        .execution_options(synchronize_session=False)
+    )
+    emails = result.scalars().all()
+    await db.commit()
+    if not emails:
+        return 0
+
+    queue = asyncio.Queue()
+    for email in emails:
+        queue.put_nowait(email)
+    results = {}
+    await asyncio.gather(*(_deliver(queue, results) for _ in range(min(SMTP_POOL_SIZE, len(emails)))))
+
+    now = datetime.now(timezone.utc)
+    for email in emails:
+        error = results.get(email.email_id, "Not attempted")
+        # Settled emails drop their template values (e.g. password reset links) right away
+        if error is None:
+            values = {"status": EmailStatus.SENT, "sent_at": now, "last_error": None, "context": {}}
+        elif email.attempts >= EMAIL_MAX_ATTEMPTS:
+            logger.error("Giving up on email %s to %s: %s", email.email_id, email.recipient, error)
+            values = {"status": EmailStatus.FAILED, "last_error": error, "context": {}}
+        else:
+            values = {"next_attempt_at": now + _retry_delay(email.attempts), "last_error": error}
+        await db.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.email_id == email.email_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    return len(emails)
+
+
+@periodic(EMAIL_DISPATCH_SECONDS)
+async def dispatch_outbox_job():
+    # Keep sending full batches until the outbox has nothing due
+    async with AsyncSessionLocal() as db:
+        while await dispatch_outbox(db) == EMAIL_BATCH_SIZE:
+            pass
+
+
+async def purge_settled_emails(db: AsyncSession, batch_size: int = EMAIL_PURGE_BATCH) -> int:
+    """
+    Delete one batch of sent or failed emails older than `EMAIL_RETENTION_HOURS`.
+
+    - **db**: The database session for performing database operations.
+    - **batch_size**: Maximum number of emails deleted in this call.
+    - Claims the oldest settled emails through `ix_email_outbox_settled_updated_at` with
+      `FOR UPDATE SKIP LOCKED`, so several workers can purge at once, and commits.
+    - Returns the number of emails deleted.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=EMAIL_RETENTION_HOURS)
+    settled = (
+        select(EmailOutbox.email_id)
+        .where(EmailOutbox.status != EmailStatus.PENDING, EmailOutbox.updated_at <= cutoff)
+        .order_by(EmailOutbox.updated_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        delete(EmailOutbox).where(EmailOutbox.email_id.in_(settled)).execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+@periodic(EMAIL_PURGE_SECONDS)
+async def purge_settled_emails_job():
+    # Bounded batches, one transaction each, so the outbox is never locked for long
+    async with AsyncSessionLocal() as db:
+        while await purge_settled_emails(db) == EMAIL_PURGE_BATCH:
+            pass
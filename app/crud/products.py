@@ -1,9 +1,143 @@
+from sqlalchemy import Integer, and_, case, cast, exists, func, literal_column, null, or_, tuple_, union, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from db.models import Product
-from schemas.products import ProductCreate, ProductUpdate
+from db.database import AsyncSessionLocal, async_engine
+from db.models import InventoryStripe, Product, product_category_association
+from db.models.products import SEARCH_CONFIG
+from db.soft_delete import soft_delete
+from schemas.products import ProductCreate, ProductFilters, ProductUpdate
+from core.cache import cache_type, get_cache, publish, subscribe
+from crud.inventory import get_available_stock, set_available_stock
+from crud.listings import refresh_product_listings, remove_product_listings
+from crud.versions import PRODUCTS, bump_collection_versions, get_collection_version, vendor_products
+from core.search import InvertedIndex, SuggestIndex, tokenize
+from utlis.pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+from utlis.streaming import STREAM_YIELD_PER
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
 from uuid import UUID
 from fastapi import HTTPException
+import json
+import os
+
+
+# Immutable copy of a product row, safe to share between requests once the session is gone.
+# Stock is left out: checkouts change it without touching the row, so it is always read live.
+@cache_type
+@dataclass(frozen=True, slots=True)
+class ProductSnapshot:
+    product_id: UUID
+    vendor_id: UUID
+    category_id: UUID
+    name: str
+    description: Optional[str]
+    price: Decimal
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_product(cls, product: Product) -> "ProductSnapshot":
+        return cls(
+            product_id=product.product_id,
+            vendor_id=product.vendor_id,
+            category_id=product.category_id,
+            name=product.name,
+            description=product.description,
+            price=product.price,
+            created_at=product.created_at,
+            updated_at=product.updated_at,
+        )
+
+
+# Read-through cache of product snapshots keyed by product_id (shared across workers when CACHE_URL is set)
+product_cache = get_cache(
+    "products",
+    maxsize=int(os.getenv("PRODUCT_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("PRODUCT_CACHE_TTL", 60)),
+)
+
+# PostgreSQL searches its GIN-indexed tsvector; other databases (e.g. SQLite in tests) fall back
+# to an in-process inverted index, loaded at startup and kept in step by the CRUD functions below
+POSTGRES_SEARCH = async_engine.dialect.name == "postgresql"
+MAX_SEARCH_TERMS = int(os.getenv("MAX_SEARCH_TERMS", 8))  # Extra query words are ignored
+product_search_index = InvertedIndex()
+
+# Autocomplete over product names, held in every worker; changes are broadcast so all workers stay in step
+SUGGEST_MAX_EDITS = int(os.getenv("SUGGEST_MAX_EDITS", 2))  # Most typos tolerated in a long prefix
+SUGGEST_CHANNEL = os.getenv("SUGGEST_CHANNEL", "ecom:products:suggest")
+product_suggest_index = SuggestIndex()
+
+
+def _index_product(product: Product):
+    if not POSTGRES_SEARCH:
+        # Same weights as ts_rank_cd gives the A (name) and B (description) labels
+        product_search_index.add(product.product_id, (product.name, 1.0), (product.description, 0.4))
+
+
+def _unindex_product(product_id: UUID):
+    if not POSTGRES_SEARCH:
+        product_search_index.remove(product_id)
+
+
+def _apply_suggest_change(payload: str):
+    change = json.loads(payload)
+    product_id = UUID(change["product_id"])
+    if change["old_name"] is not None:
+        product_suggest_index.remove(product_id, change["old_name"])
+    if change["new_name"] is not None:
+        product_suggest_index.add(product_id, change["new_name"])
+
+
+async def _suggest_changed(product_id: UUID, old_name: Optional[str], new_name: Optional[str]):
+    """Apply a product name change to this worker's suggest index and broadcast it to the others."""
+    if old_name == new_name:
+        return
+    payload = json.dumps({"product_id": str(product_id), "old_name": old_name, "new_name": new_name})
+    _apply_suggest_change(payload)
+    await publish(SUGGEST_CHANNEL, payload)  # Our own copy comes back too; applying it again is a no-op
+
+
+subscribe(SUGGEST_CHANNEL, _apply_suggest_change)
+
+
+async def load_product_search_index():
+    """
+    Fill the in-process search indexes from the database at startup.
+
+    - The suggest index only needs `(product_id, name)`, streamed `STREAM_YIELD_PER` rows at a time.
+    - The full-text fallback index is only loaded when the database is not PostgreSQL.
+    """
+    product_suggest_index.clear()
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(Product.product_id, Product.name).execution_options(yield_per=STREAM_YIELD_PER)
+        )
+        async for product_id, name in result:
+            product_suggest_index.add(product_id, name)
+
+    if POSTGRES_SEARCH:
+        return
+    product_search_index.clear()
+    async with AsyncSessionLocal() as db:
+        async for product in stream_products_from_db(db):
+            _index_product(product)
+
+
+def suggest_products(prefix: str, limit: int) -> list:
+    """
+    Autocomplete product names from the in-process suggest index (no database query).
+
+    - **prefix**: What the user typed so far; matched at the start of any word of the name,
+      tolerating up to `SUGGEST_MAX_EDITS` typos after the first two characters, depending on its length.
+    - **limit**: Maximum number of suggestions.
+    - Returns a list of `{"product_id", "name"}` dicts, closest matches first.
+    """
+    return [
+        {"product_id": product_id, "name": name}
+        for product_id, name, _ in product_suggest_index.suggest(prefix, limit, SUGGEST_MAX_EDITS)
+    ]
 
 
 async def create_product_in_db(db: AsyncSession, product_data: ProductCreate, vendor_id: UUID) -> Product:
@@ -14,43 +148,282 @@ async def create_product_in_db(db: AsyncSession, product_data: ProductCreate, ve
     - **product_data**: A ProductCreate schema containing the data for the new product.
     - **vendor_id**: The ID of the vendor creating the product.
     - Creates a new product instance, associates it with the vendor, and commits it to the database.
+    - Lists it on its vendor and category storefronts in the same transaction.
     - Refreshes the product instance to get the latest data from the database.
     - Returns the newly created product.
     """
-    new_product = Product(**product_data.dict(), vendor_id=vendor_id)  # Create a new product and associate it with the vendor
+    fields = product_data.dict()
+    fields["stock_quantity"] = fields.pop("stock")  # New products are not striped
+    new_product = Product(**fields, vendor_id=vendor_id)  # Create a new product and associate it with the vendor
     db.add(new_product)  # Add the product to the database session
+    await db.flush()  # Insert the row so its storefront listings can be copied from it
+    await refresh_product_listings(db, new_product.product_id)
+    await bump_collection_versions(db, PRODUCTS, vendor_products(vendor_id))
     await db.commit()  # Commit the changes to the database
     await db.refresh(new_product)  # Refresh the instance to retrieve the latest data
+    _index_product(new_product)
+    await _suggest_changed(new_product.product_id, None, new_product.name)
     return new_product
 
 
-async def get_all_products_from_db(db: AsyncSession):
+# Lower edges of the price facet buckets; the last bucket is open-ended
+PRICE_BUCKETS = [float(edge) for edge in os.getenv("PRICE_BUCKETS", "0,10,25,50,100,250,500,1000").split(",")]
+
+
+def _product_filter_criteria(filters: Optional[ProductFilters]) -> list:
+    """Translate the listing filters into WHERE criteria (all of them must hold)."""
+    if filters is None:
+        return []
+    criteria = []
+    if filters.category_id is not None:  # Primary category, or one of the additional ones
+        criteria.append(or_(
+            Product.category_id == filters.category_id,
+            Product.product_id.in_(
+                select(product_category_association.c.product_id)
+                .where(product_category_association.c.category_id == filters.category_id)
+            ),
+        ))
+    if filters.vendor_id is not None:
+        criteria.append(Product.vendor_id == filters.vendor_id)
+    if filters.min_price is not None:
+        criteria.append(Product.price >= filters.min_price)
+    if filters.max_price is not None:
+        criteria.append(Product.price <= filters.max_price)
+    if filters.in_stock is not None:
+        # Striped products keep their units in inventory_stripes instead of stock_quantity
+        has_stock = or_(
+            Product.stock_quantity > 0,
+            exists().where(InventoryStripe.product_id == Product.product_id, InventoryStripe.quantity > 0),
+        )
+        criteria.append(has_stock if filters.in_stock else ~has_stock)
+    return criteria
+
+
+async def get_product_facets(db: AsyncSession, filters: Optional[ProductFilters] = None) -> dict:
     """
-    Retrieve all products from the database.
+    Count the products matching `filters` per category, per vendor and per price bucket.
 
     - **db**: The database session for performing database operations.
-    - Executes a query to select all products from the database.
-    - Returns a list of all products.
+    - **filters**: The listing filters; the counts describe the filtered products.
+    - All three facets come from a single query. Categories count each product once under its
+      primary category and once under each additional category (`product_category`), the same
+      categories the `category_id` filter matches. Vendors and price buckets come from
+      `GROUP BY GROUPING SETS ((vendor_id), (bucket))`.
+    - Returns a dict shaped like the ProductFacets schema.
     """
-    result = await db.execute(select(Product))  # Execute a query to select all products
-    return result.scalars().all()  # Retrieve and return all product objects
+    bucket = case(
+        *[(Product.price < edge, index) for index, edge in enumerate(PRICE_BUCKETS[1:])],
+        else_=len(PRICE_BUCKETS) - 1,
+    ).label("bucket")
+    # Bucket in a CTE, so GROUP BY refers to a column rather than repeating the parameterised CASE
+    matching = (
+        select(Product.product_id, Product.category_id, Product.vendor_id, bucket)
+        .filter(*_product_filter_criteria(filters))
+        .cte("matching")
+    )
+    # UNION (not UNION ALL): a product whose additional category repeats its primary one counts once
+    product_categories = union(
+        select(matching.c.product_id, matching.c.category_id),
+        select(product_category_association.c.product_id, product_category_association.c.category_id)
+        .join(matching, matching.c.product_id == product_category_association.c.product_id),
+    ).subquery()
+    no_uuid = cast(null(), Product.vendor_id.type)
+    query = union_all(
+        select(product_categories.c.category_id, no_uuid, cast(null(), Integer), func.count())
+        .group_by(product_categories.c.category_id),
+        select(no_uuid, matching.c.vendor_id, matching.c.bucket, func.count())
+        .group_by(func.grouping_sets(tuple_(matching.c.vendor_id), tuple_(matching.c.bucket))),
+    )
+    facets = {"categories": [], "vendors": [], "price": []}
+    for category_id, vendor_id, bucket_index, count in (await db.execute(query)).all():
+        # Each row belongs to exactly one facet; the other columns are NULL
+        if category_id is not None:
+            facets["categories"].append({"id": category_id, "count": count})
+        elif vendor_id is not None:
+            facets["vendors"].append({"id": vendor_id, "count": count})
+        elif bucket_index is not None:
+            facets["price"].append({
+                "min_price": PRICE_BUCKETS[bucket_index],
+                "max_price": PRICE_BUCKETS[bucket_index + 1] if bucket_index + 1 < len(PRICE_BUCKETS) else None,
+                "count": count,
+            })
+    facets["categories"].sort(key=lambda facet: -facet["count"])
+    facets["vendors"].sort(key=lambda facet: -facet["count"])
+    facets["price"].sort(key=lambda facet: facet["min_price"])
+    return facets
 
 
-async def get_product_by_id_from_db(db: AsyncSession, product_id: UUID) -> Product:
+async def get_all_products_from_db(
+    db: AsyncSession,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    filters: Optional[ProductFilters] = None,
+    with_facets: bool = False,
+) -> dict:
+    """
+    Retrieve one page of products using keyset (cursor) pagination.
+
+    - **db**: The database session for performing database operations.
+    - **limit**: Maximum number of products to return in the page.
+    - **cursor**: Opaque cursor returned with the previous page, or None for the first page.
+    - **filters**: Optional category, vendor, price range and in-stock filters, combined with AND.
+    - **with_facets**: Also return facet counts (see `get_product_facets`); only done on the
+      first page, since the counts do not change from page to page.
+    - Products are ordered by `(created_at, product_id)`, which is served by the
+      `ix_products_created_at_product_id` index, so every page costs the same as the first one.
+    - Fetches one extra row to find out whether another page exists.
+    - Returns a dict with the products (`items`), the cursor for the next page (`next_cursor`)
+      and the `facets`, if requested.
+    """
+    query = (
+        select(Product)
+        .filter(*_product_filter_criteria(filters))
+        .order_by(Product.created_at, Product.product_id)
+        .limit(limit + 1)
+    )
+    if cursor:  # Continue right after the last row of the previous page
+        created_at, product_id = decode_cursor(cursor, datetime.fromisoformat, UUID)
+        query = query.filter(tuple_(Product.created_at, Product.product_id) > tuple_(created_at, product_id))
+
+    result = await db.execute(query)  # Execute the page query
+    products = result.scalars().all()
+
+    next_cursor = None
+    if len(products) > limit:  # There is at least one more page
+        products = products[:limit]
+        next_cursor = encode_cursor(products[-1].created_at, products[-1].product_id)
+
+    facets = await get_product_facets(db, filters) if with_facets and not cursor else None
+    return {"items": products, "next_cursor": next_cursor, "facets": facets}
+
+
+async def stream_products_from_db(db: AsyncSession):
+    """
+    Stream every product from the database using a server-side cursor.
+
+    - **db**: The database session for performing database operations.
+    - Rows are fetched `STREAM_YIELD_PER` at a time, so memory stays flat regardless of catalog size.
+    - Yields products in `(created_at, product_id)` order.
+    """
+    result = await db.stream_scalars(
+        select(Product)
+        .order_by(Product.created_at, Product.product_id)
+        .execution_options(yield_per=STREAM_YIELD_PER)
+    )
+    async for product in result:
+        yield product
+
+
+async def search_products_in_db(db: AsyncSession, q: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> dict:
+    """
+    Full-text search over product names and descriptions, best matches first.
+
+    - **db**: The database session for performing database operations.
+    - **q**: The search text; every word must match, and each is matched as a prefix
+      (so "blue sh" finds "Blue Shirt").
+    - **limit**: Maximum number of products to return in the page.
+    - **cursor**: Opaque cursor returned with the previous page, or None for the first page.
+    - On PostgreSQL, matches `search_vector @@ to_tsquery('blue:* & sh:*')` through the GIN index
+      and ranks with `ts_rank_cd`; name matches outrank description matches.
+    - Pages are keyed on `(rank, product_id)`.
+    - Returns a dict with the products (`items`) and the cursor for the next page (`next_cursor`).
+    """
+    terms = tokenize(q)[:MAX_SEARCH_TERMS]
+    if not terms:
+        return {"items": [], "next_cursor": None}
+    after = decode_cursor(cursor, float, UUID) if cursor else None
+
+    if POSTGRES_SEARCH:
+        search_vector = literal_column("products.search_vector")
+        tsquery = func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+        rank = func.ts_rank_cd(search_vector, tsquery)
+        query = (
+            select(Product, rank.label("rank"))
+            .filter(search_vector.op("@@")(tsquery))
+            .order_by(rank.desc(), Product.product_id)
+            .limit(limit + 1)
+        )
+        if after:  # Continue right after the last row of the previous page
+            last_rank, last_id = after
+            query = query.filter(or_(rank < last_rank, and_(rank == last_rank, Product.product_id > last_id)))
+        hits = (await db.execute(query)).all()
+    else:
+        ranked = product_search_index.search(terms)
+        if after:
+            last_rank, last_id = after
+            ranked = [(score, product_id) for score, product_id in ranked if (-score, product_id) > (-last_rank, last_id)]
+        ranked = ranked[:limit + 1]
+        result = await db.execute(select(Product).filter(Product.product_id.in_([product_id for _, product_id in ranked])))
+        products = {product.product_id: product for product in result.scalars().all()}
+        hits = [(products[product_id], score) for score, product_id in ranked if product_id in products]
+
+    next_cursor = None
+    if len(hits) > limit:  # There is at least one more page
+        hits = hits[:limit]
+        next_cursor = encode_cursor(hits[-1][1], hits[-1][0].product_id)
+
+    return {"items": [product for product, _ in hits], "next_cursor": next_cursor}
+
+
+async def get_product_version(db: AsyncSession, product_id: UUID) -> datetime:
+    """
+    Return when a product last changed, for conditional GETs.
+
+    - **db**: The database session for performing database operations.
+    - **product_id**: UUID of the product.
+    - Uses the cached snapshot when there is one, otherwise reads only
+      `coalesce(updated_at, created_at)` through the primary key, without loading the row.
+    - Raises a 404 HTTPException if the product is not found.
+    """
+    snapshot = await product_cache.get(product_id)
+    if snapshot is not None:
+        return snapshot.updated_at or snapshot.created_at
+    result = await db.execute(
+        select(func.coalesce(Product.updated_at, Product.created_at)).filter(Product.product_id == product_id)
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return row[0]
+
+
+async def get_products_collection_version(db: AsyncSession, vendor_id: Optional[UUID] = None) -> int:
+    """
+    Return the version of the product collection, or of one vendor's products.
+
+    - Bumped in the same transaction as every product create, update and delete, so it is a
+      single primary key read instead of an aggregate over the products table.
+    - Stock movements from checkouts do not bump it (that would serialize checkouts on one row);
+      list ETags add a short time window instead, so stock in list responses lags by at most that.
+    """
+    return await get_collection_version(db, vendor_products(vendor_id) if vendor_id else PRODUCTS)
+
+
+async def get_product_by_id_from_db(db: AsyncSession, product_id: UUID) -> dict:
     """
     Retrieve a product by its ID.
 
     - **db**: The database session for performing database operations.
     - **product_id**: UUID of the product to retrieve.
-    - Executes a query to select a product by its ID.
+    - Serves the product from `product_cache` when possible; on a miss, queries the
+      database and caches an immutable snapshot of the row.
+    - Adds the current stock with one primary key read, so checkouts and released
+      reservations show up immediately instead of after the cache TTL.
     - Raises a 404 HTTPException if the product is not found.
-    - Returns the product if found.
+    - Returns the fields of the product's ProductSnapshot plus `stock`.
     """
+    snapshot = await product_cache.get(product_id)  # Try the cache first
+    if snapshot is not None:
+        return {**asdict(snapshot), "stock": await get_available_stock(db, product_id)}
+
     product = await db.execute(select(Product).filter(Product.product_id == product_id))  # Query for the product by ID
     product = product.scalars().first()  # Retrieve the first result
     if not product:  # Check if the product exists
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+
+    snapshot = ProductSnapshot.from_product(product)
+    await product_cache.set(product_id, snapshot)  # Cache the snapshot for subsequent reads
+    return {**asdict(snapshot), "stock": product.stock}
 
 
 async def update_product_in_db(db: AsyncSession, product_id: UUID, product_update: ProductUpdate, current_user) -> Product:
@@ -63,6 +436,9 @@ async def update_product_in_db(db: AsyncSession, product_id: UUID, product_updat
     - **current_user**: The currently logged-in user, used to check authorization.
     - Ensures that only the vendor who created the product or an admin can update it.
     - Updates the specified fields in the product and commits the changes.
+    - A new `stock` replaces the units on sale (spread over the stripes of a striped product).
+    - Rebuilds its storefront listings in the same transaction.
+    - Invalidates the cached snapshot of the product, then caches the updated row.
     - Raises a 404 HTTPException if the product is not found.
     - Raises a 403 HTTPException if the user is not authorized to update the product.
     - Returns the updated product.
@@ -76,12 +452,26 @@ async def update_product_in_db(db: AsyncSession, product_id: UUID, product_updat
     if current_user.role != "admin" and current_user.vendor_id != product.vendor_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this product")
 
+    old_name = product.name  # Needed to update the suggest index
+
     # Update the product's attributes with the provided data
-    for key, value in product_update.dict(exclude_unset=True).items():
+    changes = product_update.dict(exclude_unset=True)
+    if changes.get("stock") is not None:
+        await set_available_stock(db, product_id, changes.pop("stock"))
+    changes.pop("stock", None)
+    for key, value in changes.items():
         setattr(product, key, value)
 
+    await db.flush()  # Write the changes so the storefront listings are rebuilt from them
+    await refresh_product_listings(db, product_id)
+    await bump_collection_versions(db, PRODUCTS, vendor_products(product.vendor_id))
     await db.commit()  # Commit the changes to the database
+    await product_cache.delete(product_id)  # Drop the stale cached snapshot
     await db.refresh(product)  # Refresh the product instance
+    # Write the fresh row through, so a lagging read replica cannot re-cache the old one
+    await product_cache.set(product_id, ProductSnapshot.from_product(product))
+    _index_product(product)
+    await _suggest_changed(product_id, old_name, product.name)
     return product
 
 
@@ -95,7 +485,10 @@ async def delete_product_from_db(db: AsyncSession, product_id: UUID, current_use
     - Ensures that only the vendor who created the product or an admin can delete it.
     - Raises a 404 HTTPException if the product is not found.
     - Raises a 403 HTTPException if the user is not authorized to delete the product.
-    - Deletes the product and commits the changes to the database.
+    - Soft deletes the product (sets `deleted_at`, a single-row update) and removes its storefront
+      listings, then commits. Order history keeps referring to the row; the archive job moves it
+      out once nothing references it any more.
+    - Invalidates the cached snapshot of the product.
     """
     product = await db.execute(select(Product).filter(Product.product_id == product_id))  # Query for the product by ID
     product = product.scalars().first()  # Retrieve the first result
@@ -106,5 +499,10 @@ async def delete_product_from_db(db: AsyncSession, product_id: UUID, current_use
     if current_user.role != "admin" and current_user.vendor_id != product.vendor_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this product")
 
-    await db.delete(product)  # Delete the product from the database
+    await remove_product_listings(db, product_id)  # Take it off every storefront
+    soft_delete(product)  # Hide the product from every query
+    await bump_collection_versions(db, PRODUCTS, vendor_products(product.vendor_id))
     await db.commit()  # Commit the changes
+    await product_cache.delete(product_id)  # Drop the cached snapshot
+    _unindex_product(product_id)
+    await _suggest_changed(product_id, product.name, None)
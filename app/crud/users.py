@@ -1,14 +1,32 @@
-from sqlalchemy import select
+from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession  # Import SQLAlchemy asyncsession for interacting with the database
 from fastapi import HTTPException, status
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta, timezone
+import os
 
 from schemas.users import UserUpdate
 from db.models.users import User # Import the User model
 from db.models.token import Token # Import the User model
+from db.models.password_reset import PasswordResetToken
+from db.database import AsyncSessionLocal
+from db.soft_delete import soft_delete  # Marks rows deleted instead of removing them
+from utlis.streaming import STREAM_YIELD_PER
 from core.auth import verify_password  # Import function to verify password from the auth module
 from core.auth import get_password_hash  # Import function to hash passwords from the auth module
+from core.auth import invalidate_principal  # Drops cached principals after a user changes
+from core.auth import hash_token  # Refresh and password reset tokens are stored and looked up by digest
+from core.background import periodic
+from crud.outbox import enqueue_email  # Queues emails to be sent after the transaction commits
+from utlis.utils import generate_reset_token
+
+# Live refresh tokens kept per user (e.g. one per device); logging in again drops the oldest
+MAX_REFRESH_TOKENS_PER_USER = int(os.getenv("MAX_REFRESH_TOKENS_PER_USER", 10))
+# Lifetime of a password reset link
+PASSWORD_RESET_TOKEN_MINUTES = int(os.getenv("PASSWORD_RESET_TOKEN_MINUTES", 30))
+# How often expired refresh and password reset tokens are purged, and how many are deleted per transaction
+TOKEN_PURGE_INTERVAL_SECONDS = float(os.getenv("TOKEN_PURGE_INTERVAL_SECONDS", 600))
+TOKEN_PURGE_BATCH = int(os.getenv("TOKEN_PURGE_BATCH", 1000))
 
 # Function to create a new user in the database
 async def create_user_in_db(db: AsyncSession, username: str, email: str, password: str) -> User:
@@ -32,8 +50,9 @@ async def create_user_in_db(db: AsyncSession, username: str, email: str, passwor
         hashed_password=hashed_password  # Store the hashed password
     )
     
-    # Add the new user to the session and commit the transaction to save it in the database
+    # Add the new user to the session and queue the welcome email in the same transaction
     db.add(new_user)
+    enqueue_email(db, "Welcome", email, username=username)
     await db.commit()
     # Refresh the user instance to reflect any auto-generated fields (e.g., ID)
     await db.refresh(new_user)
@@ -75,7 +94,7 @@ async def authenticate_user(db: AsyncSession, email: str, password: str):
         return False
     
     # Verify the password, return False if it doesn't match
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     
     # Return the authenticated user if successful
@@ -95,12 +114,15 @@ async def delete_user(db: AsyncSession, user_id: int):
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-        # If the user is found, delete the user from the database
-        await db.delete(user)
+        # If the user is found, soft delete it: the row stays for order history, but no query returns it any more
+        soft_delete(user)
 
         # Commit the changes to the database to persist the deletion
         await db.commit()
 
+        # Drop any cached principals so the user's tokens stop authenticating immediately
+        await invalidate_principal(user.user_id)
+
         # Return the deleted user object
         # The return value allows confirming the deleted user's details
         return user
@@ -136,9 +158,18 @@ async def get_all_users(db: AsyncSession):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while fetching users")
 
 
+# Asynchronous generator to stream all users from the database through a server-side cursor
+async def stream_all_users(db: AsyncSession):
+    # Rows are fetched `STREAM_YIELD_PER` at a time so memory stays flat for large user tables
+    result = await db.stream_scalars(select(User).execution_options(yield_per=STREAM_YIELD_PER))
+
+    # Hand each user to the caller as soon as it is read
+    async for user in result:
+        yield user
+
 
 async def save_refresh_token(
-    db: AsyncSession, refresh_token: str, user_id: int, expires_in_minutes: int
+    db: AsyncSession, refresh_token: str, user_id: int, expires_in_minutes: int, jti: str
 ) -> Token:
     """
     Save a refresh token to the database.
@@ -146,8 +177,12 @@ async def save_refresh_token(
     Args:
         db (AsyncSession): The database session.
         user_id (int): The ID of the user.
-        refresh_token (str): The refresh token string.
-        expires_at (datetime): The expiration time of the refresh token.
+        refresh_token (str): The refresh token string; only its SHA-256 digest is stored.
+        expires_in_minutes (int): Lifetime of the refresh token.
+        jti (str): The token's "jti" claim.
+
+    The user's expired tokens are dropped, and so are their oldest live tokens beyond
+    MAX_REFRESH_TOKENS_PER_USER, in the same transaction (a range scan of `ix_tokens_user_id_expires_at`).
 
     Returns:
         Token: The created Token instance.
@@ -155,16 +190,32 @@ async def save_refresh_token(
     Raises:
         ValueError: If there is an issue saving the token.
     """
-    expires = datetime.now(timezone.utc) + timedelta(minutes=expires_in_minutes)
+    now = datetime.now(timezone.utc)
+    expires = now + timedelta(minutes=expires_in_minutes)
 
     new_token = Token(
         user_id=user_id,
-        refresh_token=refresh_token,
+        token_hash=hash_token(refresh_token),
+        jti=jti,
         expires_at=expires,
     )
 
     try:
         db.add(new_token)  # Add the new token to the session
+        await db.flush()
+        # Keep only the newest live tokens of the user (the new one included)
+        stale = (
+            select(Token.id)
+            .where(Token.user_id == user_id, Token.revoked_at.is_(None))
+            .order_by(Token.expires_at.desc())
+            .offset(MAX_REFRESH_TOKENS_PER_USER)
+            .scalar_subquery()
+        )
+        await db.execute(
+            delete(Token)
+            .where(Token.user_id == user_id, (Token.expires_at <= now) | Token.id.in_(stale))
+            .execution_options(synchronize_session=False)
+        )
         await db.commit()  # Commit the transaction
         await db.refresh(new_token)  # Refresh to get the updated instance
         return new_token
@@ -173,28 +224,120 @@ async def save_refresh_token(
         raise ValueError("Error saving token to the database: Refresh token might already exist.")
 
 
-# Asynchronous function to fetch a token entry for a specific user by refresh token
-async def get_token_for_user(db: AsyncSession, refresh_token: str, user_id: int):
-    try:
-        # Create a select statement to fetch the token for the specified user and refresh token
-        stmt = select(Token).where(Token.refresh_token == refresh_token, Token.user_id == int(user_id))
-        
-        # Execute the query against the database to get the result
-        result = await db.execute(stmt)
-        
-        # Fetch the first token entry from the result (if any)
-        token_entry = result.scalars().first()
-        
-        # Return the token entry if found, or None if not
-        return token_entry
+async def revoke_user_refresh_tokens(db: AsyncSession, user_id: int):
+    """
+    Revoke every live refresh token of a user (e.g. after refresh token reuse was detected).
 
-    except Exception as e:
-        # Log the error message in case of any exception during the database operation
-        # Replace `print` with actual logging for production (e.g., `logging.error()`)
-        print(f"Error occurred while fetching token for user {user_id}: {str(e)}")
+    Args:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
 
-        # Raise an HTTPException with a 500 status code indicating an internal server error
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while fetching the token")
+    Commits.
+    """
+    now = datetime.now(timezone.utc)
+    await db.execute(
+        update(Token)
+        .where(Token.user_id == user_id, Token.revoked_at.is_(None), Token.expires_at > now)
+        .values(revoked_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def rotate_refresh_token(
+    db: AsyncSession, refresh_token: str, user_id: int,
+    new_refresh_token: str, new_jti: str, expires_in_minutes: int,
+) -> Token:
+    """
+    Exchange a refresh token for a new one; each refresh token can be used once.
+
+    Args:
+        db (AsyncSession): The database session.
+        refresh_token (str): The presented (already signature-checked) refresh token.
+        user_id (int): The ID of the user the token belongs to.
+        new_refresh_token (str): The replacement refresh token.
+        new_jti (str): The replacement's "jti" claim.
+        expires_in_minutes (int): Lifetime of the replacement.
+
+    The old token is revoked and the new one saved in one transaction: the conditional UPDATE is
+    also the existence and revocation check, so a valid refresh costs no extra query.
+
+    Presenting a revoked token is treated as theft (reuse detection): every token of the user
+    is revoked, and the legitimate client has to log in again.
+
+    Returns:
+        Token: The saved replacement token.
+
+    Raises:
+        HTTPException: 401 if the token is revoked, reused, expired or unknown.
+    """
+    user_id = int(user_id)
+    now = datetime.now(timezone.utc)
+    token_hash = hash_token(refresh_token)
+    result = await db.execute(
+        update(Token)
+        .where(
+            Token.token_hash == token_hash,
+            Token.user_id == user_id,
+            Token.revoked_at.is_(None),
+            Token.expires_at > now,
+        )
+        .values(revoked_at=now)
+        .returning(Token.id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.first() is None:
+        await db.rollback()
+        # Only failed refreshes pay for this query: was the token already rotated (earlier, or by
+        # a concurrent request)?
+        reused = await db.execute(
+            select(Token.id).where(Token.token_hash == token_hash, Token.revoked_at.is_not(None))
+        )
+        if reused.first() is not None:
+            await revoke_user_refresh_tokens(db, user_id)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token reuse detected")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token expired")
+
+    return await save_refresh_token(db, new_refresh_token, user_id, expires_in_minutes, new_jti)  # Commits both
+
+
+async def purge_expired_tokens(db: AsyncSession, model=Token, batch_size: int = TOKEN_PURGE_BATCH) -> int:
+    """
+    Delete one batch of expired tokens.
+
+    Args:
+        db (AsyncSession): The database session.
+        model: `Token` (refresh tokens) or `PasswordResetToken`.
+        batch_size (int): Maximum number of tokens deleted in this call.
+
+    Claims the oldest expired tokens through the table's `expires_at` index with
+    `FOR UPDATE SKIP LOCKED`, so several workers can purge at once, and commits.
+
+    Returns:
+        int: The number of tokens deleted.
+    """
+    expired = (
+        select(model.id)
+        .where(model.expires_at <= datetime.now(timezone.utc))
+        .order_by(model.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        delete(model).where(model.id.in_(expired)).execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+@periodic(TOKEN_PURGE_INTERVAL_SECONDS)
+async def purge_expired_tokens_job():
+    # Bounded batches, one transaction each, so the tables are never locked for long
+    async with AsyncSessionLocal() as db:
+        for model in (Token, PasswordResetToken):
+            while await purge_expired_tokens(db, model) == TOKEN_PURGE_BATCH:
+                pass
 
 
 
@@ -217,6 +360,9 @@ async def update_user(db: AsyncSession, user_id: int, user_update: UserUpdate):
         # Commit the changes to the database
         await db.commit()
 
+        # Drop any cached principals so the next request sees the updated role
+        await invalidate_principal(user.user_id)
+
         # Refresh the user instance to reflect the updated data
         await db.refresh(user)
 
@@ -232,25 +378,68 @@ async def update_user(db: AsyncSession, user_id: int, user_update: UserUpdate):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while updating the user")
 
 
-# Asynchronous function to retrieve a user by their reset token
-async def get_user_by_token(db: AsyncSession, token: str):
-    try:
-        # Execute a database query to find the user associated with the given reset token
-        result = await db.execute(select(User).filter(User.reset_token == token))
-        
-        # Return the first user found or None if no user matches the reset token
-        user = result.scalars().first()
+# Function to issue a password reset token for a user
+async def create_password_reset_token(db: AsyncSession, user_id: int) -> str:
+    """
+    Creates a password reset token, replacing any earlier one of the user.
+    Args:
+        db (AsyncSession): SQLAlchemy database session.
+        user_id (int): The ID of the user resetting their password.
+    Returns:
+        str: The token to put in the reset link. Only its SHA-256 digest is stored.
+    Does not commit; the caller commits together with the reset email.
+    """
+    token = generate_reset_token()
+    await delete_password_reset_tokens(db, user_id)  # Only the newest link works
+    db.add(PasswordResetToken(
+        user_id=user_id,
+        token_hash=hash_token(token),
+        expires_at=datetime.now(timezone.utc) + timedelta(minutes=PASSWORD_RESET_TOKEN_MINUTES),
+    ))
+    return token
+
+
+# Function to invalidate every password reset token of a user (e.g. once the password is reset)
+async def delete_password_reset_tokens(db: AsyncSession, user_id: int):
+    await db.execute(
+        delete(PasswordResetToken)
+        .where(PasswordResetToken.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
 
-        # If no user is found, raise a 404 HTTPException indicating that the token is invalid
-        if not user:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invalid reset token")
 
-        # Return the user object
-        return user
+# Asynchronous function to use up a password reset token and retrieve its user
+async def consume_password_reset_token(db: AsyncSession, token: str):
+    """
+    Deletes a password reset token and fetches the user it belongs to.
+    Args:
+        db (AsyncSession): SQLAlchemy database session.
+        token (str): The token from the reset link.
+    Returns:
+        User: The user if the token existed and had not expired, else None.
+    The DELETE ... RETURNING is the check: the deleted row stays locked until the caller commits,
+    so of two concurrent resets with the same link only one gets the user back.
+    Does not commit.
+    """
+    try:
+        # Delete the unexpired reset token by its digest (one probe of the unique index)
+        user_id = await db.scalar(
+            delete(PasswordResetToken)
+            .where(
+                PasswordResetToken.token_hash == hash_token(token),
+                PasswordResetToken.expires_at > datetime.now(timezone.utc),
+            )
+            .returning(PasswordResetToken.user_id)
+        )
+        if user_id is None:
+            return None  # Unknown, expired or already used
+
+        # Return the user the token belonged to
+        return await db.get(User, user_id)
 
     except Exception as e:
         # Log the error message in case of an unexpected error (replace `print` with actual logging in production)
-        print(f"Error occurred while retrieving user by reset token: {str(e)}")
+        print(f"Error occurred while consuming password reset token: {str(e)}")
         
         # Raise an HTTPException with a 500 status code indicating an internal server error
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while retrieving the user")
@@ -1,9 +1,52 @@
+from sqlalchemy import func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from db.models import Vendor
+from db.models import Product, Vendor
+from db.soft_delete import soft_delete
+from crud.listings import rename_vendor_in_listings
+from crud.versions import PRODUCTS, VENDORS, bump_collection_versions, get_collection_version, vendor_products
 from schemas.vendors import VendorCreate, VendorUpdate
+from core.cache import cache_type, get_cache
+from utlis.streaming import STREAM_YIELD_PER
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
 from uuid import UUID
 from fastapi import HTTPException
+import os
+
+
+# Immutable copy of a vendor row, safe to share between requests and workers
+@cache_type
+@dataclass(frozen=True, slots=True)
+class VendorSnapshot:
+    vendor_id: UUID
+    vendor_name: str
+    email: str
+    phone: str
+    address: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_vendor(cls, vendor: Vendor) -> "VendorSnapshot":
+        return cls(
+            vendor_id=vendor.vendor_id,
+            vendor_name=vendor.vendor_name,
+            email=vendor.email,
+            phone=vendor.phone,
+            address=vendor.address,
+            created_at=vendor.created_at,
+            updated_at=vendor.updated_at,
+        )
+
+
+# Read-through cache of vendor snapshots keyed by vendor_id (shared across workers when CACHE_URL is set)
+vendor_cache = get_cache(
+    "vendors",
+    maxsize=int(os.getenv("VENDOR_CACHE_SIZE", 2000)),
+    ttl=float(os.getenv("VENDOR_CACHE_TTL", 300)),
+)
 
 async def create_vendor_in_db(db: AsyncSession, vendor_data: VendorCreate) -> Vendor:
     """
@@ -17,6 +60,7 @@ async def create_vendor_in_db(db: AsyncSession, vendor_data: VendorCreate) -> Ve
     """
     new_vendor = Vendor(**vendor_data.dict())  # Create a new vendor instance from the input data
     db.add(new_vendor)  # Add the vendor to the database session
+    await bump_collection_versions(db, VENDORS)
     await db.commit()  # Commit the changes to the database
     await db.refresh(new_vendor)  # Refresh the instance to get updated data
     return new_vendor
@@ -34,21 +78,69 @@ async def get_all_vendors_from_db(db: AsyncSession):
     return result.scalars().all()  # Retrieve all vendor objects
 
 
-async def get_vendor_by_id_from_db(db: AsyncSession, vendor_id: UUID) -> Vendor:
+async def get_vendors_collection_version(db: AsyncSession) -> int:
+    """Return the version of the vendor collection, bumped in the same transaction as every vendor write."""
+    return await get_collection_version(db, VENDORS)
+
+
+async def stream_vendors_from_db(db: AsyncSession):
+    """
+    Stream every vendor from the database using a server-side cursor.
+
+    - **db**: The database session for performing database operations.
+    - Rows are fetched `STREAM_YIELD_PER` at a time, so memory stays flat regardless of table size.
+    - Yields vendors one by one.
+    """
+    result = await db.stream_scalars(select(Vendor).execution_options(yield_per=STREAM_YIELD_PER))
+    async for vendor in result:
+        yield vendor
+
+
+async def get_vendor_by_id_from_db(db: AsyncSession, vendor_id: UUID) -> VendorSnapshot:
     """
     Retrieve a vendor by its ID.
 
     - **db**: The database session for performing database operations.
     - **vendor_id**: UUID of the vendor to retrieve.
-    - Executes a query to select a vendor by its ID.
+    - Serves the vendor from `vendor_cache` when possible; on a miss, queries the
+      database and caches an immutable snapshot of the row.
     - Raises a 404 HTTPException if the vendor is not found.
-    - Returns the vendor if found.
+    - Returns a VendorSnapshot of the vendor if found.
     """
+    snapshot = await vendor_cache.get(vendor_id)  # Try the cache first
+    if snapshot is not None:
+        return snapshot
+
     vendor = await db.execute(select(Vendor).filter(Vendor.vendor_id == vendor_id))  # Query for the vendor by ID
     vendor = vendor.scalars().first()  # Retrieve the first result
     if not vendor:  # Check if the vendor exists
         raise HTTPException(status_code=404, detail="Vendor not found")
-    return vendor
+
+    snapshot = VendorSnapshot.from_vendor(vendor)
+    await vendor_cache.set(vendor_id, snapshot)  # Cache the snapshot for subsequent reads
+    return snapshot
+
+
+async def get_vendor_version(db: AsyncSession, vendor_id: UUID) -> datetime:
+    """
+    Return when a vendor last changed, for conditional GETs.
+
+    - **db**: The database session for performing database operations.
+    - **vendor_id**: UUID of the vendor.
+    - Uses the cached snapshot when there is one, otherwise reads only
+      `coalesce(updated_at, created_at)` through the primary key, without loading the row.
+    - Raises a 404 HTTPException if the vendor is not found.
+    """
+    snapshot = await vendor_cache.get(vendor_id)
+    if snapshot is not None:
+        return snapshot.updated_at or snapshot.created_at
+    result = await db.execute(
+        select(func.coalesce(Vendor.updated_at, Vendor.created_at)).filter(Vendor.vendor_id == vendor_id)
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Vendor not found")
+    return row[0]
 
 
 async def update_vendor_in_db(db: AsyncSession, vendor_id: UUID, vendor_update: VendorUpdate) -> Vendor:
@@ -60,7 +152,10 @@ async def update_vendor_in_db(db: AsyncSession, vendor_id: UUID, vendor_update:
     - **vendor_update**: VendorUpdate schema containing the updated data.
     - Executes a query to find the vendor by its ID.
     - Updates only the fields provided in the VendorUpdate schema.
+    - Copies a new vendor name into the vendor's storefront listings in the same transaction, and
+      bumps the products version that category page ETags are built from.
     - Commits the changes to the database and refreshes the vendor instance.
+    - Invalidates the cached snapshot of the vendor, then caches the updated row.
     - Raises a 404 HTTPException if the vendor is not found.
     - Returns the updated vendor.
     """
@@ -69,12 +164,26 @@ async def update_vendor_in_db(db: AsyncSession, vendor_id: UUID, vendor_update:
     if not vendor:  # Check if the vendor exists
         raise HTTPException(status_code=404, detail="Vendor not found")
 
+    old_name = vendor.vendor_name
+
     # Update the vendor's attributes with the provided data
-    for key, value in vendor_update.dict(exclude_unset=True).items():
+    fields = vendor_update.dict(exclude_unset=True)
+    if "name" in fields:
+        fields["vendor_name"] = fields.pop("name")  # The schema's `name` is the model's `vendor_name`
+    for key, value in fields.items():
         setattr(vendor, key, value)
 
+    if vendor.vendor_name != old_name:
+        # Category pages embed the vendor name too, and their ETags follow the products version
+        await rename_vendor_in_listings(db, vendor_id, vendor.vendor_name)
+        await bump_collection_versions(db, PRODUCTS, VENDORS, vendor_products(vendor_id))
+    else:
+        await bump_collection_versions(db, VENDORS)
     await db.commit()  # Commit the changes to the database
+    await vendor_cache.delete(vendor_id)  # Drop the stale cached snapshot
     await db.refresh(vendor)  # Refresh the vendor instance
+    # Write the fresh row through, so a lagging read replica cannot re-cache the old one
+    await vendor_cache.set(vendor_id, VendorSnapshot.from_vendor(vendor))
     return vendor
 
 
@@ -85,14 +194,21 @@ async def delete_vendor_from_db(db: AsyncSession, vendor_id: UUID) -> None:
     - **db**: The database session for performing database operations.
     - **vendor_id**: UUID of the vendor to delete.
     - Executes a query to find the vendor by its ID.
-    - Deletes the vendor from the database.
-    - Commits the changes to the database.
+    - Soft deletes the vendor (sets `deleted_at`) and commits the changes to the database.
+    - Invalidates the cached snapshot of the vendor.
     - Raises a 404 HTTPException if the vendor is not found.
+    - Raises a 409 HTTPException if the vendor still has products; delete those first.
     """
     vendor = await db.execute(select(Vendor).filter(Vendor.vendor_id == vendor_id))  # Query for the vendor by ID
     vendor = vendor.scalars().first()  # Retrieve the first result
     if not vendor:  # Check if the vendor exists
         raise HTTPException(status_code=404, detail="Vendor not found")
 
-    await db.delete(vendor)  # Delete the vendor from the database
+    products = await db.execute(select(Product.product_id).filter(Product.vendor_id == vendor_id).limit(1))
+    if products.first() is not None:  # Live products would be left without a vendor
+        raise HTTPException(status_code=409, detail="Vendor still has products")
+
+    soft_delete(vendor)  # Hide the vendor from every query
+    await bump_collection_versions(db, VENDORS)
     await db.commit()  # Commit the changes
+    await vendor_cache.delete(vendor_id)  # Drop the cached snapshot
@@ -0,0 +1,41 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID
+
+from db.models.versions import CollectionVersion
+
+
+# Collection names
+PRODUCTS = "products"
+VENDORS = "vendors"
+
+
+def vendor_products(vendor_id: UUID) -> str:
+    """Name of the collection holding one vendor's products."""
+    return f"vendor:{vendor_id}:products"
+
+
+async def bump_collection_versions(db: AsyncSession, *names: str):
+    """
+    Increase the version of each collection by one.
+
+    - **db**: The database session for performing database operations.
+    - **names**: The collections the current transaction writes to.
+    - Upserts `version = version + 1` in sorted name order, so concurrent writers lock the
+      counters in the same order and cannot deadlock.
+    - Does not commit; call it inside the write's transaction, so readers never see the new
+      version without the new data.
+    """
+    for name in sorted(set(names)):
+        statement = insert(CollectionVersion).values(name=name, version=1)
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[CollectionVersion.name],
+            set_={"version": CollectionVersion.version + 1},
+        ))
+
+
+async def get_collection_version(db: AsyncSession, name: str) -> int:
+    """Return the current version of a collection (0 if it was never written), with one primary key read."""
+    result = await db.execute(select(CollectionVersion.version).filter(CollectionVersion.name == name))
+    return result.scalar_one_or_none() or 0
@@ -1,26 +1,178 @@
-from sqlalchemy import create_engine, MetaData
+import math
+import os
+import random
+import time
+from fastapi import Request
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
-from databases import Database
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from config import settings
-from fastapi import Depends
+from core.metrics import LatencyStats
 
 DATABASE_URL = settings.DATABASE_URL
 
-# For async database connection
-database = Database(DATABASE_URL)
-metadata = MetaData()
+
+# Read a tuning value from `settings`, falling back to the environment, then to the default
+def _setting(name: str, default, cast=str):
+    value = getattr(settings, name, None)
+    if value is None:
+        value = os.getenv(name, default)
+    return cast(value)
+
+
+def _as_bool(value) -> bool:
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+# Connection pool settings
+DB_POOL_SIZE = _setting("DB_POOL_SIZE", 10, int)  # Connections kept open per worker
+DB_MAX_OVERFLOW = _setting("DB_MAX_OVERFLOW", 10, int)  # Extra connections allowed under burst load
+DB_POOL_TIMEOUT = _setting("DB_POOL_TIMEOUT", 5, float)  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = _setting("DB_POOL_RECYCLE", 1800, int)  # Reconnect connections older than this (seconds)
+DB_POOL_PRE_PING = _setting("DB_POOL_PRE_PING", True, _as_bool)  # Test connections before handing them out
+DB_STATEMENT_TIMEOUT_MS = _setting("DB_STATEMENT_TIMEOUT_MS", 15000, int)  # 0 disables the timeout
+DB_ECHO = _setting("DB_ECHO", False, _as_bool)  # Log every SQL statement (development only)
+
+# Read replicas: comma-separated URLs. Without any, read sessions use the primary.
+DATABASE_REPLICA_URLS = [url.strip() for url in _setting("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# After a client writes, its reads stay on the primary for this long (read-your-writes)
+DB_REPLICA_STICKY_SECONDS = _setting("DB_REPLICA_STICKY_SECONDS", 5, float)
+STICKY_COOKIE = "db_primary_until"
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait and how often they time out."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_latency = LatencyStats()
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.wait_latency.observe(time.perf_counter() - started)
+
+
+def create_engine_for(url: str):
+    """
+    Create an async engine with the configured pool settings.
+
+    - **url**: The database URL to connect to.
+    - Uses `InstrumentedPool` so checkout wait time and timeouts can be reported.
+    - Applies `DB_STATEMENT_TIMEOUT_MS` to every new PostgreSQL connection as a session default,
+      sent when the connection is opened, so no rollback can undo it.
+    - Returns the AsyncEngine.
+    """
+    connect_args = {}
+    database_url = make_url(url)
+    if DB_STATEMENT_TIMEOUT_MS and database_url.get_backend_name() == "postgresql":
+        if database_url.get_driver_name() == "asyncpg":
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        else:  # libpq-based drivers (e.g. psycopg)
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    engine = create_async_engine(
+        url,
+        connect_args=connect_args,
+        echo=DB_ECHO,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    return engine
+
+
+def pool_stats(engine) -> dict:
+    """Return live pool metrics for `engine`: checked-out connections, overflow, wait time and timeouts."""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeouts": getattr(pool, "timeouts", 0),
+        "wait": pool.wait_latency.stats() if hasattr(pool, "wait_latency") else None,
+    }
+
 
 # SQLAlchemy models
 Base = declarative_base()
 
 # Create an async SQLAlchemy engine
-async_engine = create_async_engine(DATABASE_URL, echo=True)
+async_engine = create_engine_for(DATABASE_URL)
 AsyncSessionLocal = sessionmaker(
     async_engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# One engine and sessionmaker per read replica
+replica_engines = [create_engine_for(url) for url in DATABASE_REPLICA_URLS]
+ReplicaSessionLocals = [
+    sessionmaker(engine, class_=AsyncSession, expire_on_commit=False) for engine in replica_engines
+]
+
+
 # Dependency to get the async database session
-async def get_db() -> AsyncSession: # type: ignore 
+async def get_db(request: Request) -> AsyncSession: # type: ignore
     async with AsyncSessionLocal() as session:
+        # Lets the flush listener below mark this request as having written
+        session.sync_session.info["request"] = request
         yield session
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_request_as_writer(session, flush_context):
+    request = session.info.get("request")
+    if request is not None:
+        request.state.db_wrote = True
+
+
+def _is_sticky(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_session_factory(request: Request = None):
+    """
+    Pick the sessionmaker for a read-only session.
+
+    - **request**: The current request, used to honour read-your-writes stickiness.
+    - Returns the primary sessionmaker if no replica is configured or the client wrote
+      within the last `DB_REPLICA_STICKY_SECONDS`, otherwise a random replica's.
+    """
+    if not ReplicaSessionLocals or (request is not None and _is_sticky(request)):
+        return AsyncSessionLocal
+    return random.choice(ReplicaSessionLocals)
+
+
+# Dependency to get a read-only database session, served by a replica when possible
+async def get_read_db(request: Request) -> AsyncSession: # type: ignore
+    async with read_session_factory(request)() as session:
+        yield session
+
+
+async def replica_stickiness_middleware(request: Request, call_next):
+    """Pin a client's reads to the primary for a short while after it writes."""
+    response = await call_next(request)
+    if ReplicaSessionLocals and getattr(request.state, "db_wrote", False):
+        response.set_cookie(
+            STICKY_COOKIE,
+            str(time.time() + DB_REPLICA_STICKY_SECONDS),
+            max_age=math.ceil(DB_REPLICA_STICKY_SECONDS),
+            httponly=True,
+            samesite="lax",
+        )
+    return response
@@ -2,6 +2,7 @@
 from .base import Base
 from .users import User
 from .token import Token
+from .password_reset import PasswordResetToken
 from .vendors import Vendor
 from .products import Product, Category, product_category_association
 from .orders import Order, OrderItem
@@ -9,3 +10,8 @@ from .wishlist import Wishlist, wishlist_product_association
 from .payment import Payment
 from .reviewAndRating import Review
 from .shoppingCart import CartItem, ShoppingCart
+from .inventory import StockReservation, InventoryStripe
+from .listings import ProductListing, ListingScope
+from .versions import CollectionVersion
+from .archive import ArchivedRecord
+from .outbox import EmailOutbox, EmailStatus
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, UUID, DateTime, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
+from .base import Base
+import uuid
+
+
+# ORM model for the "archived_records" table: soft-deleted rows moved out of the hot tables
+class ArchivedRecord(Base):
+    __tablename__ = 'archived_records'  # Specifies the table name in the database
+    __table_args__ = (
+        Index('ix_archived_records_table_name_record_key', 'table_name', 'record_key'),  # Look up an archived row
+    )
+
+    # Columns
+    archive_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # Unique identifier for the archive entry
+    table_name = Column(String, nullable=False)  # Table the row was removed from
+    record_key = Column(String, nullable=False)  # Primary key of the removed row, as text
+    data = Column(JSONB, nullable=False)  # The full row as it was when archived
+    deleted_at = Column(DateTime(timezone=True), nullable=False)  # When the row was soft deleted
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # When it was moved here
@@ -0,0 +1,51 @@
+from sqlalchemy import Column, Integer, UUID, ForeignKey, DateTime, Enum, Index, func, select, text
+from sqlalchemy.orm import column_property
+from .base import Base
+from .products import Product
+import uuid
+from enum import Enum as PyEnum
+
+
+# Enumeration to represent the lifecycle of a stock reservation
+class ReservationStatus(PyEnum):
+    HELD = 'Held'  # Stock is set aside for an order that has been placed but not settled
+    COMMITTED = 'Committed'  # The order went ahead; the stock is consumed for good
+    RELEASED = 'Released'  # The order was canceled or abandoned; the stock went back on sale
+
+# ORM model for the "stock_reservations" table
+class StockReservation(Base):
+    __tablename__ = 'stock_reservations'  # Specifies the table name in the database
+    __table_args__ = (
+        Index('ix_stock_reservations_order_id', 'order_id'),  # Settle all reservations of an order
+        # Expiry sweeps only look at held reservations, so keep that index small
+        Index('ix_stock_reservations_held_expires_at', 'expires_at', postgresql_where=text("status = 'HELD'")),
+    )
+
+    # Columns
+    reservation_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # Unique identifier for the reservation
+    order_id = Column(UUID(as_uuid=True), ForeignKey('orders.order_id'), nullable=False)  # Order the stock is held for
+    product_id = Column(UUID(as_uuid=True), ForeignKey('products.product_id'), nullable=False)  # Product the stock was taken from
+    quantity = Column(Integer, nullable=False)  # Number of units held
+    status = Column(Enum(ReservationStatus), default=ReservationStatus.HELD, nullable=False)  # Current state of the reservation
+    expires_at = Column(DateTime(timezone=True), nullable=False)  # Held stock is released after this time
+
+# ORM model for the "inventory_stripes" table
+class InventoryStripe(Base):
+    __tablename__ = 'inventory_stripes'  # Specifies the table name in the database
+
+    # Columns
+    # A striped product's stock is split across `Product.stock_stripes` rows, so concurrent
+    # reservations for a hot SKU lock different rows instead of queueing on one
+    product_id = Column(UUID(as_uuid=True), ForeignKey('products.product_id'), primary_key=True)  # Product the stripe belongs to
+    stripe = Column(Integer, primary_key=True)  # Stripe number, from 0 to stock_stripes - 1
+    quantity = Column(Integer, nullable=False, default=0)  # Units available in this stripe
+
+# Units of a product on sale: its own counter plus its stripes (a striped product keeps stock_quantity at 0).
+# Read-only; loaded with every product row through the inventory_stripes primary key.
+Product.stock = column_property(
+    Product.__table__.c.stock_quantity
+    + select(func.coalesce(func.sum(InventoryStripe.quantity), 0))
+    .where(InventoryStripe.product_id == Product.__table__.c.product_id)
+    .correlate_except(InventoryStripe)
+    .scalar_subquery()
+)
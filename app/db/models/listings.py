@@ -0,0 +1,31 @@
+from sqlalchemy import Column, String, Numeric, UUID, ForeignKey, DateTime, Enum, Index
+from .base import Base
+from enum import Enum as PyEnum
+
+
+# Enumeration of the storefronts a product is listed on
+class ListingScope(PyEnum):
+    VENDOR = 'Vendor'  # The vendor's storefront; owner_id is the vendor_id
+    CATEGORY = 'Category'  # A category page; owner_id is the category_id
+
+# ORM model for the "product_listings" table: one denormalized row per product and storefront,
+# maintained by the product and vendor CRUD functions, so a storefront page is one index range scan
+class ProductListing(Base):
+    __tablename__ = 'product_listings'  # Specifies the table name in the database
+    __table_args__ = (
+        # Storefront pages, in (product_created_at, product_id) keyset order
+        Index('ix_product_listings_storefront', 'scope', 'owner_id', 'product_created_at', 'product_id'),
+        Index('ix_product_listings_product_id', 'product_id'),  # Refresh every listing of a product
+        Index('ix_product_listings_vendor_id', 'vendor_id'),  # Rename a vendor across its listings
+    )
+
+    # Columns
+    scope = Column(Enum(ListingScope), primary_key=True)  # Kind of storefront
+    owner_id = Column(UUID(as_uuid=True), primary_key=True)  # Vendor or category the storefront belongs to
+    product_id = Column(UUID(as_uuid=True), ForeignKey('products.product_id', ondelete='CASCADE'), primary_key=True)  # Listed product
+    product_created_at = Column(DateTime(timezone=True), nullable=False)  # Copy of products.created_at (sort key)
+    name = Column(String, nullable=False)  # Copy of products.name
+    description = Column(String, nullable=True)  # Copy of products.description
+    price = Column(Numeric(10, 2), nullable=False)  # Copy of products.price
+    vendor_id = Column(UUID(as_uuid=True), nullable=False)  # Copy of products.vendor_id
+    vendor_name = Column(String, nullable=False)  # Copy of vendors.vendor_name
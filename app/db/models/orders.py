@@ -1,4 +1,4 @@
-from sqlalchemy import Enum
+from sqlalchemy import Enum, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from sqlalchemy import Column, Integer, Numeric, String, UUID, ForeignKey  # Import required column types for the SQLAlchemy model
 from .base import Base
@@ -9,7 +9,8 @@ from enum import Enum as PyEnum
 # Enumeration to represent the possible statuses of an order
 class OrderStatus(PyEnum):
     CART = 'Cart'  # Represents a draft order (e.g., items in a cart, not yet placed)
-    PENDING = 'Pending'  # Order has been placed but not yet shipped
+    PENDING = 'Pending'  # Order has been placed; its stock is held until it is confirmed or the hold expires
+    CONFIRMED = 'Confirmed'  # Order has been confirmed (e.g. paid); its stock is committed
     SHIPPED = 'Shipped'  # Order has been shipped but not yet delivered
     DELIVERED = 'Delivered'  # Order has been delivered to the customer
     CANCELED = 'Canceled'  # Order has been canceled
@@ -17,6 +18,10 @@ class OrderStatus(PyEnum):
 # ORM model for the "orders" table
 class Order(Base):
     __tablename__ = 'orders'  # Specifies the table name in the database
+    __table_args__ = (
+        # At most one open cart per user; lets cart creation be a single INSERT ... ON CONFLICT
+        Index('uq_orders_user_cart', 'user_id', unique=True, postgresql_where=text("status = 'CART'")),
+    )
 
     # Columns
     order_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # Unique identifier for the order
@@ -33,6 +38,10 @@ class Order(Base):
 # ORM model for the "order_items" table
 class OrderItem(Base):
     __tablename__ = 'order_items'  # Specifies the table name in the database
+    __table_args__ = (
+        # One line per product in an order; target of the cart's INSERT ... ON CONFLICT
+        UniqueConstraint('order_id', 'product_id', name='uq_order_items_order_product'),
+    )
 
     # Columns
     order_item_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # Unique identifier for the order item
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, String, Integer, UUID, DateTime, Enum, Index, func, text
+from sqlalchemy.dialects.postgresql import JSONB
+from .base import Base
+import uuid
+from enum import Enum as PyEnum
+
+
+# Enumeration to represent the delivery state of an outgoing email
+class EmailStatus(PyEnum):
+    PENDING = 'Pending'  # Waiting for (another) delivery attempt
+    SENT = 'Sent'  # Accepted by the SMTP server
+    FAILED = 'Failed'  # Gave up after EMAIL_MAX_ATTEMPTS attempts
+
+# ORM model for the "email_outbox" table: emails are written here in the same transaction as the
+# change that triggers them, and delivered later by the dispatcher job
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'  # Specifies the table name in the database
+    __table_args__ = (
+        # The dispatcher only scans pending emails that are due
+        Index('ix_email_outbox_pending_next_attempt_at', 'next_attempt_at', postgresql_where=text("status = 'PENDING'")),
+        # The purge job only scans settled emails, oldest first (updated_at is when they were settled)
+        Index('ix_email_outbox_settled_updated_at', 'updated_at', postgresql_where=text("status <> 'PENDING'")),
+    )
+
+    # Columns
+    email_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # Unique identifier for the email
+    email_type = Column(String, nullable=False)  # Key into EMAIL_SUBJECTS / EMAIL_TEMPLATES
+    recipient = Column(String, nullable=False)  # Address the email is sent to
+    context = Column(JSONB, nullable=False, default=dict)  # Values for the template (username, link, ...)
+    status = Column(Enum(EmailStatus), default=EmailStatus.PENDING, nullable=False)  # Delivery state
+    attempts = Column(Integer, nullable=False, default=0)  # Delivery attempts so far
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # Not retried before this time
+    last_error = Column(String, nullable=True)  # Error of the last failed attempt
+    sent_at = Column(DateTime(timezone=True), nullable=True)  # When the SMTP server accepted it
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, LargeBinary, ForeignKey, DateTime, Index, func
+from .base import Base
+
+
+# ORM model for the "password_reset_tokens" table: one row per outstanding reset link,
+# instead of two mostly-empty columns on every user
+class PasswordResetToken(Base):
+    __tablename__ = "password_reset_tokens"  # Specifies the table name in the database
+    __table_args__ = (
+        Index('ix_password_reset_tokens_user_id', 'user_id'),  # Dropping a user's other reset links
+        Index('ix_password_reset_tokens_expires_at', 'expires_at'),  # The purge job deletes in expiry order
+    )
+
+    id = Column(Integer, primary_key=True)  # Unique identifier for each reset token
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)  # The user the link resets
+    # SHA-256 of the token sent by email (see core.auth.hash_token); a reset is one unique index probe
+    token_hash = Column(LargeBinary(32), unique=True, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)  # The link stops working after this
+    created_at = Column(DateTime(timezone=True), server_default=func.now())  # When the reset was requested
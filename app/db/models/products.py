@@ -1,21 +1,38 @@
 from sqlalchemy import Numeric, Integer, String, UUID
-from sqlalchemy import Table, Column, ForeignKey
+from sqlalchemy import Table, Column, ForeignKey, Index, DDL, event, text
 from sqlalchemy.orm import relationship
 from .base import Base
 import uuid
 from .wishlist import wishlist_product_association
 
 
+# Hot indexes only cover live rows; soft-deleted products are filtered out of every query anyway
+LIVE = text('deleted_at IS NULL')
+
+
+# Text search configuration used for the products full-text index (and its queries)
+SEARCH_CONFIG = 'english'
+
+
 # Association table for many-to-many relationship between products and categories
 product_category_association = Table(
     'product_category', Base.metadata,  # Table name and metadata
     Column('product_id', UUID(as_uuid=True), ForeignKey('products.product_id')),  # Foreign key referencing products
-    Column('category_id', UUID(as_uuid=True), ForeignKey('categories.category_id'))  # Foreign key referencing categories
+    Column('category_id', UUID(as_uuid=True), ForeignKey('categories.category_id')),  # Foreign key referencing categories
+    Index('ix_product_category_category_id_product_id', 'category_id', 'product_id'),  # Products of a category (filters)
+    Index('ix_product_category_product_id', 'product_id'),  # Categories of a product
 )
 
 # ORM model for the "products" table
 class Product(Base):
     __tablename__ = 'products'  # Specifies the table name in the database
+    __table_args__ = (
+        Index('ix_products_created_at_product_id', 'created_at', 'product_id', postgresql_where=LIVE),  # Composite index backing keyset pagination
+        Index('ix_products_vendor_id', 'vendor_id'),  # Vendor filter and foreign key lookups (deleted rows included)
+        Index('ix_products_category_id', 'category_id', postgresql_where=LIVE),  # Category filter
+        Index('ix_products_price', 'price', postgresql_where=LIVE),  # Price range filter
+        Index('ix_products_deleted_at', 'deleted_at', postgresql_where=text('deleted_at IS NOT NULL')),  # Archive job
+    )
 
     # Columns
     product_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # Unique identifier for the product
@@ -24,6 +41,7 @@ class Product(Base):
     description = Column(String, nullable=True)  # Description of the product (optional)
     price = Column(Numeric(10, 2), nullable=False)  # Price of the product (precision: 10 digits, 2 decimals)
     stock_quantity = Column(Integer, nullable=False)  # Quantity of the product available in stock
+    stock_stripes = Column(Integer, nullable=False, default=0, server_default='0')  # > 0: stock lives in that many inventory_stripes rows instead
     category_id = Column(UUID(as_uuid=True), ForeignKey('categories.category_id'), nullable=False)  # Foreign key linking to a primary category
 
     # Relationships
@@ -41,6 +59,18 @@ class Product(Base):
         back_populates="products"  # Bidirectional relationship with the Wishlist model
     )
 
+# Full-text search on PostgreSQL: a generated tsvector over the name (weight A) and description (weight B),
+# with a GIN index. It is not a mapped column, so product rows never load it and other dialects can still
+# create the table (they search with the in-process index in crud.products instead).
+event.listen(Product.__table__, "after_create", DDL(
+    "ALTER TABLE products ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')) STORED"
+).execute_if(dialect="postgresql"))
+event.listen(Product.__table__, "after_create", DDL(
+    "CREATE INDEX ix_products_search_vector ON products USING GIN (search_vector)"
+).execute_if(dialect="postgresql"))
+
 # ORM model for the "categories" table
 class Category(Base):
     __tablename__ = 'categories'  # Specifies the table name in the database
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, LargeBinary, ForeignKey, DateTime, Index, String
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .base import Base
@@ -8,6 +8,12 @@ from .base import Base
 class Token(Base):
     # Define the table name for the Token model
     __tablename__ = "tokens"
+    __table_args__ = (
+        # A user's live tokens, oldest first: enforcing the per-user cap is a short range scan
+        Index('ix_tokens_user_id_expires_at', 'user_id', 'expires_at'),
+        # The purge job deletes expired tokens in expiry order
+        Index('ix_tokens_expires_at', 'expires_at'),
+    )
 
     # Primary key: Unique identifier for each token record
     id = Column(Integer, primary_key=True, index=True)
@@ -15,8 +21,16 @@ class Token(Base):
     # Foreign key: Links the token to the user who owns it (references `user_id` in the "users" table)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
 
-    # Token string: Stores the refresh token, which is unique for each user and required for token refresh
-    refresh_token = Column(String, unique=True, nullable=False)
+    # Token digest: SHA-256 of the refresh token (see core.auth.hash_token). Fixed-width, so the unique
+    # index stays small and lookups compare 32 bytes instead of a long JWT; the raw token is never stored
+    token_hash = Column(LargeBinary(32), unique=True, nullable=False)
+
+    # Token ID: the JWT's "jti" claim
+    jti = Column(String(32), unique=True, nullable=False)
+
+    # Revocation time: set when the token is rotated (or its whole family revoked); presenting
+    # a revoked token again means it was stolen, so every token of the user is revoked
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
 
     # Expiration time: Stores the date and time when the refresh token will expire
     expires_at = Column(DateTime(timezone=True), nullable=False)
@@ -25,4 +39,3 @@ class Token(Base):
     # This establishes a relationship to the "User" table.
     # The `back_populates` attribute ensures bidirectional relationship between Token and User models.
     user = relationship("User", back_populates="tokens")
-
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Enum, Index, text
 from sqlalchemy.orm import relationship
 from enum import Enum as PyEnum
 from .base import Base 
@@ -14,16 +14,22 @@ class UserRole(PyEnum):
 # ORM model for the "users" table
 class User(Base):
     __tablename__ = "users"  # Specifies the table name in the database
+    __table_args__ = (
+        # Username and email are unique among live users only, so they can be reused after a deletion
+        Index('uq_users_username_live', 'username', unique=True, postgresql_where=text('deleted_at IS NULL')),
+        Index('uq_users_email_live', 'email', unique=True, postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_users_deleted_at', 'deleted_at', postgresql_where=text('deleted_at IS NOT NULL')),  # Archive job
+    )
 
     # Columns
     user_id = Column(Integer, primary_key=True, index=True)
     # Unique identifier for each user, acts as the primary key
 
-    username = Column(String, unique=True, index=True, nullable=False)
-    # Username for the user, must be unique and cannot be null
+    username = Column(String, nullable=False)
+    # Username for the user, must be unique among live users and cannot be null
 
-    email = Column(String, unique=True, index=True, nullable=False)
-    # Email address of the user, must be unique and cannot be null
+    email = Column(String, nullable=False)
+    # Email address of the user, must be unique among live users and cannot be null
 
     hashed_password = Column(String, nullable=False)
     # Encrypted version of the user's password for secure storage
@@ -31,12 +37,7 @@ class User(Base):
     role = Column(Enum(UserRole), default=UserRole.USER, nullable=False)
     # Role of the user (e.g., USER, ADMIN, VENDOR), defaults to USER
 
-    # Password reset functionality
-    reset_token = Column(String, nullable=True)
-    # Token for resetting the user's password (optional, can be null)
-
-    reset_token_expiration = Column(DateTime, nullable=True)
-    # Expiration timestamp for the password reset token (optional, can be null)
+    # Password reset tokens live in the "password_reset_tokens" table (see PasswordResetToken)
 
     # Relationships
     tokens = relationship("Token", back_populates="user", lazy="dynamic")
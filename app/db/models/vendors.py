@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, UUID 
+from sqlalchemy import Column, String, UUID, Index, text
 from sqlalchemy.orm import relationship 
 from .base import Base
 import uuid
@@ -7,6 +7,11 @@ import uuid
 # ORM model for the "vendors" table
 class Vendor(Base):
     __tablename__ = 'vendors'  # Specifies the name of the table in the database
+    __table_args__ = (
+        # Email is unique among live vendors only, so a deleted vendor's email can be reused
+        Index('uq_vendors_email_live', 'email', unique=True, postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_vendors_deleted_at', 'deleted_at', postgresql_where=text('deleted_at IS NOT NULL')),  # Archive job
+    )
 
     # Columns
     vendor_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -15,8 +20,8 @@ class Vendor(Base):
     vendor_name = Column(String, nullable=False)
     # Name of the vendor, cannot be null
 
-    email = Column(String, unique=True, nullable=False)
-    # Email address of the vendor, must be unique and cannot be null
+    email = Column(String, nullable=False)
+    # Email address of the vendor, must be unique among live vendors and cannot be null
 
     phone = Column(String, nullable=False)
     # Contact phone number of the vendor, cannot be null
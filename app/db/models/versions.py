@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, BigInteger
+from .base import Base
+
+
+# ORM model for the "collection_versions" table: one counter per cached collection
+# (e.g. "products", "vendors", "vendor:<vendor_id>:products"), bumped in the same
+# transaction as every write to that collection
+class CollectionVersion(Base):
+    __tablename__ = 'collection_versions'  # Specifies the table name in the database
+
+    # Columns
+    name = Column(String, primary_key=True)  # Collection name
+    version = Column(BigInteger, nullable=False, default=0)  # Increases by one on every write
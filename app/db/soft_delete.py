@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+from sqlalchemy import event
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from db.models import Product, User, Vendor
+
+
+# Models whose rows are soft deleted: `deleted_at` is set instead of removing the row
+SOFT_DELETE_MODELS = (Product, Vendor, User)
+
+
+def soft_delete(instance):
+    """Mark a row as deleted; once flushed it no longer shows up in any ORM query."""
+    instance.deleted_at = datetime.now(timezone.utc)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _exclude_soft_deleted(execute_state):
+    """
+    Add `deleted_at IS NULL` for every soft-deletable model to ORM SELECTs, including
+    the relationship loads they trigger. Opt out with `.execution_options(include_deleted=True)`.
+
+    Core INSERT ... SELECT and UPDATE statements are not covered and filter explicitly.
+    """
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get("include_deleted", False)
+    ):
+        execute_state.statement = execute_state.statement.options(*(
+            with_loader_criteria(model, lambda cls: cls.deleted_at.is_(None), include_aliases=True)
+            for model in SOFT_DELETE_MODELS
+        ))
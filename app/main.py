@@ -5,26 +5,61 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.middleware.sessions import SessionMiddleware
 import os
 
+from core.background import start_background_jobs, stop_background_jobs
+from core.cache import start_cache_listener, stop_cache_listener
+from crud.products import load_product_search_index
+from crud.archive import archive_deleted_rows_job  # noqa: F401 (registers the @periodic job)
+from crud.outbox import dispatch_outbox_job, purge_settled_emails_job  # noqa: F401 (registers the @periodic jobs)
+from crud.users import purge_expired_tokens_job  # noqa: F401 (registers the @periodic job)
+from core.mailer import smtp_pool
+from utlis.utils import email_templates
+from db.database import replica_stickiness_middleware
+
 # from config import settings
 app = FastAPI(debug=True)
 
 
 # app.add_exception_handler(StarletteHTTPException, http_exception_handler)
 # app.add_middleware(SessionMiddleware, secret_key=os.getenv("SESSION_SECRET_KEY"))
+app.middleware("http")(replica_stickiness_middleware)
 
 
 from api.users import router as users_router
 from api.orders import router as orders_router
 from api.products import router as product_router
-# from api.cartandwishlist import router as cartwishlist_router
+from api.cartandwishlist import router as cartwishlist_router
 from api.vendors import router as vendor_router
+from api.categories import router as category_router
+from api.metrics import router as metrics_router
 
 ## user routes
 app.include_router(users_router)
-# app.include_router(orders_router)
+app.include_router(orders_router)
 app.include_router(product_router)
 app.include_router(vendor_router)
-# app.include_router(cartwishlist_router)
+app.include_router(category_router)
+app.include_router(metrics_router)
+app.include_router(cartwishlist_router)
+
+
+@app.on_event("startup")
+async def startup():
+    # Listen for cross-worker cache invalidations when a shared cache is configured
+    await start_cache_listener()
+    # In-memory product name autocomplete, plus the full-text fallback on databases without tsvector support
+    await load_product_search_index()
+    # Parse and compile the email templates once, instead of on every send
+    email_templates.load()
+    # Periodic jobs registered with @periodic (e.g. releasing expired stock reservations)
+    await start_background_jobs()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_background_jobs()
+    await stop_cache_listener()
+    await smtp_pool.close()
+    email_templates.close()
 
 
 
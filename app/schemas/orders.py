@@ -19,6 +19,12 @@ class OrderBase(BaseModel):
 class OrderCreate(OrderBase):
     order_items: List[OrderItemCreate]
 
+class OrderBatchCreate(BaseModel):
+    orders: List[OrderCreate]
+
+class OrderBatchResponse(BaseModel):
+    order_ids: List[UUID]
+
 class OrderResponse(OrderBase):
     order_id: UUID
     status: str
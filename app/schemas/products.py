@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
 class ProductCreate(BaseModel):
@@ -24,3 +24,48 @@ class ProductResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+class ProductSuggestion(BaseModel):
+    product_id: UUID
+    name: str
+
+class ProductFilters(BaseModel):
+    category_id: Optional[UUID] = None  # Primary or additional category
+    vendor_id: Optional[UUID] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    in_stock: Optional[bool] = None
+
+class FacetCount(BaseModel):
+    id: UUID
+    count: int
+
+class PriceBucketCount(BaseModel):
+    min_price: float
+    max_price: Optional[float]  # None for the open-ended top bucket
+    count: int
+
+class ProductFacets(BaseModel):
+    categories: List[FacetCount]
+    vendors: List[FacetCount]
+    price: List[PriceBucketCount]
+
+class ProductPage(BaseModel):
+    items: List[ProductResponse]
+    next_cursor: Optional[str] = None  # Pass back as `cursor` to fetch the next page
+    facets: Optional[ProductFacets] = None  # Only on the first page
+
+class ProductListingResponse(BaseModel):
+    product_id: UUID
+    name: str
+    description: Optional[str]
+    price: float
+    vendor_id: UUID
+    vendor_name: str
+
+    class Config:
+        orm_mode = True
+
+class ProductListingPage(BaseModel):
+    items: List[ProductListingResponse]
+    next_cursor: Optional[str] = None  # Pass back as `cursor` to fetch the next page
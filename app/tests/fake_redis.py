@@ -0,0 +1,147 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class FakeRedisServer:
+    """
+    In-memory server speaking enough of the Redis protocol (RESP2, or RESP3 after HELLO 3) for
+    core.cache: HELLO, PING, GET, SET (with PX/EX), DEL, PUBLISH, SUBSCRIBE and UNSUBSCRIBE.
+
+    It runs on the test's event loop, so the real redis client, the RedisCacheBackend and the
+    pub/sub listener are exercised end to end without a Redis installation.
+    """
+
+    def __init__(self):
+        self.data = {}  # key -> (value, expires_at or None)
+        self.channels = {}  # channel -> set of subscribed writers
+        self.commands = []  # Every command received, for assertions
+        self._server = None
+        self._writers = set()
+        self._resp3 = set()  # Writers of connections that switched to RESP3
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+
+    async def stop(self):
+        for writer in list(self._writers):
+            writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):  # Inline command
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def _serve(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                self.commands.append([args[0].upper()] + args[1:])
+                writer.write(self._execute(writer, args[0].upper().decode(), args[1:]))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._resp3.discard(writer)
+            for subscribers in self.channels.values():
+                subscribers.discard(writer)
+            writer.close()
+
+    def _get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _execute(self, writer, command, args) -> bytes:
+        resp3 = writer in self._resp3
+        if command == "HELLO":
+            if args and args[0] == b"3":
+                self._resp3.add(writer)
+                resp3 = True
+            info = [b"server", b"fake-redis", b"version", b"7.0.0", b"proto", 3 if resp3 else 2]
+            if resp3:
+                return b"%%%d\r\n" % (len(info) // 2) + b"".join(_encode(item) for item in info)
+            return _array(info)
+        if command == "PING":
+            return b"+PONG\r\n"
+        if command in ("CLIENT", "SELECT"):
+            return b"+OK\r\n"
+        if command == "GET":
+            return _bulk(self._get(args[0]), resp3)
+        if command == "SET":
+            expires_at = None
+            options = [arg.upper() for arg in args[2:]]
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"EX") + 1])
+            self.data[args[0]] = (args[1], expires_at)
+            return b"+OK\r\n"
+        if command == "DEL":
+            return _integer(sum(self.data.pop(key, None) is not None for key in args))
+        if command == "PUBLISH":
+            subscribers = self.channels.get(args[0], set())
+            for subscriber in subscribers:
+                subscriber.write(_array([b"message", args[0], args[1]], push=subscriber in self._resp3))
+            return _integer(len(subscribers))
+        if command in ("SUBSCRIBE", "UNSUBSCRIBE"):
+            replies = []
+            for channel in args:
+                subscribers = self.channels.setdefault(channel, set())
+                if command == "SUBSCRIBE":
+                    subscribers.add(writer)
+                else:
+                    subscribers.discard(writer)
+                count = sum(writer in subscribers for subscribers in self.channels.values())
+                replies.append(_array([command.lower().encode(), channel, count], push=resp3))
+            return b"".join(replies)
+        return f"-ERR unknown command '{command}'\r\n".encode()
+
+
+def _bulk(value, resp3: bool = False) -> bytes:
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+def _encode(item) -> bytes:
+    return _integer(item) if isinstance(item, int) else _bulk(item)
+
+
+def _array(items, push: bool = False) -> bytes:
+    # Pub/sub messages are push frames (">") on RESP3 connections
+    return (b">" if push else b"*") + b"%d\r\n" % len(items) + b"".join(_encode(item) for item in items)
+
+
+@asynccontextmanager
+async def fake_redis_server():
+    server = FakeRedisServer()
+    await server.start()
+    try:
+        yield server
+    finally:
+        await server.stop()
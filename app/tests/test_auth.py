@@ -0,0 +1,21 @@
+from core.auth import get_vendor_id_for_user
+from db.models.users import UserRole
+from tests.conftest import create_catalog, create_users
+
+
+def test_vendor_accounts_act_for_the_vendor_with_their_email(database):
+    async def test(Session):
+        async with Session() as db:
+            [product] = await create_catalog(db)
+            vendor_user, customer = await create_users(db, 2)
+            vendor_user.role = UserRole.VENDOR
+            vendor_user.email = "vendor@example.com"
+            await db.commit()
+
+            assert await get_vendor_id_for_user(db, vendor_user) == product.vendor_id
+            assert await get_vendor_id_for_user(db, customer) is None
+
+            vendor_user.email = "someone@example.com"
+            assert await get_vendor_id_for_user(db, vendor_user) is None  # No vendor registered with it
+
+    database(test)
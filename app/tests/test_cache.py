@@ -0,0 +1,162 @@
+import asyncio
+import pickle
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from uuid import uuid4
+
+import pytest
+
+pytest.importorskip("redis")
+
+from core import cache
+from core.cache import (
+    MemoryCacheBackend, RedisCacheBackend, TTLCache, cache_type, decode_value, encode_value, get_cache,
+)
+from tests.fake_redis import fake_redis_server
+
+
+@cache_type
+class Colour(Enum):
+    RED = "Red"
+
+
+@cache_type
+@dataclass(frozen=True)
+class Snapshot:
+    item_id: object
+    price: Decimal
+    colour: Colour
+    seen_at: datetime
+
+
+@pytest.fixture
+def shared_cache(monkeypatch):
+    """Point core.cache at a fake Redis server for the duration of one coroutine."""
+    def run(test):
+        async def main():
+            async with fake_redis_server() as server:
+                monkeypatch.setattr(cache, "CACHE_URL", server.url)
+                monkeypatch.setattr(cache, "_redis", None)
+                monkeypatch.setattr(cache, "_listener_task", None)
+                try:
+                    await test(server)
+                finally:
+                    await cache.stop_cache_listener()
+        asyncio.run(main())
+    return run
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    local = TTLCache(maxsize=2, ttl=60)
+    local.set("a", 1)
+    local.set("b", 2)
+    local.get("a")  # "b" is now the least recently used
+    local.set("c", 3)
+    assert local.get("b") is None
+    assert local.get("a") == 1 and local.get("c") == 3
+    assert local.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    local = TTLCache(maxsize=10, ttl=60)
+    local.set("a", 1, ttl=-1)
+    assert local.get("a") is None
+    assert local.stats()["expirations"] == 1
+
+
+def test_get_cache_without_url_is_per_process(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_URL", None)
+    assert isinstance(get_cache("test-memory", maxsize=10, ttl=60), MemoryCacheBackend)
+
+
+def test_values_round_trip_as_json():
+    value = (uuid4().hex, Snapshot(uuid4(), Decimal("9.99"), Colour.RED, datetime.now(timezone.utc)))
+    raw = encode_value(value)
+    assert raw.startswith(b"[") or raw.startswith(b"{")
+    assert decode_value(raw) == value
+
+
+def test_unregistered_types_are_not_rebuilt():
+    with pytest.raises(ValueError):
+        decode_value(b'{"__type__": "Popen", "fields": {"args": "id"}}')
+    with pytest.raises(TypeError):
+        encode_value(object())
+
+
+def test_redis_backend_shares_values_between_workers(shared_cache):
+    async def test(server):
+        snapshot = Snapshot(uuid4(), Decimal("1.50"), Colour.RED, datetime.now(timezone.utc))
+        worker_a = RedisCacheBackend("shared", maxsize=10, ttl=60)
+        worker_b = RedisCacheBackend("shared", maxsize=10, ttl=60)
+
+        await worker_a.set(snapshot.item_id, snapshot)
+        assert await worker_b.get(snapshot.item_id) == snapshot  # Read from the server
+        assert worker_b.remote_hits == 1
+        assert await worker_b.get(snapshot.item_id) == snapshot  # Then from its local cache
+        assert worker_b.remote_hits == 1
+        assert b'"__type__":"Snapshot"' in server.data[f"shared:{snapshot.item_id}".encode()][0]
+
+    shared_cache(test)
+
+
+def test_redis_backend_ignores_values_it_did_not_write(shared_cache):
+    async def test(server):
+        worker = RedisCacheBackend("forged", maxsize=10, ttl=60)
+        server.data[b"forged:key"] = (pickle.dumps({"boom": 1}), None)
+        assert await worker.get("key") is None
+        assert worker.errors == 1
+
+    shared_cache(test)
+
+
+def test_redis_backend_falls_back_to_a_miss_when_the_server_is_down(shared_cache):
+    async def test(server):
+        worker = RedisCacheBackend("down", maxsize=10, ttl=60)
+        await server.stop()
+        assert await worker.get("missing") is None
+        assert worker.errors == 1
+
+    shared_cache(test)
+
+
+def test_delete_invalidates_other_workers_over_pub_sub(shared_cache):
+    async def test(server):
+        listening = get_cache("invalidate", maxsize=10, ttl=60)  # Registered: receives invalidations
+        writer = RedisCacheBackend("invalidate", maxsize=10, ttl=60)
+        await cache.start_cache_listener()
+        while not server.channels.get(cache.CACHE_CHANNEL.encode()):
+            await asyncio.sleep(0.01)
+
+        await listening.set("key", "old")
+        assert listening.local.get("key") == "old"
+        await writer.delete("key")
+        for _ in range(100):
+            if listening.local.get("key") is None:
+                break
+            await asyncio.sleep(0.01)
+        assert listening.local.get("key") is None
+        assert await listening.get("key") is None  # Gone from the server too
+
+    shared_cache(test)
+
+
+def test_subscribe_delivers_published_messages(shared_cache):
+    async def test(server):
+        received = []
+        cache.subscribe("test:channel", received.append)
+        try:
+            await cache.start_cache_listener()
+            while not server.channels.get(b"test:channel"):
+                await asyncio.sleep(0.01)
+            await cache.publish("test:channel", "hello")
+            for _ in range(100):
+                if received:
+                    break
+                await asyncio.sleep(0.01)
+            assert received == ["hello"]
+        finally:
+            cache._subscribers.pop("test:channel")
+
+    shared_cache(test)
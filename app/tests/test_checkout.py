@@ -0,0 +1,168 @@
+import asyncio
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy import func, select, text, update
+
+from core.auth import create_access_token
+from crud.cartandwishlist import add_item_to_cart_in_db, checkout_cart_in_db
+from crud.inventory import release_expired_reservations
+from crud.orders import confirm_order
+from db.database import get_db
+from db.models.inventory import ReservationStatus, StockReservation
+from db.models.orders import Order, OrderStatus
+from db.models.products import Product
+from tests.conftest import create_catalog, create_users
+
+# Concurrent checkouts in flight; stays below the server's default max_connections of 100
+CONNECTIONS = 40
+
+
+async def _checkout(Session, user_id: int):
+    async with Session() as db:
+        try:
+            return await checkout_cart_in_db(db, user_id, "1 Test Street")
+        except HTTPException as exc:
+            return exc.status_code
+
+
+def test_concurrent_checkouts_never_oversell_a_hot_product(database):
+    async def test(Session):
+        async with Session() as db:
+            users = await create_users(db, 500)
+            [product] = await create_catalog(db, products=1, stock=100)
+            for user in users:
+                await add_item_to_cart_in_db(db, user.user_id, product.product_id, 1, commit=False)
+            await db.commit()
+
+        slots = asyncio.Semaphore(CONNECTIONS)
+
+        async def buyer(user_id: int):
+            async with slots:
+                return await _checkout(Session, user_id)
+
+        results = await asyncio.gather(*(buyer(user.user_id) for user in users))
+
+        placed = [result for result in results if isinstance(result, dict)]
+        assert len(placed) == 100
+        assert results.count(409) == 400
+
+        async with Session() as db:
+            assert await db.scalar(select(Product.stock_quantity)) == 0
+            held = await db.scalar(
+                select(func.sum(StockReservation.quantity)).where(StockReservation.status == ReservationStatus.HELD)
+            )
+            assert held == 100
+            pending = await db.scalar(select(func.count()).select_from(Order).where(Order.status == OrderStatus.PENDING))
+            assert pending == 100
+
+    database(test)
+
+
+def test_checkout_reserves_the_lines_present_when_the_cart_is_placed(database):
+    async def test(Session):
+        async with Session() as db:
+            [user] = await create_users(db)
+            [product] = await create_catalog(db, products=1, stock=10)
+
+            await add_item_to_cart_in_db(db, user.user_id, product.product_id, 1)
+
+        async with Session() as db:
+            await add_item_to_cart_in_db(db, user.user_id, product.product_id, 2, commit=False)
+            # The add still holds the cart row; checkout waits for it and reserves all 3 units
+            checkout = asyncio.create_task(_checkout(Session, user.user_id))
+            await asyncio.sleep(0.2)
+            assert not checkout.done()
+            await db.commit()
+        order = await checkout
+        assert isinstance(order, dict)
+
+        async with Session() as db:
+            # A line added after checkout goes to a new cart, not to the placed order
+            await add_item_to_cart_in_db(db, user.user_id, product.product_id, 2)
+            reserved = await db.scalar(
+                select(func.sum(StockReservation.quantity)).where(StockReservation.order_id == order["order_id"])
+            )
+            assert reserved == 3
+            assert await db.scalar(select(Product.stock_quantity)) == 7
+
+    database(test)
+
+
+def test_expiry_sweep_cancels_only_unconfirmed_orders(database):
+    async def test(Session):
+        async with Session() as db:
+            users = await create_users(db, 2)
+            [product] = await create_catalog(db, products=1, stock=10)
+            for user in users:
+                await add_item_to_cart_in_db(db, user.user_id, product.product_id, 1, commit=False)
+            await db.commit()
+        confirmed, abandoned = [await _checkout(Session, user.user_id) for user in users]
+
+        async with Session() as db:
+            await confirm_order(db, confirmed["order_id"])
+            await db.execute(update(StockReservation).values(expires_at=text("now() - interval '1 minute'")))
+            await db.commit()
+            assert await release_expired_reservations(db) == 1
+
+        async with Session() as db:
+            statuses = dict((await db.execute(select(Order.order_id, Order.status))).all())
+            assert statuses[confirmed["order_id"]] == OrderStatus.CONFIRMED
+            assert statuses[abandoned["order_id"]] == OrderStatus.CANCELED
+            assert await db.scalar(select(Product.stock_quantity)) == 9
+
+            # An order whose hold already expired can no longer be confirmed
+            try:
+                await confirm_order(db, abandoned["order_id"])
+            except HTTPException as exc:
+                assert exc.status_code == 409
+            else:
+                raise AssertionError("confirmed an order whose reservation expired")
+
+    database(test)
+
+
+def test_checkout_confirm_and_delete_over_http(database):
+    import main
+
+    async def test(Session):
+        async with Session() as db:
+            [user] = await create_users(db)
+            [product] = await create_catalog(db, products=1, stock=5)
+
+        async def session():
+            async with Session() as db:
+                yield db
+
+        main.app.dependency_overrides[get_db] = session
+        token = await create_access_token({"sub": str(user.user_id)}, 5)
+        transport = httpx.ASGITransport(app=main.app)
+        try:
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test", headers={"Authorization": f"Bearer {token}"},
+            ) as client:
+                async def place(quantity: int) -> str:
+                    response = await client.post("/cart/items", params={"product_id": str(product.product_id), "quantity": quantity})
+                    assert response.status_code == 200
+                    response = await client.post("/cart/checkout", params={"shipping_address": "1 Test Street"})
+                    assert response.status_code == 200
+                    return response.json()["order_id"]
+
+                confirmed = await place(2)
+                response = await client.post(f"/orders/{confirmed}/confirm")
+                assert response.status_code == 200
+                assert response.json()["status"] == OrderStatus.CONFIRMED.value
+                assert (await client.post(f"/orders/{confirmed}/confirm")).status_code == 409
+
+                # Deleting a placed order returns its held stock
+                pending = await place(1)
+                assert (await client.delete(f"/orders/{pending}")).status_code == 200
+                assert (await client.get(f"/orders/{pending}")).status_code == 404
+        finally:
+            main.app.dependency_overrides.clear()
+
+        async with Session() as db:
+            assert await db.scalar(select(Product.stock_quantity)) == 3
+            assert await db.scalar(select(func.count()).select_from(StockReservation)) == 1
+
+    database(test)
@@ -0,0 +1,23 @@
+from types import SimpleNamespace
+
+from utlis import etag as etags
+
+
+def _request(if_none_match):
+    return SimpleNamespace(headers={"if-none-match": if_none_match})
+
+
+def test_weak_etags_match_with_weak_comparison():
+    etag = etags.make_etag("products", 7, weak=True)
+    assert etag.startswith('W/"')
+    assert etags.etag_matches(_request(etag), etag)
+    assert etags.etag_matches(_request(etag.removeprefix("W/")), etag)
+    assert not etags.etag_matches(_request(etags.make_etag("products", 8, weak=True)), etag)
+
+
+def test_time_epoch_expires_the_etag_when_the_window_ends(monkeypatch):
+    monkeypatch.setattr(etags.time, "time", lambda: 59.9)
+    before = etags.make_etag("products", 7, etags.time_epoch(30), weak=True)
+    monkeypatch.setattr(etags.time, "time", lambda: 60.0)
+    after = etags.make_etag("products", 7, etags.time_epoch(30), weak=True)
+    assert not etags.etag_matches(_request(before), after)
@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from crud.inventory import get_available_stock, rebalance_stripes, reserve_stock, set_stock_stripes
+from crud.orders import create_order
+from crud.products import get_product_by_id_from_db, product_cache, update_product_in_db
+from db.models.inventory import InventoryStripe
+from schemas.orders import OrderCreate
+from schemas.products import ProductUpdate
+from tests.conftest import create_catalog, create_users
+
+ADMIN = SimpleNamespace(role="admin", vendor_id=None)
+
+
+async def _striped_product(Session, stock: int, stripes: int):
+    async with Session() as db:
+        [product] = await create_catalog(db, products=1, stock=stock)
+    async with Session() as db:
+        await set_stock_stripes(db, product.product_id, stripes)
+    return product
+
+
+def test_striped_stock_is_reported_and_set_as_a_total(database):
+    async def test(Session):
+        product = await _striped_product(Session, stock=100, stripes=4)
+
+        async with Session() as db:
+            await product_cache.delete(product.product_id)
+            details = await get_product_by_id_from_db(db, product.product_id)
+            assert details["stock"] == 100
+
+            # A PUT of stock replaces the total, it does not add to the stripes
+            update = ProductUpdate(name="Product 0", description=None, price=10, stock=40)
+            updated = await update_product_in_db(db, product.product_id, update, ADMIN)
+            assert updated.stock == 40
+            assert await get_available_stock(db, product.product_id) == 40
+            assert not await rebalance_stripes(db, product.product_id)
+            quantities = (await db.execute(
+                select(InventoryStripe.quantity).where(InventoryStripe.product_id == product.product_id)
+            )).scalars().all()
+            assert sorted(quantities) == [10, 10, 10, 10]
+
+    database(test)
+
+
+def test_concurrent_reservations_on_stripes_never_oversell(database):
+    async def test(Session):
+        async with Session() as db:
+            users = await create_users(db, 30)
+        product = await _striped_product(Session, stock=20, stripes=4)
+
+        async def buyer(user):
+            async with Session() as db:
+                order = await create_order(db, OrderCreate(
+                    user_id=user.user_id, total_amount=10, shipping_address="1 Test Street",
+                    order_items=[{"product_id": product.product_id, "quantity": 1, "price": 10}],
+                ))
+                try:
+                    await reserve_stock(db, order.order_id, [(product.product_id, 1)])
+                    await db.commit()
+                    return True
+                except HTTPException:
+                    return False
+
+        results = await asyncio.gather(*(buyer(user) for user in users))
+        assert results.count(True) == 20
+
+        async with Session() as db:
+            assert await get_available_stock(db, product.product_id) == 0
+            assert await db.scalar(select(func.min(InventoryStripe.quantity))) == 0
+
+    database(test)
+
+
+def test_cached_product_reports_live_stock(database):
+    async def test(Session):
+        async with Session() as db:
+            [user] = await create_users(db)
+            [product] = await create_catalog(db, products=1, stock=10)
+            await product_cache.delete(product.product_id)
+            assert (await get_product_by_id_from_db(db, product.product_id))["stock"] == 10  # Caches the row
+
+            order = await create_order(db, OrderCreate(
+                user_id=user.user_id, total_amount=30, shipping_address="1 Test Street",
+                order_items=[{"product_id": product.product_id, "quantity": 3, "price": 10}],
+            ))
+            await reserve_stock(db, order.order_id, [(product.product_id, 3)])
+            await db.commit()
+
+            assert await product_cache.get(product.product_id) is not None
+            assert (await get_product_by_id_from_db(db, product.product_id))["stock"] == 7
+
+    database(test)
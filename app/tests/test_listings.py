@@ -0,0 +1,57 @@
+from sqlalchemy import func, insert, select
+
+from crud.listings import backfill_product_listings, get_storefront_page
+from crud.products import get_products_collection_version
+from crud.vendors import update_vendor_in_db
+from db.models import Category, product_category_association
+from db.models.listings import ListingScope, ProductListing
+from db.soft_delete import soft_delete
+from schemas.vendors import VendorUpdate
+from tests.conftest import create_catalog
+
+
+def test_backfill_lists_existing_products_once(database):
+    async def test(Session):
+        async with Session() as db:
+            products = await create_catalog(db, products=3)
+            extra = Category(name="Extra")
+            db.add(extra)
+            await db.flush()
+            await db.execute(insert(product_category_association).values(
+                product_id=products[0].product_id, category_id=extra.category_id,
+            ))
+            soft_delete(products[2])
+            await db.commit()
+
+        async with Session() as db:
+            # Two live products on the vendor and primary category pages, one also on the extra category
+            assert await backfill_product_listings(db) == 5
+            assert await backfill_product_listings(db) == 0
+            assert await db.scalar(select(func.count()).select_from(ProductListing)) == 5
+            # Category listings carry the product's vendor, not the category, in vendor_id
+            vendor_ids = (await db.execute(select(ProductListing.vendor_id).distinct())).scalars().all()
+            assert vendor_ids == [products[0].vendor_id]
+
+            page = await get_storefront_page(db, ListingScope.CATEGORY, extra.category_id)
+            assert [listing.product_id for listing in page["items"]] == [products[0].product_id]
+
+    database(test)
+
+
+def test_vendor_rename_updates_category_pages_and_their_version(database):
+    async def test(Session):
+        async with Session() as db:
+            [product] = await create_catalog(db, products=1)
+            await backfill_product_listings(db)
+            version = await get_products_collection_version(db)
+
+            await update_vendor_in_db(db, product.vendor_id, VendorUpdate.model_construct(name="Renamed"))
+
+            # Category page ETags are built from the products version, so they change with the name
+            assert await get_products_collection_version(db) > version
+
+        async with Session() as db:
+            page = await get_storefront_page(db, ListingScope.CATEGORY, product.category_id)
+            assert [listing.vendor_name for listing in page["items"]] == ["Renamed"]
+
+    database(test)
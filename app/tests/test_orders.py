@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from crud.orders import create_orders_batch, get_all_orders
+from schemas.orders import OrderCreate, OrderItemCreate
+from tests.conftest import create_catalog, create_users
+
+
+class StatementCounter:
+    """Count the statements an engine sends, including each batch of an executemany."""
+
+    def __init__(self, engine):
+        self.engine = engine.sync_engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+
+
+def _orders(users, products, count: int):
+    return [
+        OrderCreate(
+            user_id=users[i % len(users)].user_id,
+            total_amount=Decimal("30.00"),
+            shipping_address="1 Test Street",
+            order_items=[
+                OrderItemCreate(product_id=product.product_id, quantity=1, price=Decimal("10.00"))
+                for product in products
+            ],
+        )
+        for i in range(count)
+    ]
+
+
+def test_batch_insert_and_listing_use_a_fixed_number_of_statements(database):
+    async def test(Session):
+        async with Session() as db:
+            users = await create_users(db, 10)
+            products = await create_catalog(db, products=3)
+
+        async with Session() as db:
+            with StatementCounter(db.bind) as inserts:
+                await create_orders_batch(db, _orders(users, products, 1000))
+            # 1,000 orders and 3,000 items: a handful of multi-row INSERT batches, not 4,000 statements
+            assert inserts.count <= 10
+
+        async with Session() as db:
+            with StatementCounter(db.bind) as reads:
+                orders = await get_all_orders(db)
+                assert len(orders) == 1000
+                assert sum(len(order.order_items) for order in orders) == 3000  # No lazy loads
+            # One SELECT for the orders, plus one selectinload SELECT per 500 orders
+            assert reads.count == 3
+
+    database(test)
+
+
+def test_duplicate_product_lines_are_merged(database):
+    async def test(Session):
+        async with Session() as db:
+            users = await create_users(db)
+            products = await create_catalog(db, products=1)
+
+        order = _orders(users, products, 1)[0]
+        order.order_items.append(order.order_items[0].copy(update={"quantity": 2}))
+        async with Session() as db:
+            await create_orders_batch(db, [order])
+            (created,) = await get_all_orders(db)
+            assert [(item.product_id, item.quantity) for item in created.order_items] == [(products[0].product_id, 3)]
+
+    database(test)
+
+
+def test_duplicate_product_lines_with_different_prices_are_rejected(database):
+    async def test(Session):
+        async with Session() as db:
+            users = await create_users(db)
+            products = await create_catalog(db, products=1)
+
+        order = _orders(users, products, 1)[0]
+        order.order_items.append(order.order_items[0].copy(update={"price": Decimal("11.00")}))
+        async with Session() as db:
+            with pytest.raises(HTTPException) as error:
+                await create_orders_batch(db, [order])
+            assert error.value.status_code == 400
+            assert "different prices" in error.value.detail
+
+    database(test)
@@ -0,0 +1,88 @@
+import socket
+
+import pytest
+from sqlalchemy import func, select, text
+
+from core import mailer
+from crud import outbox
+from crud.outbox import dispatch_outbox, enqueue_email, purge_settled_emails
+from db.models.outbox import EmailOutbox, EmailStatus
+from utlis import utils
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class Inbox:
+    """aiosmtpd handler that keeps every message, or refuses mail to the addresses in `refuse`."""
+
+    def __init__(self):
+        self.messages = []
+        self.refuse = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return "550 Mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, envelope.content.decode()))
+        return "250 Message accepted for delivery"
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    """A local aiosmtpd server (no TLS, no login), with a fresh connection pool pointed at it."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    inbox = Inbox()
+    controller = aiosmtpd_controller.Controller(inbox, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setattr(mailer, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(mailer, "SMTP_PORT", port)
+    monkeypatch.setattr(mailer, "SMTP_START_TLS", False)
+    monkeypatch.setattr(mailer, "SMTP_EMAIL", None)
+    monkeypatch.setattr(mailer, "EMAIL_APP_PASS", None)
+    monkeypatch.setattr(utils, "SMTP_EMAIL", "shop@example.com")
+    monkeypatch.setattr(outbox, "smtp_pool", mailer.SMTPPool(2))
+    try:
+        yield inbox
+    finally:
+        controller.stop()
+
+
+def test_outbox_delivers_retries_and_purges(database, smtp_server):
+    async def test(Session):
+        async with Session() as db:
+            for i in range(5):
+                enqueue_email(db, "Welcome", f"user{i}@example.com", username=f"user{i}")
+            enqueue_email(db, "Welcome", "gone@example.com", username="gone")
+            await db.commit()
+
+            smtp_server.refuse.add("gone@example.com")
+            assert await dispatch_outbox(db) == 6
+            await outbox.smtp_pool.close()
+
+            assert sorted(rcpt for (rcpt,), _ in smtp_server.messages) == [f"user{i}@example.com" for i in range(5)]
+            assert all("user" in body for _, body in smtp_server.messages)
+            statuses = dict((await db.execute(select(EmailOutbox.recipient, EmailOutbox.status))).all())
+            assert statuses.pop("gone@example.com") == EmailStatus.PENDING  # Refused; retried later
+            assert set(statuses.values()) == {EmailStatus.SENT}
+            contexts = (await db.execute(
+                select(EmailOutbox.context).where(EmailOutbox.status == EmailStatus.SENT)
+            )).scalars().all()
+            assert contexts == [{}] * 5  # Template values are dropped once sent
+            # Not due again before its backoff
+            assert await dispatch_outbox(db) == 0
+
+            # Settled emails are purged once they are older than the retention period
+            assert await purge_settled_emails(db) == 0
+            await db.execute(text("UPDATE email_outbox SET updated_at = now() - interval '1 year'"))
+            await db.commit()
+            assert await purge_settled_emails(db, batch_size=3) == 3
+            assert await purge_settled_emails(db) == 2
+            remaining = await db.scalar(select(func.count()).select_from(EmailOutbox))
+            assert remaining == 1  # The pending retry is kept
+
+    database(test)
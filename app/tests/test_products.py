@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+from sqlalchemy import insert
+
+from crud.products import get_product_facets
+from db.models import Category, Product, product_category_association
+from db.soft_delete import soft_delete
+from schemas.products import ProductFilters
+from tests.conftest import create_catalog
+
+
+def test_category_facet_counts_additional_categories(database):
+    async def test(Session):
+        async with Session() as db:
+            products = await create_catalog(db, products=3, price=Decimal("30.00"))
+            primary = products[0].category_id
+            extra = Category(name="Extra")
+            db.add(extra)
+            await db.flush()
+            await db.execute(insert(product_category_association), [
+                {"product_id": products[0].product_id, "category_id": extra.category_id},
+                {"product_id": products[1].product_id, "category_id": primary},  # Repeats the primary category
+            ])
+            await db.commit()
+
+        async with Session() as db:
+            facets = await get_product_facets(db)
+            assert facets["categories"] == [{"id": primary, "count": 3}, {"id": extra.category_id, "count": 1}]
+            assert facets["vendors"] == [{"id": products[0].vendor_id, "count": 3}]
+            assert [bucket["count"] for bucket in facets["price"]] == [3]
+
+            # Filtering on the additional category still shows it in the category facet
+            facets = await get_product_facets(db, ProductFilters(category_id=extra.category_id))
+            assert sorted(facet["count"] for facet in facets["categories"]) == [1, 1]
+            assert {facet["id"] for facet in facets["categories"]} == {primary, extra.category_id}
+
+        async with Session() as db:
+            soft_delete(await db.get(Product, products[0].product_id))
+            await db.commit()
+            facets = await get_product_facets(db)
+            assert facets["categories"] == [{"id": primary, "count": 2}]
+
+    database(test)
@@ -0,0 +1,50 @@
+from uuid import uuid4
+
+from core.search import SuggestIndex, _prefix_distance
+
+
+def _index(*names):
+    index = SuggestIndex()
+    ids = {}
+    for name in names:
+        ids[name] = uuid4()
+        index.add(ids[name], name)
+    return index, ids
+
+
+def _names(index, prefix, limit=10, max_edits=2):
+    return [name for _, name, _ in index.suggest(prefix, limit, max_edits)]
+
+
+def test_prefix_distance_matches_any_prefix_of_the_text():
+    assert _prefix_distance("charger", "chargers", 2) == 0
+    assert _prefix_distance("chrager", "chargers", 2) == 2
+    assert _prefix_distance("chxxxxr", "chargers", 2) == 3
+    assert _prefix_distance("cable", "cabel", 1) == 1
+
+
+def test_suggest_ranks_fewest_edits_then_first_word_then_shorter_names():
+    index, _ = _index("Phone Charger", "Charger Cable", "Charger", "Chair", "Charcoal Grill")
+    assert _names(index, "charger") == ["Charger", "Charger Cable", "Phone Charger"]
+    assert _names(index, "chargre") == ["Charger", "Charger Cable", "Phone Charger"]
+    assert _names(index, "char", limit=2) == ["Charger", "Charger Cable"]
+
+
+def test_suggest_needs_the_first_two_characters_right():
+    index, _ = _index("Charger", "Shirt")
+    assert _names(index, "cahrger") == []
+    assert _names(index, "xq") == []
+    assert _names(index, "c") == []
+
+
+def test_suggest_only_verifies_up_to_max_candidates():
+    index, _ = _index(*[f"Chair {i}" for i in range(50)])
+    assert len(index.suggest("chair", 100, 2, max_candidates=20)) == 20
+    assert len(index.suggest("chair", 100, 2)) == 50
+
+
+def test_removed_entries_are_not_suggested():
+    index, ids = _index("Charger", "Charger Cable")
+    index.remove(ids["Charger"], "Charger")
+    assert _names(index, "charger") == ["Charger Cable"]
+    assert len(index) == 1
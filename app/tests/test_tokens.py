@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from crud.users import consume_password_reset_token, create_password_reset_token, rotate_refresh_token, save_refresh_token
+from tests.conftest import create_users
+
+
+def test_rotation_rejects_reuse_and_revokes_the_family(database):
+    async def test(Session):
+        async with Session() as db:
+            [user] = await create_users(db, 1)
+            user_id = user.user_id
+            await save_refresh_token(db, "token-1", user_id, 60, "jti-1")
+            await rotate_refresh_token(db, "token-1", user_id, "token-2", "jti-2", 60)
+
+            # Reusing the rotated token revokes the family, including the token that replaced it
+            with pytest.raises(HTTPException, match="reuse"):
+                await rotate_refresh_token(db, "token-1", user_id, "token-3", "jti-3", 60)
+            with pytest.raises(HTTPException, match="reuse"):
+                await rotate_refresh_token(db, "token-2", user_id, "token-3", "jti-3", 60)
+
+    database(test)
+
+
+def test_password_reset_token_is_consumed_once(database):
+    async def test(Session):
+        async with Session() as db:
+            [user] = await create_users(db, 1)
+            user_id = user.user_id
+            token = await create_password_reset_token(db, user_id)
+            await db.commit()
+
+        async def reset():
+            async with Session() as db:
+                db_user = await consume_password_reset_token(db, token)
+                await asyncio.sleep(0.1)  # Both requests are in flight (e.g. hashing the new password)
+                await db.commit()
+                return db_user is not None and db_user.user_id == user_id
+
+        assert sorted(await asyncio.gather(reset(), reset())) == [False, True]
+
+    database(test)
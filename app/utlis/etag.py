@@ -0,0 +1,73 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Optional
+from fastapi import Request, Response, status
+
+
+## function to build an ETag from the values that identify a representation
+def make_etag(*parts, weak: bool = False) -> str:
+    """
+    Build an ETag.
+
+    - **parts**: Values that change whenever the response body would change
+      (e.g. the resource ID and its `updated_at`, or a collection version and the query string).
+    - **weak**: Mark the ETag weak (`W/`), for bodies that may differ in details the parts do
+      not track (e.g. stock levels, which only change the ETag through `time_epoch`).
+    - Returns a quoted hex digest, e.g. `"3f2a..."` or `W/"3f2a..."`.
+    """
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode(), digest_size=16).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def time_epoch(seconds: float) -> int:
+    """Number of the current `seconds`-long time window; as an ETag part, it expires the ETag when the window ends."""
+    return int(time.time() // seconds)
+
+
+## function to check a request's If-None-Match header against the current ETag
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check whether the client already holds the current representation.
+
+    - **request**: The incoming request, used to read the `If-None-Match` header.
+    - **etag**: The current ETag of the resource.
+    - Accepts `*`, comma-separated lists and weak (`W/`) validators, as GET requires.
+    - Returns True if the client should get a 304.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    etag = etag.removeprefix("W/")
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def http_date(value: datetime) -> str:
+    """Format a timestamp for the Last-Modified header."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+## function to attach the validators to a full response
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime] = None, max_age: Optional[int] = None):
+    """
+    Set `ETag` (and `Last-Modified`, when known) so clients can revalidate later.
+
+    With `max_age`, also send `Cache-Control: max-age`, so clients revalidate at least that often.
+    """
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    if max_age is not None:
+        response.headers["Cache-Control"] = f"max-age={max_age}"
+
+
+## function to answer a conditional GET whose representation has not changed
+def not_modified(etag: str, last_modified: Optional[datetime] = None, max_age: Optional[int] = None) -> Response:
+    """Return an empty 304 response carrying the validators, without serializing anything."""
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified, max_age)
+    return response
@@ -0,0 +1,43 @@
+import base64
+import json
+import os
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+
+
+# Page size used when the client does not ask for one, and the hard upper bound
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 200))
+
+
+## function to build an opaque cursor from the sort key of the last row on a page
+def encode_cursor(*values) -> str:
+    """
+    Encode the sort key of a row into an opaque, URL-safe cursor string.
+
+    - **values**: The sort key columns of the last row returned (e.g. `created_at`, `product_id`).
+    - Returns a base64 string that clients pass back unchanged to fetch the next page.
+    """
+    raw = json.dumps(jsonable_encoder(values), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+## function to turn a cursor back into typed sort key values
+def decode_cursor(cursor: str, *parsers) -> tuple:
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    - **cursor**: The opaque cursor string sent by the client.
+    - **parsers**: One callable per sort key column used to rebuild the typed value
+      (e.g. `datetime.fromisoformat`, `UUID`).
+    - Raises a 400 HTTPException if the cursor is malformed.
+    - Returns a tuple with the decoded sort key.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError("Cursor does not match the sort key")
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
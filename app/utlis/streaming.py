@@ -0,0 +1,49 @@
+import json
+import os
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from db.database import read_session_factory
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Number of rows fetched per round-trip from the server-side cursor while streaming
+STREAM_YIELD_PER = int(os.getenv("STREAM_YIELD_PER", 500))
+
+
+## function to decide whether a listing should be streamed instead of returned as one JSON array
+def wants_ndjson(request: Request, stream: bool = False) -> bool:
+    """
+    Check whether the client asked for the streaming export mode.
+
+    - **request**: The incoming request, used to read the `Accept` header.
+    - **stream**: Value of the `?stream=1` query parameter.
+    - Returns True if the client sent `Accept: application/x-ndjson` or `?stream=1`.
+    """
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+## function to stream rows as newline-delimited JSON
+def ndjson_response(request: Request, stream_rows, schema) -> StreamingResponse:
+    """
+    Build a chunked NDJSON response that writes each row as soon as it is read.
+
+    - **request**: The incoming request, used to honour read-your-writes stickiness
+      the same way `get_read_db` does.
+    - **stream_rows**: A CRUD async generator taking a session and yielding ORM rows
+      (e.g. `stream_products_from_db`).
+    - **schema**: The Pydantic response schema used to serialize each row.
+    - The request-scoped session from `get_db` is closed before the body is sent,
+      so the stream opens and owns its own read session for as long as it runs: on a replica
+      when configured, or on the primary if the client wrote within `DB_REPLICA_STICKY_SECONDS`.
+    - Returns a StreamingResponse with the `application/x-ndjson` media type.
+    """
+    session_factory = read_session_factory(request)  # Picked now, while the request is at hand
+
+    async def body():
+        async with session_factory() as session:
+            async for row in stream_rows(session):
+                yield json.dumps(jsonable_encoder(schema.from_orm(row))) + "\n"
+
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
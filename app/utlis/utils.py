@@ -1,27 +1,17 @@
 import secrets
 import string
-from aiosmtplib import send # type: ignore
 from email.message import EmailMessage
-import os
+from typing import Iterable
+from core.mailer import SMTP_EMAIL, smtp_pool
+from core.email_templates import EmailTemplateEngine
 
 
-SMTP_EMAIL = os.getenv("SMTP_EMAIL")
-EMAIL_APP_PASS = os.getenv("EMAIL_PASS")
-
 ## function to generate password reset token 
 def generate_reset_token(length=32): 
     chars = string.ascii_letters + string.digits
     return ''.join(secrets.choice(chars) for _ in range(length))
 
 
-
-
-# Function to render the template
-# def render_template(template_name: str, context: dict) -> str:
-#     # Load the template and render it with the given context
-#     template = templates.get_template(template_name)
-#     return template.render(context)
-
 EMAIL_SUBJECTS = {
     "Welcome": "Welcome to the Todo App!",
     "Password_reset": "Reset Your Password",
@@ -34,16 +24,28 @@ EMAIL_TEMPLATES = {
     "Password_Changed" : "password_changed_email.html"
 }
 
-# Function to send email
-async def send_email(email_type, username, email: str, link:str = "http://localhost:8000/"):
+# Compiled once (at startup, see main.py) and reused for every email
+email_templates = EmailTemplateEngine(EMAIL_TEMPLATES)
+
+
+# Function to render the template
+def render_template(email_type: str, context: dict) -> str:
+    return email_templates.render(email_type, context)
+
+
+# Function to build an email message
+def build_email_message(email_type, username, email: str, link:str = "http://localhost:8000/") -> EmailMessage:
     context = {
         "username": username,
         "link": link
     }
 
     # Render the HTML content using the Jinja2 template
-    # html_content = render_template(EMAIL_TEMPLATES[email_type], context)
+    html_content = render_template(email_type, context)
+    return _email_message(email_type, email, html_content)
+
 
+def _email_message(email_type, email: str, html_content: str) -> EmailMessage:
     # Construct the email message
     message = EmailMessage()
     message["From"] = SMTP_EMAIL  # Sender email
@@ -51,8 +53,23 @@ async def send_email(email_type, username, email: str, link:str = "http://localh
     message["Subject"] = EMAIL_SUBJECTS[email_type]
 
     # Set the email content as HTML
-    message.set_content("test", subtype='html')
+    message.set_content(html_content, subtype='html')
+    return message
 
-    # Send the email asynchronously using aiosmtplib
-    await send(message, hostname="smtp.gmail.com", port=587, start_tls=True,
-               username=SMTP_EMAIL, password=EMAIL_APP_PASS)
+
+# Function to build the same email for many recipients (e.g. a vendor newsletter)
+async def build_email_messages(email_type, recipients: Iterable[dict]) -> list[EmailMessage]:
+    """
+    - **recipients**: One dict per recipient with `email` and the template context (`username`, `link`).
+    - Large batches are rendered in the template engine's worker processes.
+    """
+    recipients = list(recipients)
+    contexts = [{key: value for key, value in recipient.items() if key != "email"} for recipient in recipients]
+    bodies = await email_templates.render_many(email_type, contexts)
+    return [_email_message(email_type, recipient["email"], body) for recipient, body in zip(recipients, bodies)]
+
+
+# Function to send email right away, over a pooled SMTP connection.
+# Request handlers should enqueue with crud.outbox.enqueue_email instead, so they never wait on SMTP.
+async def send_email(email_type, username, email: str, link:str = "http://localhost:8000/"):
+    await smtp_pool.send(build_email_message(email_type, username, email, link))